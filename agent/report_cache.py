@@ -0,0 +1,99 @@
+"""LRU cache of generated reports keyed on the normalised evidence.
+
+The VLM only sees the anatomy, the summarised expert statistics and the
+constraints, so two studies with the same evidence get the same report.
+Floats in the evidence are rounded to :data:`~agent.settings.REPORT_CACHE_PRECISION`
+decimals before hashing so that near-identical studies (most normal studies
+have no lesions at all) share one entry.  The model version is part of the key
+so a new checkpoint never serves stale text.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+from .settings import REPORT_CACHE_PRECISION, REPORT_CACHE_SIZE
+
+Report = Tuple[str, float]
+
+
+def normalize_evidence(value: Any, precision: int = REPORT_CACHE_PRECISION) -> Any:
+    """Round floats in ``value`` (recursively) to ``precision`` decimals."""
+    if isinstance(value, float):
+        # avoid distinct keys for 0.0 and -0.0
+        return round(value, precision) + 0.0
+    if isinstance(value, dict):
+        return {str(k): normalize_evidence(v, precision) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_evidence(v, precision) for v in value]
+    return value
+
+
+def report_key(
+    anatomy: str,
+    stats: Dict[str, Any],
+    constraints: Dict[str, Any],
+    model_version: str,
+    precision: int = REPORT_CACHE_PRECISION,
+) -> str:
+    """Return the cache key of a report request."""
+    payload = {
+        "anatomy": anatomy,
+        "evidence": normalize_evidence(stats, precision),
+        "constraints": normalize_evidence(constraints, precision),
+        "model": model_version,
+    }
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class ReportCache:
+    """Thread-safe LRU mapping of report keys to ``(text, prob)``.
+
+    ``max_entries=0`` disables the cache."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Report]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Report]:
+        with self._lock:
+            report = self._entries.get(key)
+            if report is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return report
+
+    def put(self, key: str, report: Report) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = report
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+report_cache = ReportCache(REPORT_CACHE_SIZE)
@@ -1,14 +1,29 @@
-from fastapi import FastAPI
+import logging
+import math
+
+import requests
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+from common.admission import CapacityLimiter, admission
+from common.client import CircuitOpenError
+from common.tracing import instrument, record_spans, span
 
-from .tools_registry import EXPERTS, run_tool
-from .vila_loader import load_vila, run_vlm
-from .settings import ABNORMAL_THRESHOLD_CC
+from .tools_registry import EXPERTS, client, run_tools
+from .report_cache import report_cache, report_key
+from .vila_loader import FAILED_TEXT, load_vila, run_vlm
+from .settings import ABNORMAL_THRESHOLD_CC, AGENT_MAX_IN_FLIGHT, VLM_VERSION
 
 app = FastAPI()
+admission(app, CapacityLimiter(AGENT_MAX_IN_FLIGHT, "agent"), ("/analyze",))
+instrument(app)
+logger = logging.getLogger(__name__)
 vlm = load_vila()
 
+# Lesions listed individually in the VLM prompt
+MAX_PROMPT_LESIONS = 3
+
 
 class AnalyzeReq(BaseModel):
     study_dir: str
@@ -16,23 +31,40 @@ class AnalyzeReq(BaseModel):
     tools: List[str] = ["brats"]
     constraints: Dict[str, Any] = {}
     abnormal_threshold_cc: Optional[float] = None
+    job_id: Optional[str] = None
 
 
 @app.post("/analyze")
 def analyze(req: AnalyzeReq):
-    evidence: Dict[str, Dict[str, Any]] = {}
+    tools = [t for t in req.tools if t in EXPERTS]
+    with record_spans() as timings:
+        try:
+            with span("tools"):
+                evidence, latencies = run_tools(tools, {"study_dir": req.study_dir, "job_id": req.job_id})
+        except CircuitOpenError as e:
+            retry_after = str(max(1, math.ceil(client.breaker.remaining())))
+            raise HTTPException(503, str(e), headers={"Retry-After": retry_after}) from e
+        except requests.RequestException as e:
+            if e.response is not None and e.response.status_code == 429:
+                # pass the experts' backpressure on to the caller
+                retry_after = e.response.headers.get("Retry-After", "1")
+                raise HTTPException(429, "experts are at capacity", headers={"Retry-After": retry_after}) from e
+            logger.exception("expert request failed")
+            raise HTTPException(502, "expert request failed") from e
+        stats = _summarize_stats(evidence)
+        with span("vlm"):
+            text, prob, cached = generate_report(vlm, req.anatomy, stats, req.constraints)
+    for tool in tools:
+        for stage, seconds in (evidence[tool].get("timings") or {}).items():
+            timings[f"{tool}.{stage}"] = seconds
     seg_path: Optional[str] = None
-    for tool in req.tools:
-        if tool in EXPERTS:
-            out = run_tool(tool, {"study_dir": req.study_dir})
-            evidence[tool] = out
-            if "seg" in out:
-                seg_path = out["seg"]
+    seg_artifact: Optional[Dict[str, Any]] = None
+    for tool in tools:
+        if evidence[tool].get("seg"):
+            seg_path = evidence[tool]["seg"]
+        if evidence[tool].get("seg_artifact"):
+            seg_artifact = evidence[tool]["seg_artifact"]
 
-    stats = _summarize_stats(evidence)
-    prompt = render_prompt(req.anatomy, stats, req.constraints)
-
-    text, prob = run_vlm(vlm, prompt)
     threshold = (
         req.abnormal_threshold_cc
         if req.abnormal_threshold_cc is not None
@@ -48,15 +80,44 @@ def analyze(req: AnalyzeReq):
         "structured": {
             "lesion_volume_cc": stats.get("lesion_volume_cc", 0.0),
             "num_lesions": stats.get("num_lesions", 0),
+            "class_volumes_cc": stats.get("class_volumes_cc", {}),
+            "lesions": (evidence.get("brats", {}).get("lesion_stats") or {}).get("lesions", []),
         },
         "provenance": {
-            "vlm": {"name": "VILA-M3", "ckpt": "<fill>"},
-            "tools": [{"name": k, "version": "<fill>"} for k in req.tools],
+            "vlm": {"name": "VILA-M3", "ckpt": "<fill>", "version": VLM_VERSION, "cached": cached},
+            "tools": [
+                {"name": k, "version": "<fill>", "latency_s": latencies.get(k)} for k in req.tools
+            ],
         },
-        "aux": {"seg_nifti": seg_path},
+        "aux": {"seg_nifti": seg_path, "seg_artifact": seg_artifact},
+        "timings": timings,
     }
 
 
+@app.get("/cache")
+def cache_stats():
+    return {"reports": report_cache.stats()}
+
+
+def generate_report(
+    model: Any, anatomy: str, stats: Dict[str, Any], constraints: Dict[str, Any]
+) -> Tuple[str, float, bool]:
+    """Return ``(text, prob, cached)`` for the evidence of one study.
+
+    A report for evidence seen before comes from the report cache; otherwise
+    it is generated with :func:`run_vlm`.  Prompts are not batched: the
+    VILA-M3 generator has no batch API."""
+    version = VLM_VERSION if model is not None else "stub"
+    key = report_key(anatomy, stats, constraints, version)
+    report = report_cache.get(key)
+    if report is not None:
+        return (*report, True)
+    text, prob = run_vlm(model, render_prompt(anatomy, stats, constraints))
+    if text != FAILED_TEXT:
+        report_cache.put(key, (text, prob))
+    return text, prob, False
+
+
 def render_prompt(anatomy: str, stats: Dict[str, Any], constraints: Dict[str, Any]) -> str:
     return (
         f"You are a radiology assistant for {anatomy} MRI.\n"
@@ -70,6 +131,15 @@ def _summarize_stats(ev: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
     if "brats" in ev:
         s["lesion_volume_cc"] = ev["brats"].get("lesion_volume_cc", 0.0)
         s["num_lesions"] = ev["brats"].get("num_lesions", 0)
+        table = ev["brats"].get("lesion_stats")
+        if table:
+            # the expert already computed the per-lesion table; only pick
+            # the parts that are useful in the prompt
+            s["class_volumes_cc"] = {k: round(v, 2) for k, v in table["class_volumes_cc"].items()}
+            s["largest_lesions"] = [
+                {"volume_cc": round(row["volume_cc"], 2), "centroid": [round(c) for c in row["centroid"]]}
+                for row in table["lesions"][:MAX_PROMPT_LESIONS]
+            ]
     return s
 
 
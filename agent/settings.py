@@ -1,3 +1,26 @@
 import os
 
 ABNORMAL_THRESHOLD_CC = float(os.getenv("ABNORMAL_THRESHOLD_CC", "0.5"))
+
+# Connections kept open to the experts service and concurrent tool calls
+TOOL_POOL_SIZE = int(os.getenv("TOOL_POOL_SIZE", "8"))
+
+# Retries for expert calls failing with a connection error or 429/503
+TOOL_RETRIES = int(os.getenv("TOOL_RETRIES", "2"))
+
+# Consecutive failed expert calls after which the experts are not called for
+# TOOL_BREAKER_RESET_S seconds
+TOOL_BREAKER_FAILURES = int(os.getenv("TOOL_BREAKER_FAILURES", "5"))
+TOOL_BREAKER_RESET_S = float(os.getenv("TOOL_BREAKER_RESET_S", "30"))
+
+# Analyses handled at once; further requests are rejected with 429
+AGENT_MAX_IN_FLIGHT = int(os.getenv("AGENT_MAX_IN_FLIGHT", "4"))
+
+# Generated reports kept in the evidence-keyed LRU cache (0 disables it)
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "256"))
+
+# Decimals evidence values are rounded to before they are used as a cache key
+REPORT_CACHE_PRECISION = int(os.getenv("REPORT_CACHE_PRECISION", "1"))
+
+# Identifies the VLM weights in cache keys; change it when the checkpoint changes
+VLM_VERSION = os.getenv("VLM_VERSION", "vila-m3")
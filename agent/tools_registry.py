@@ -1,14 +1,68 @@
 import os
-import requests
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Dict, List, Tuple
+
+from common.client import ResilientClient
+from common.tracing import metrics, propagation_headers, submit_with_context
+
+from .settings import TOOL_BREAKER_FAILURES, TOOL_BREAKER_RESET_S, TOOL_POOL_SIZE, TOOL_RETRIES
 
 EXPERTS = {
-    "brats": {"endpoint": os.getenv("EXPERTS_URL", "http://experts:8002") + "/infer/brats"},
-    "wmh": {"endpoint": os.getenv("EXPERTS_URL", "http://experts:8002") + "/infer/wmh"},
+    "brats": {
+        "endpoint": os.getenv("EXPERTS_URL", "http://experts:8002") + "/infer/brats",
+        "timeout": float(os.getenv("BRATS_TIMEOUT_S", "600")),
+    },
+    "wmh": {
+        "endpoint": os.getenv("EXPERTS_URL", "http://experts:8002") + "/infer/wmh",
+        "timeout": float(os.getenv("WMH_TIMEOUT_S", "600")),
+    },
 }
 
+# Pooled, bounded calls to the experts; busy or failing experts are retried
+# with backoff and short-circuited after repeated failures
+client = ResilientClient(
+    "experts",
+    max_concurrency=TOOL_POOL_SIZE,
+    retries=TOOL_RETRIES,
+    breaker_failures=TOOL_BREAKER_FAILURES,
+    breaker_reset_s=TOOL_BREAKER_RESET_S,
+)
+_pool = ThreadPoolExecutor(max_workers=TOOL_POOL_SIZE, thread_name_prefix="tool")
+_in_flight = metrics.gauge("tool_calls_in_flight", "Expert calls being made", ("tool",))
+
 
 def run_tool(name: str, payload: dict) -> dict:
-    url = EXPERTS[name]["endpoint"]
-    r = requests.post(url, json=payload, timeout=600)
+    expert = EXPERTS[name]
+    r = client.post(expert["endpoint"], json=payload, timeout=expert["timeout"], headers=propagation_headers())
     r.raise_for_status()
     return r.json()
+
+
+def _timed(name: str, payload: dict) -> Tuple[dict, float]:
+    start = time.perf_counter()
+    _in_flight.inc(tool=name)
+    try:
+        out = run_tool(name, payload)
+    finally:
+        _in_flight.dec(tool=name)
+    return out, time.perf_counter() - start
+
+
+def run_tools(names: List[str], payload: dict) -> Tuple[Dict[str, dict], Dict[str, float]]:
+    """Call the experts ``names`` concurrently with the same ``payload``.
+
+    Returns the outputs and latencies (in seconds) keyed by tool name.  If a
+    call fails, tools that have not started yet are cancelled and the error
+    is raised."""
+    futures = {submit_with_context(_pool, _timed, name, payload): name for name in names}
+    done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+    for f in done:
+        if f.exception() is not None:
+            for p in pending:
+                p.cancel()
+            raise f.exception()
+    outputs, latencies = {}, {}
+    for f, name in futures.items():
+        outputs[name], latencies[name] = f.result()
+    return outputs, latencies
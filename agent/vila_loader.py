@@ -13,6 +13,9 @@ from __future__ import annotations
 import importlib
 from typing import Any, Tuple
 
+# Text returned when generation raised; never cached
+FAILED_TEXT = "- Model execution failed"
+
 
 def load_vila() -> Any:
     """Attempt to load the VILA-M3 model from the MONAI framework.
@@ -53,4 +56,5 @@ def run_vlm(model: Any, prompt: str) -> Tuple[str, float]:
         prob = 0.75
         return text, prob
     except Exception:  # pragma: no cover - failure path
-        return "- Model execution failed", 0.5
+        return FAILED_TEXT, 0.5
+
@@ -0,0 +1 @@
+"""Performance benchmarks for the MRI pipeline hot paths."""
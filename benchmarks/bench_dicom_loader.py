@@ -0,0 +1,62 @@
+"""Compare the header-first parallel DICOM loader with the sequential path.
+
+Usage::
+
+    python -m benchmarks.bench_dicom_loader --slices 300 --size 256
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pydicom
+
+from experts.dicom_io import load_dicom_series
+from experts.stand_in import write_study
+
+
+def load_sequential(study_dir: str) -> np.ndarray:
+    """The original loader: full reads in sequence, then stack and cast."""
+    files = sorted(Path(study_dir).glob("*.dcm"))
+    slices = [pydicom.dcmread(str(f)) for f in files]
+    slices.sort(key=lambda d: int(getattr(d, "InstanceNumber", 0)))
+    return np.stack([s.pixel_array for s in slices]).astype(np.float32)
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--slices", type=int, default=300)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        write_study(tmp, slices=args.slices, rows=args.size, cols=args.size)
+        expected = load_sequential(tmp)
+        actual, _, _ = load_dicom_series(tmp, workers=args.workers)
+        assert np.array_equal(expected, actual)
+
+        old = best_of(lambda: load_sequential(tmp), args.repeat)
+        new = best_of(lambda: load_dicom_series(tmp, workers=args.workers), args.repeat)
+
+    print(f"sequential: {old:.3f}s")
+    print(f"header-first ({args.workers} workers): {new:.3f}s")
+    print(f"speedup: {old / new:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measure sliding-window throughput for a grid of inference settings.
+
+Runs a small stand-in network (or a TorchScript file given with ``--model``)
+over a synthetic 4-channel volume and reports voxels/s for every combination
+of window batch size, overlap, blending mode and bfloat16 autocast.
+
+Usage::
+
+    python -m benchmarks.bench_inference --shape 128 128 96 --threads 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import time
+
+import torch
+
+from experts.inference import InferenceConfig, configure_threads, run_sliding_window
+from experts.stand_in import stand_in_model
+
+
+def measure(model, data, roi_size, config: InferenceConfig, repeat: int) -> float:
+    run_sliding_window(model, data, roi_size, config)  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_sliding_window(model, data, roi_size, config)
+        best = min(best, time.perf_counter() - start)
+    return data[0, 0].numel() / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shape", type=int, nargs=3, default=(96, 96, 64))
+    parser.add_argument("--roi", type=int, nargs=3, default=(64, 64, 64))
+    parser.add_argument("--model", help="TorchScript model to benchmark instead of the stand-in")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=(1, 2, 4, 8))
+    parser.add_argument("--overlaps", type=float, nargs="+", default=(0.25, 0.5))
+    parser.add_argument("--modes", nargs="+", default=("constant", "gaussian"))
+    parser.add_argument("--bf16", choices=("off", "on", "both"), default="both")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0 = torch default)")
+    parser.add_argument("--interop-threads", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    configure_threads(args.threads, args.interop_threads)
+    model = torch.jit.load(args.model).eval() if args.model else stand_in_model()
+    data = torch.rand(1, 4, *args.shape)
+    bf16 = {"off": (False,), "on": (True,), "both": (False, True)}[args.bf16]
+
+    print(f"volume {tuple(args.shape)}, roi {tuple(args.roi)}, {torch.get_num_threads()} intra-op threads")
+    print(f"{'batch':>5} {'overlap':>7} {'mode':>9} {'bf16':>5} {'Mvox/s':>8}")
+    for batch, overlap, mode, use_bf16 in itertools.product(args.batch_sizes, args.overlaps, args.modes, bf16):
+        config = InferenceConfig(sw_batch_size=batch, overlap=overlap, mode=mode, bf16=use_bf16)
+        rate = measure(model, data, args.roi, config, args.repeat)
+        print(f"{batch:>5} {overlap:>7.2f} {mode:>9} {str(use_bf16):>5} {rate / 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Concurrent create/update/get throughput of the gateway JobStore.
+
+Compares the WAL, connection-per-thread store with the previous design
+(one shared connection behind a global lock, rollback journal).
+
+Usage::
+
+    python -m benchmarks.bench_job_store --threads 16 --jobs 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Lock
+
+from gateway.job_store import JobStore
+
+
+class LegacyJobStore:
+    """The original store: shared connection, global lock, commit per write."""
+
+    def __init__(self, db_path: Path):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, state TEXT, paths TEXT, result TEXT)")
+        self._lock = Lock()
+
+    def create(self, job_id, paths, state="uploaded"):
+        with self._lock:
+            self._conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?)", (job_id, state, json.dumps(paths), None))
+            self._conn.commit()
+
+    def update_state(self, job_id, state):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET state=? WHERE id=?", (state, job_id))
+            self._conn.commit()
+
+    def set_result(self, job_id, result, state="done"):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET state=?, result=? WHERE id=?", (state, json.dumps(result), job_id))
+            self._conn.commit()
+
+    def get(self, job_id):
+        # the legacy store read without the lock; keep it for a fair baseline
+        return self._conn.execute("SELECT state FROM jobs WHERE id=?", (job_id,)).fetchone()
+
+
+def workload(store, worker: int, jobs: int, polls: int) -> int:
+    ops = 0
+    for i in range(jobs):
+        job_id = f"w{worker}-{i}"
+        store.create(job_id, {"dicom": f"/data/jobs/{job_id}/dicom"})
+        store.update_state(job_id, "running")
+        for _ in range(polls):
+            store.get(job_id)
+        store.set_result(job_id, {"job_id": job_id, "state": "done"})
+        ops += 3 + polls
+    return ops
+
+
+def run(store, threads: int, jobs: int, polls: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ops = sum(pool.map(lambda w: workload(store, w, jobs, polls), range(threads)))
+    return ops / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--jobs", type=int, default=200, help="jobs per thread")
+    parser.add_argument("--polls", type=int, default=10, help="get() calls per job")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        legacy = run(LegacyJobStore(Path(tmp) / "legacy.db"), args.threads, args.jobs, args.polls)
+        current = run(JobStore(Path(tmp) / "wal.db"), args.threads, args.jobs, args.polls)
+
+    print(f"legacy (shared connection + lock): {legacy:,.0f} ops/s")
+    print(f"WAL + per-thread connections:      {current:,.0f} ops/s")
+    print(f"speedup: {current / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Goodput of a CPU-bound service under overload, with and without admission.
+
+Starts a stand-in for the experts service on a local port: each request
+burns a fixed amount of pure-Python work, so concurrent requests share one
+interpreter the way concurrent inferences share the experts' cores.
+Closed-loop clients using :class:`~common.client.ResilientClient` drive it
+at 1x, 2x and 4x its capacity, once behind
+:func:`~common.admission.admission` and once without.
+
+Without admission every extra request slows all the others down until they
+exceed the client timeout, and the abandoned requests keep burning CPU, so
+goodput (requests answered in time, per second) collapses.  With admission
+the excess is turned away at once with 429 and the admitted requests keep
+completing, so goodput stays flat.
+
+Usage::
+
+    python -m benchmarks.load_test --capacity 2 --service-ms 100 --duration 10
+    python -m benchmarks.load_test --levels 1,4 --out load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import socket
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import requests
+import uvicorn
+from fastapi import FastAPI
+
+from common.admission import CapacityLimiter, admission
+from common.client import CircuitOpenError, ResilientClient
+
+
+def _spin(n: int) -> int:
+    x = 0
+    for i in range(n):
+        x += i
+    return x
+
+
+def calibrate(service_s: float) -> int:
+    """Iterations of :func:`_spin` taking ``service_s`` on an idle interpreter."""
+    n = 200_000
+    start = time.perf_counter()
+    _spin(n)
+    return max(1, int(n * service_s / (time.perf_counter() - start)))
+
+
+class StandIn:
+    """The stand-in service; ``active`` counts requests being worked on."""
+
+    def __init__(self, capacity: int, iterations: int, admit: bool):
+        self.app = FastAPI()
+        self.active = 0
+        self._lock = threading.Lock()
+        if admit:
+            admission(self.app, CapacityLimiter(capacity, "stand-in"), ("/infer",))
+
+        @self.app.post("/infer")
+        def infer():
+            with self._lock:
+                self.active += 1
+            try:
+                _spin(iterations)
+            finally:
+                with self._lock:
+                    self.active -= 1
+            return {"ok": True}
+
+    def drain(self, timeout: float) -> None:
+        """Wait for requests abandoned by their clients to finish."""
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+@contextlib.contextmanager
+def serve(app: FastAPI) -> Iterator[str]:
+    """Run ``app`` with uvicorn on a free local port; yields its URL."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("stand-in service did not start")
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+
+def drive(url: str, clients: int, duration: float, timeout: float, retries: int) -> Dict[str, Any]:
+    """Run ``clients`` closed loops against ``url`` for ``duration`` seconds."""
+    client = ResilientClient(f"load-{clients}", max_concurrency=clients, retries=retries, breaker_reset_s=1.0)
+    outcomes: Counter = Counter()
+    latencies: List[float] = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def loop() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                r = client.post(url, timeout=timeout)
+                outcome = {200: "ok", 429: "rejected"}.get(r.status_code, "error")
+            except CircuitOpenError:
+                outcome = "short_circuited"
+                time.sleep(0.1)
+            except requests.Timeout:
+                outcome = "timeout"
+            except requests.RequestException:
+                outcome = "error"
+            end = time.perf_counter()
+            if end > deadline:
+                return
+            with lock:
+                outcomes[outcome] += 1
+                if outcome == "ok":
+                    latencies.append(end - start)
+
+    threads = [threading.Thread(target=loop) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {
+        "clients": clients,
+        "goodput_per_s": outcomes["ok"] / duration,
+        **{k: outcomes[k] for k in ("ok", "rejected", "timeout", "short_circuited", "error")},
+        "p50_s": float(np.percentile(latencies, 50)) if latencies else None,
+        "p95_s": float(np.percentile(latencies, 95)) if latencies else None,
+    }
+
+
+def run(args) -> List[Dict[str, Any]]:
+    iterations = calibrate(args.service_ms / 1000)
+    timeout = args.timeout or 5 * args.service_ms / 1000
+    results = []
+    for admit in (True, False):
+        for level in args.levels:
+            service = StandIn(args.capacity, iterations, admit)
+            with serve(service.app) as url:
+                row = drive(url + "/infer", args.capacity * level, args.duration, timeout, args.retries)
+                service.drain(timeout=10 * args.duration)
+            results.append({"admission": admit, "load": level, **row})
+            print(_format(results[-1]), flush=True)
+    return results
+
+
+def _format(row: Dict[str, Any]) -> str:
+    p95 = f"{row['p95_s']:.3f}" if row["p95_s"] is not None else "-"
+    return (
+        f"{'on' if row['admission'] else 'off':>9} {row['load']:>3}x {row['clients']:>7} "
+        f"{row['goodput_per_s']:>10.2f} {row['ok']:>6} {row['rejected']:>8} {row['timeout']:>7} "
+        f"{row['short_circuited']:>7} {p95:>7}"
+    )
+
+
+def main(argv: List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=2, help="requests the stand-in admits at once")
+    parser.add_argument("--service-ms", type=float, default=100, help="work per request on an idle service")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per load level")
+    parser.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 2, 4],
+                        help="client counts as multiples of the capacity")
+    parser.add_argument("--timeout", type=float, help="client timeout in seconds (default 5x the service time)")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--out", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    print("admission load clients  goodput/s     ok rejected timeout tripped   p95_s")
+    results = run(args)
+    if args.out:
+        Path(args.out).write_text(json.dumps({"params": vars(args), "results": results}, indent=2))
+        print(f"wrote {len(results)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
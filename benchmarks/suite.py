@@ -0,0 +1,316 @@
+"""Benchmark suite over the pipeline hot paths on a synthetic study.
+
+``run`` generates a synthetic DICOM study and measures DICOM decoding
+(``_load_dicom_volume``, cold and through the volume cache), the peak
+memory of assembling the 4-channel input, ``run_brats``
+with a tiny stand-in TorchScript network, lesion statistics, ``JobStore``
+operations, upload extraction and ``decompress_jpeg2000.process``, and writes
+the results to a JSON file.  ``compare`` checks a result file against a
+baseline and exits with status 1 when a metric regressed by more than the
+threshold.
+
+Usage::
+
+    python -m benchmarks.suite run --out bench.json --slices 64 --size 128
+    python -m benchmarks.suite compare baseline.json bench.json --threshold 0.15
+    python -m benchmarks.suite run --out bench.json --baseline baseline.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from experts.stand_in import jpeg2000_available, write_study
+
+Metrics = Dict[str, Dict[str, Any]]
+
+
+def _metric(value: float, unit: str, better: str = "lower") -> Dict[str, Any]:
+    return {"value": value, "unit": unit, "better": better}
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_dicom_load(study: Path, tmp: Path, args) -> Metrics:
+    from experts import volume_cache as vc
+    from experts.runners.brats_runner import _load_dicom_volume
+
+    shared = vc.volume_cache
+    try:
+        vc.volume_cache = vc.VolumeCache(tmp / "no_cache", max_bytes=0)
+        cold = best_of(lambda: _load_dicom_volume(str(study)), args.repeat)
+        vc.volume_cache = vc.VolumeCache(tmp / "volume_cache", max_bytes=1 << 40)
+        _load_dicom_volume(str(study))
+        cached = best_of(lambda: _load_dicom_volume(str(study)), args.repeat)
+    finally:
+        vc.volume_cache = shared
+    return {
+        "dicom_load.cold_s": _metric(cold, "s"),
+        "dicom_load.cached_s": _metric(cached, "s"),
+    }
+
+
+def bench_run_brats(study: Path, tmp: Path, args) -> Metrics:
+    import torch
+
+    from experts import volume_cache as vc
+    from experts.model_registry import registry
+    from experts.runners import brats_runner
+
+    from experts.stand_in import stand_in_model
+
+    roi = (min(64, args.slices), min(64, args.size), min(64, args.size))
+    network = torch.jit.script(stand_in_model())
+    shared = vc.volume_cache
+    registry.register("brats", lambda: (network, {"roi_size": roi}))
+    registry.evict("brats")
+    try:
+        # decoding is measured on its own; time segmentation and output only
+        vc.volume_cache = vc.VolumeCache(tmp / "brats_cache", max_bytes=1 << 40)
+        mask_out = str(tmp / "brats_seg.nii.gz")
+        warm = brats_runner.run_brats(str(study), mask_out)  # warm-up
+        seconds = best_of(lambda: brats_runner.run_brats(str(study), mask_out), args.repeat)
+        tiled = {"tile_size": 2 * max(roi)}
+        tiled_s = best_of(lambda: brats_runner.run_brats(str(study), mask_out, tiled), args.repeat)
+    finally:
+        vc.volume_cache = shared
+        registry.register("brats", brats_runner._load_bundle)
+        registry.evict("brats")
+    metrics = {"run_brats.s": _metric(seconds, "s"), "run_brats.tiled_s": _metric(tiled_s, "s")}
+    if warm["preprocessing"]:
+        metrics["run_brats.windows"] = _metric(warm["preprocessing"]["windows_after"], "windows")
+    return metrics
+
+
+def bench_assemble(study: Path, tmp: Path, args) -> Metrics:
+    """Peak memory of building the 4-channel input of a single-series study,
+    with ``np.stack`` copies as before and with :func:`experts.modalities.assemble`."""
+    import tracemalloc
+
+    import torch
+
+    from experts.dicom_io import load_dicom_series
+    from experts.modalities import assemble
+
+    decoded = load_dicom_series(str(study))
+
+    def peak(fn: Callable[[], Any]) -> float:
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+
+    stacked = peak(lambda: torch.from_numpy(np.stack([decoded[0]] * 4, axis=0)[None]))
+    assembled = peak(lambda: assemble(str(study), loader=lambda index, uid: decoded).tensor())
+    seconds = best_of(lambda: assemble(str(study), loader=lambda index, uid: decoded).tensor(), args.repeat)
+    return {
+        "assemble.s": _metric(seconds, "s"),
+        "assemble.peak_mb": _metric(assembled, "MB"),
+        "assemble.stack_peak_mb": _metric(stacked, "MB"),
+    }
+
+
+def bench_lesion_stats(study: Path, tmp: Path, args) -> Metrics:
+    from experts.lesion_stats import lesion_stats
+
+    rng = np.random.default_rng(0)
+    shape = (args.slices, args.size, args.size)
+    mask = np.zeros(shape, dtype=np.uint8)
+    # a few dozen box-shaped lesions with all three classes
+    for _ in range(32):
+        size = rng.integers(2, max(3, min(shape) // 4), size=3)
+        start = [rng.integers(0, s - n) for s, n in zip(shape, size)]
+        box = tuple(slice(a, a + n) for a, n in zip(start, size))
+        mask[box] = rng.integers(1, 4, size=tuple(size))
+    seconds = best_of(lambda: lesion_stats(mask, (1.0, 1.0, 1.0)), args.repeat)
+    return {"lesion_stats.s": _metric(seconds, "s")}
+
+
+def bench_job_store(study: Path, tmp: Path, args) -> Metrics:
+    from gateway.job_store import JobStore
+
+    from .bench_job_store import run
+
+    ops = run(JobStore(tmp / "jobs.db"), threads=8, jobs=50, polls=5)
+    return {"job_store.ops_per_s": _metric(ops, "ops/s", "higher")}
+
+
+def bench_upload_extract(study: Path, tmp: Path, args) -> Metrics:
+    from gateway.ingest import extract_dicom, list_dicom_members
+
+    archive = tmp / "study.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        for f in sorted(study.iterdir()):
+            zf.write(f, f"study/{f.name}")
+
+    def extract():
+        dest = tmp / "extract"
+        shutil.rmtree(dest, ignore_errors=True)
+        dest.mkdir()
+        extract_dicom(archive, dest, list_dicom_members(archive, dest))
+
+    seconds = best_of(extract, args.repeat)
+    return {
+        "upload_extract.s": _metric(seconds, "s"),
+        "upload_extract.mb_per_s": _metric(archive.stat().st_size / seconds / 1e6, "MB/s", "higher"),
+    }
+
+
+def bench_decompress(study: Path, tmp: Path, args) -> Metrics:
+    """Without ``--jpeg2000`` the files are not compressed and only the
+    header triage is measured."""
+    import decompress_jpeg2000
+
+    # the script only looks at files without an extension
+    src = tmp / "raw"
+    src.mkdir()
+    for f in study.iterdir():
+        shutil.copy(f, src / f.stem)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = decompress_jpeg2000.process(str(src), workers=args.workers, manifest=str(tmp / "manifest.jsonl"))
+    if stats["failed"]:
+        raise RuntimeError(f"{stats['failed']} files failed to decompress")
+    return {"decompress_jpeg2000.files_per_s": _metric(stats["files_per_s"], "files/s", "higher")}
+
+
+BENCHMARKS: Dict[str, Callable[[Path, Path, Any], Metrics]] = {
+    "dicom_load": bench_dicom_load,
+    "run_brats": bench_run_brats,
+    "assemble": bench_assemble,
+    "lesion_stats": bench_lesion_stats,
+    "job_store": bench_job_store,
+    "upload_extract": bench_upload_extract,
+    "decompress_jpeg2000": bench_decompress,
+}
+
+
+def run_suite(args) -> Dict[str, Any]:
+    params = {
+        "slices": args.slices,
+        "size": args.size,
+        "bits": args.bits,
+        "jpeg2000": args.jpeg2000,
+        "repeat": args.repeat,
+        "workers": args.workers,
+    }
+    metrics: Metrics = {}
+    with TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        # most paths read decoded studies; decompression gets its own copy
+        plain = tmp / "study"
+        write_study(plain, slices=args.slices, rows=args.size, cols=args.size, bits=args.bits)
+        compressed = plain
+        if args.jpeg2000:
+            compressed = tmp / "study_j2k"
+            write_study(compressed, slices=args.slices, rows=args.size, cols=args.size, bits=args.bits, jpeg2000=True)
+        for name in args.only or BENCHMARKS:
+            work = tmp / f"work_{name}"
+            work.mkdir()
+            study = compressed if name in ("decompress_jpeg2000", "upload_extract") else plain
+            start = time.perf_counter()
+            results = BENCHMARKS[name](study, work, args)
+            print(f"{name}: done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            metrics.update(results)
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": params,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a comparison table and return the names of regressed metrics."""
+    if baseline.get("params") != current.get("params"):
+        print(f"warning: parameters differ: {baseline.get('params')} vs {current.get('params')}")
+    regressed = []
+    print(f"{'metric':<36} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, cur in sorted(current["metrics"].items()):
+        base = baseline["metrics"].get(name)
+        if base is None or not base["value"]:
+            print(f"{name:<36} {'-':>12} {cur['value']:>12.4g} {'new':>8}")
+            continue
+        change = (cur["value"] - base["value"]) / base["value"]
+        # positive means slower, whichever direction the metric improves in
+        worse = change if cur.get("better", "lower") == "lower" else -change
+        flag = ""
+        if worse > threshold:
+            regressed.append(name)
+            flag = "  REGRESSED"
+        print(f"{name:<36} {base['value']:>12.4g} {cur['value']:>12.4g} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def _compare_files(baseline: str, current: Dict[str, Any], threshold: float) -> int:
+    regressed = compare(json.loads(Path(baseline).read_text()), current, threshold)
+    if regressed:
+        print(f"{len(regressed)} metric(s) regressed by more than {threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run the benchmarks and write a JSON result file")
+    run.add_argument("--out", default="bench.json")
+    run.add_argument("--slices", type=int, default=64)
+    run.add_argument("--size", type=int, default=128, help="rows and columns of each slice")
+    run.add_argument("--bits", type=int, choices=(8, 16), default=16)
+    run.add_argument("--jpeg2000", action="store_true", help="JPEG 2000 compress the study for extraction and decompression")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--workers", type=int, default=4, help="worker processes for decompression")
+    run.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    run.add_argument("--baseline", help="compare against this result file after the run")
+    run.add_argument("--threshold", type=float, default=0.15)
+
+    cmp = sub.add_parser("compare", help="compare a result file with a baseline")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown (0.15 = 15%%)")
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return _compare_files(args.baseline, json.loads(Path(args.current).read_text()), args.threshold)
+
+    if args.jpeg2000 and not jpeg2000_available():
+        parser.error("--jpeg2000 needs a JPEG 2000 encoder (pylibjpeg-openjpeg or GDCM)")
+    result = run_suite(args)
+    Path(args.out).write_text(json.dumps(result, indent=2))
+    print(f"wrote {len(result['metrics'])} metrics to {args.out}")
+    if args.baseline:
+        return _compare_files(args.baseline, result, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Code shared by the gateway, agent and experts services."""
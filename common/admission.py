@@ -0,0 +1,121 @@
+"""Admission control for the services' expensive endpoints.
+
+A :class:`CapacityLimiter` admits at most ``capacity`` requests at a time;
+:func:`admission` puts one in front of an app's expensive routes.  Requests
+over the limit are answered at once with ``429 Too Many Requests`` and a
+``Retry-After`` estimated from recent service times, rather than queued
+until every caller times out.  The limit and its use are served at
+``GET /capacity`` and exported as metrics.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from threading import Lock
+from typing import Any, Dict, List, Sequence
+
+from .tracing import metrics
+
+# Weight of the latest request in the service time average
+EWMA_WEIGHT = 0.2
+
+# Upper bound on the advertised Retry-After, in seconds
+MAX_RETRY_AFTER_S = 60
+
+_limiters: List["CapacityLimiter"] = []
+
+
+class CapacityLimiter:
+    """Admit at most ``capacity`` concurrent requests; never waits."""
+
+    def __init__(self, capacity: int, name: str):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.name = name
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._service_s: float | None = None
+        self._lock = Lock()
+        _limiters.append(self)
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free."""
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            self._admitted += 1
+            return True
+
+    def release(self, seconds: float | None = None) -> None:
+        """Free a slot; ``seconds`` is how long the request held it."""
+        with self._lock:
+            self._in_flight -= 1
+            if seconds is not None:
+                prev = self._service_s
+                self._service_s = seconds if prev is None else prev + EWMA_WEIGHT * (seconds - prev)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free.
+
+        With every slot busy one frees up about every ``service time /
+        capacity`` seconds."""
+        with self._lock:
+            service_s = self._service_s or 1.0
+        return min(MAX_RETRY_AFTER_S, max(1, math.ceil(service_s / self.capacity)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "available": self.capacity - self._in_flight,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "service_s": self._service_s,
+            }
+
+
+def admission(app: Any, limiter: CapacityLimiter, prefixes: Sequence[str]) -> None:
+    """Admit requests to paths starting with one of ``prefixes`` through
+    ``limiter`` and add ``GET /capacity`` to ``app``.
+
+    Call before :func:`~common.tracing.instrument` so rejected requests are
+    still traced."""
+    from fastapi import Request
+    from fastapi.responses import JSONResponse
+
+    prefixes = tuple(prefixes)
+
+    @app.middleware("http")
+    async def admit(request: Request, call_next):
+        if not request.url.path.startswith(prefixes):
+            return await call_next(request)
+        if not limiter.try_acquire():
+            return JSONResponse(
+                {"detail": f"{limiter.name} is at capacity"},
+                status_code=429,
+                headers={"Retry-After": str(limiter.retry_after())},
+            )
+        start = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+    @app.get("/capacity")
+    def capacity():
+        return limiter.stats()
+
+
+def _by_limiter(key: str) -> Dict[tuple, float]:
+    return {(limiter.name,): limiter.stats()[key] for limiter in _limiters}
+
+
+metrics.gauge("admission_capacity", "Concurrent requests admitted", ("limiter",), fn=lambda: _by_limiter("capacity"))
+metrics.gauge("admission_in_flight", "Admitted requests being handled", ("limiter",), fn=lambda: _by_limiter("in_flight"))
+metrics.gauge("admission_rejected", "Requests rejected at capacity", ("limiter",), fn=lambda: _by_limiter("rejected"))
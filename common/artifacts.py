@@ -0,0 +1,171 @@
+"""Local artifact store for handing arrays between services without copies.
+
+A producer writes an array once with :meth:`ArtifactStore.put` and passes the
+returned :class:`ArtifactHandle` (a small JSON-serialisable record with the
+job, name, dtype, shape and affine) to the next service, which maps the data
+with :meth:`ArtifactStore.open`.  Arrays are ``.npy`` files under
+:data:`~common.settings.ARTIFACT_DIR`; mounting that directory on a tmpfs
+keeps them in shared memory.  Each service finds an artifact under its own
+``ARTIFACT_DIR`` by job and name, so the directory may be mounted at
+different paths; the ``path`` of a handle is informational only.
+
+Artifacts are grouped per job and reference counted: whoever drives a job
+calls :meth:`~ArtifactStore.acquire` before producing artifacts and
+:meth:`~ArtifactStore.release` when done; the job's artifacts are removed
+when the last reference is released.  Counts live in a file guarded by
+``flock`` so they work across processes.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .settings import ARTIFACT_DIR
+
+_NAME = re.compile(r"^[A-Za-z0-9._-]+$")
+
+
+@dataclass(frozen=True)
+class ArtifactHandle:
+    job_id: str
+    name: str
+    path: str
+    dtype: str
+    shape: Tuple[int, ...]
+    affine: Optional[List[List[float]]] = None
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "ArtifactHandle":
+        return cls(**{**d, "shape": tuple(d["shape"])})
+
+
+class ArtifactStore:
+    def __init__(self, root: Path = ARTIFACT_DIR):
+        self.root = Path(root)
+
+    def job_dir(self, job_id: str) -> Path:
+        if not _NAME.match(job_id):
+            raise ValueError(f"invalid job id: {job_id!r}")
+        return self.root / job_id
+
+    def path(self, job_id: str, name: str) -> Path:
+        """File of artifact ``name`` of ``job_id`` in this store."""
+        if not _NAME.match(name):
+            raise ValueError(f"invalid artifact name: {name!r}")
+        return self.job_dir(job_id) / f"{name}.npy"
+
+    def put(
+        self,
+        job_id: str,
+        name: str,
+        array: np.ndarray,
+        affine: np.ndarray | None = None,
+        **meta: Any,
+    ) -> ArtifactHandle:
+        """Write ``array`` as artifact ``name`` of ``job_id`` and return its handle."""
+        path = self.path(job_id, name)
+        job = path.parent
+        job.mkdir(parents=True, exist_ok=True)
+        tmp = job / f".{name}.{os.getpid()}.npy"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=array.dtype, shape=array.shape)
+        out[...] = array
+        out.flush()
+        del out
+        os.replace(tmp, path)
+        return ArtifactHandle(
+            job_id=job_id,
+            name=name,
+            path=str(path),
+            dtype=str(array.dtype),
+            shape=tuple(int(n) for n in array.shape),
+            affine=np.asarray(affine).tolist() if affine is not None else None,
+            meta=meta,
+        )
+
+    def empty(
+        self,
+        job_id: str,
+        name: str,
+        shape: Tuple[int, ...],
+        dtype: Any,
+        affine: np.ndarray | None = None,
+        **meta: Any,
+    ) -> Tuple[np.ndarray, ArtifactHandle]:
+        """Create artifact ``name`` as a writable map to be filled in place.
+
+        Unlike :meth:`put` the file is not written atomically; hand out the
+        handle only once the array is filled."""
+        path = self.path(job_id, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        return out, ArtifactHandle(
+            job_id=job_id,
+            name=name,
+            path=str(path),
+            dtype=str(out.dtype),
+            shape=tuple(int(n) for n in shape),
+            affine=np.asarray(affine).tolist() if affine is not None else None,
+            meta=meta,
+        )
+
+    def open(self, handle: ArtifactHandle | Dict[str, Any]) -> np.ndarray:
+        """Map the artifact read-only; no data is copied.
+
+        The file is looked up in this store by the handle's job and name,
+        never at the ``path`` the producer reported."""
+        if isinstance(handle, dict):
+            handle = ArtifactHandle.from_dict(handle)
+        array = np.load(self.path(handle.job_id, handle.name), mmap_mode="r")
+        if str(array.dtype) != handle.dtype or array.shape != tuple(handle.shape):
+            raise ValueError(f"artifact {handle.name} does not match its handle")
+        return array
+
+    def acquire(self, job_id: str) -> int:
+        """Add a reference to the artifacts of ``job_id``; returns the new count."""
+        with self._refs(job_id, create=True) as refs:
+            refs[0] += 1
+            return refs[0]
+
+    def release(self, job_id: str) -> int:
+        """Drop a reference; the job's artifacts are deleted when none remain."""
+        job = self.job_dir(job_id)
+        if not job.exists():
+            return 0
+        with self._refs(job_id) as refs:
+            refs[0] = max(0, refs[0] - 1)
+            if refs[0] == 0:
+                # mapped arrays stay readable after unlinking on POSIX
+                shutil.rmtree(job, ignore_errors=True)
+            return refs[0]
+
+    @contextmanager
+    def _refs(self, job_id: str, create: bool = False) -> Iterator[List[int]]:
+        job = self.job_dir(job_id)
+        if create:
+            job.mkdir(parents=True, exist_ok=True)
+        path = job / "refs"
+        with open(path, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            fp.seek(0)
+            refs = [int(fp.read().strip() or 0)]
+            yield refs
+            if job.exists():
+                fp.seek(0)
+                fp.truncate()
+                fp.write(str(refs[0]))
+
+
+artifacts = ArtifactStore()
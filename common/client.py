@@ -0,0 +1,210 @@
+"""Pooled HTTP client for calls between the services.
+
+:class:`ResilientClient` keeps keep-alive connections to one upstream
+service, bounds the requests in flight to it, retries refused connections
+and upstreams asking to be called later (``429``/``503``) with jittered
+exponential backoff, honouring ``Retry-After``, and stops calling an
+upstream that keeps failing through a :class:`CircuitBreaker`.
+
+Read timeouts and connections dropped after the request was sent are not
+retried: the upstream may still be working on the request, and repeating
+it would only add to its load.  Nor are ``502`` and
+``504``: the services answer with them once their own retries of the next
+hop are used up, so retrying them again would multiply the calls made to a
+failing service at every hop.
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from .tracing import metrics
+
+RETRY_STATUSES = (429, 503)
+
+_clients: Dict[str, "ResilientClient"] = {}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The upstream failed repeatedly and is not being called."""
+
+
+def _not_sent(error: requests.ConnectionError) -> bool:
+    """Whether ``error`` happened before the request reached the upstream.
+
+    requests also raises ``ConnectionError`` for connections reset or closed
+    mid-request, which the upstream may have acted on."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    return isinstance(reason, (NewConnectionError, ConnectionRefusedError))
+
+
+class CircuitBreaker:
+    """Open after ``failures`` consecutive failures; after ``reset_s`` let
+    one trial call through, which closes it again if it succeeds."""
+
+    def __init__(self, failures: int = 5, reset_s: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.reset_s = reset_s
+        self._clock = clock
+        self._count = 0
+        self._opened_at: float | None = None
+        self._trial = False
+        self._lock = Lock()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_s:
+            return "half-open"
+        return "open"
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def remaining(self) -> float:
+        """Seconds until the breaker lets a trial call through."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_s - self._clock())
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._count = 0
+                self._opened_at = None
+                return
+            self._count += 1
+            # a failed trial re-opens the breaker for another period
+            if self._opened_at is not None or self._count >= self.failures:
+                self._opened_at = self._clock()
+
+
+class ResilientClient:
+    """Calls to one upstream service; see the module docstring."""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        retries: int = 2,
+        backoff_s: float = 0.5,
+        max_backoff_s: float = 30.0,
+        breaker_failures: int = 5,
+        breaker_reset_s: float = 30.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_s)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = BoundedSemaphore(max_concurrency)
+        self._sleep = sleep
+        self._counts = {"in_flight": 0, "requests": 0, "retries": 0, "short_circuited": 0}
+        self._lock = Lock()
+        _clients[name] = self
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counts[key] += amount
+
+    def backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        """Delay before retry ``attempt + 1``: full jitter over an exponential
+        bound, added to the upstream's ``Retry-After`` if it sent one."""
+        delay = random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2**attempt))
+        try:
+            return max(0.0, float(retry_after)) + delay
+        except (TypeError, ValueError):
+            # absent, or an HTTP date, which the services never send
+            return delay
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        """``session.post`` with bounded concurrency, retries and the breaker.
+
+        Returns the last response once the retries are used up, so callers
+        still ``raise_for_status``.  Raises :class:`CircuitOpenError` without
+        calling the upstream while the breaker is open."""
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise CircuitOpenError(f"{self.name} is failing; retry in {self.breaker.remaining():.0f}s")
+            self._count("requests")
+            try:
+                with self._slots:
+                    self._count("in_flight")
+                    try:
+                        response = self.session.post(url, **kwargs)
+                    finally:
+                        self._count("in_flight", -1)
+            except requests.ConnectionError as e:
+                self.breaker.record(False)
+                # only a request that never reached the upstream is safe to repeat
+                if not _not_sent(e) or attempt >= self.retries:
+                    raise
+                delay = self.backoff(attempt)
+            except BaseException:
+                self.breaker.record(False)
+                raise
+            else:
+                # a 429 comes from a healthy upstream shedding load
+                self.breaker.record(response.status_code < 500)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                delay = self.backoff(attempt, response.headers.get("Retry-After"))
+            self._count("retries")
+            self._sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        return {"max_concurrency": self.max_concurrency, "breaker": self.breaker.state, **counts}
+
+
+def _by_client(fn: Callable[["ResilientClient"], float]) -> Dict[tuple, float]:
+    return {(name,): fn(client) for name, client in list(_clients.items())}
+
+
+metrics.gauge(
+    "client_requests_in_flight", "Requests being made to an upstream", ("client",),
+    fn=lambda: _by_client(lambda c: c.stats()["in_flight"]),
+)
+metrics.gauge(
+    "client_retries", "Retried requests to an upstream", ("client",),
+    fn=lambda: _by_client(lambda c: c.stats()["retries"]),
+)
+metrics.gauge(
+    "client_circuit_open", "Whether calls to an upstream are short-circuited", ("client",),
+    fn=lambda: _by_client(lambda c: int(c.breaker.state == "open")),
+)
@@ -0,0 +1,9 @@
+from pathlib import Path
+import os
+
+# Job data shared by all services
+JOB_BASE = Path(os.getenv("JOB_BASE", "/data/jobs"))
+
+# Arrays handed between services; point at a tmpfs (e.g. /dev/shm) to keep
+# them in shared memory when all services run on one host
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", str(JOB_BASE / ".artifacts")))
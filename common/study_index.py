@@ -0,0 +1,147 @@
+"""Header-only index of the instances of a study.
+
+The gateway builds the index once, right after extracting an upload, and
+stores it in the job store and as ``work/index.json`` next to the study's
+``dicom`` folder.  Each instance record holds the facts later stages need:
+series, modality and sequence description, slice geometry, pixel layout,
+transfer syntax and the file offset of the pixel data.  Loaders read the
+index instead of parsing every header again; without an index (e.g. the
+desktop pipeline) they fall back to reading the headers.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.errors import InvalidDicomError
+from pydicom.uid import ExplicitVRLittleEndian, ImplicitVRLittleEndian
+
+INDEX_NAME = "index.json"
+
+NATIVE_UIDS = {ExplicitVRLittleEndian, ImplicitVRLittleEndian}
+
+
+def index_path(study_dir: str | Path) -> Path:
+    """Where the index of the job study in ``study_dir`` is stored."""
+    return Path(study_dir).parent / "work" / INDEX_NAME
+
+
+def read_header(path: str | Path) -> Tuple[Dataset, Optional[int]]:
+    """Read the header of ``path`` and locate its pixel data.
+
+    Returns the dataset without pixel data and the offset of the Pixel Data
+    value for uncompressed little-endian images (``None`` otherwise)."""
+    with open(path, "rb") as fp:
+        ds = pydicom.dcmread(fp, stop_before_pixels=True)
+        # pydicom rewinds to the start of the Pixel Data element
+        tag_offset = fp.tell()
+    ts = ds.file_meta.get("TransferSyntaxUID")
+    if ts not in NATIVE_UIDS or "Rows" not in ds:
+        return ds, None
+    header_len = 8 if ts == ImplicitVRLittleEndian else 12
+    return ds, tag_offset + header_len
+
+
+def _floats(value: Any) -> Optional[List[float]]:
+    return [float(v) for v in value] if value is not None else None
+
+
+def _float(value: Any) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+def _int(value: Any) -> Optional[int]:
+    return int(value) if value not in (None, "") else None
+
+
+def instance_record(path: Path, root: Path) -> Optional[Dict[str, Any]]:
+    """Index ``path``; returns ``None`` for files that are not DICOM."""
+    try:
+        ds, offset = read_header(path)
+    except (InvalidDicomError, OSError, ValueError):
+        return None
+    get = ds.get
+    return {
+        "path": path.relative_to(root).as_posix(),
+        "sop_instance_uid": str(get("SOPInstanceUID", "")) or None,
+        "study_uid": str(get("StudyInstanceUID", "")) or None,
+        "series_uid": str(get("SeriesInstanceUID", "")) or None,
+        "modality": str(get("Modality", "")) or None,
+        "series_description": str(get("SeriesDescription", "")) or None,
+        "sequence_name": str(get("SequenceName", "") or get("ProtocolName", "")) or None,
+        "instance_number": _int(get("InstanceNumber")),
+        "position": _floats(get("ImagePositionPatient")),
+        "orientation": _floats(get("ImageOrientationPatient")),
+        "pixel_spacing": _floats(get("PixelSpacing")),
+        "slice_thickness": _float(get("SliceThickness")),
+        "spacing_between_slices": _float(get("SpacingBetweenSlices")),
+        "rows": _int(get("Rows")),
+        "columns": _int(get("Columns")),
+        "bits_allocated": _int(get("BitsAllocated")),
+        "bits_stored": _int(get("BitsStored")),
+        "pixel_representation": _int(get("PixelRepresentation")),
+        "samples_per_pixel": _int(get("SamplesPerPixel")),
+        "number_of_frames": _int(get("NumberOfFrames")),
+        "transfer_syntax": str(ds.file_meta.get("TransferSyntaxUID", "")) or None,
+        "pixel_offset": offset,
+    }
+
+
+@dataclass
+class StudyIndex:
+    root: Path
+    instances: List[Dict[str, Any]]
+
+    def series(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Instances grouped by series, in order of first appearance."""
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for inst in self.instances:
+            groups.setdefault(inst["series_uid"] or "", []).append(inst)
+        return groups
+
+    def primary_series(self) -> Optional[str]:
+        """The image series with the most instances."""
+        counts = {
+            uid: sum(1 for inst in insts if inst["rows"])
+            for uid, insts in self.series().items()
+        }
+        counts = {uid: n for uid, n in counts.items() if n}
+        return max(counts, key=counts.get) if counts else None
+
+    def files(self, series_uid: str) -> List[Path]:
+        return [self.root / inst["path"] for inst in self.series().get(series_uid, [])]
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"instances": self.instances}))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path, root: str | Path) -> "StudyIndex":
+        return cls(Path(root), json.loads(Path(path).read_text())["instances"])
+
+
+def build_index(study_dir: str | Path, workers: int = 8) -> StudyIndex:
+    """Read the header of every file under ``study_dir``."""
+    root = Path(study_dir)
+    files = sorted(p for p in root.rglob("*") if p.is_file())
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        records = pool.map(lambda p: instance_record(p, root), files)
+        return StudyIndex(root, [r for r in records if r is not None])
+
+
+def load_index(study_dir: str | Path) -> Optional[StudyIndex]:
+    """Return the stored index of ``study_dir``, if it has one."""
+    path = index_path(study_dir)
+    if not path.exists():
+        return None
+    return StudyIndex.load(path, study_dir)
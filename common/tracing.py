@@ -0,0 +1,266 @@
+"""Request ids, stage timing spans and Prometheus metrics.
+
+:func:`instrument` adds a middleware to a service's FastAPI app that takes the
+``X-Request-ID`` header (or generates an id), keeps it in a context variable
+for the duration of the request and echoes it on the response.  It also
+records request latencies and in-flight counts and serves ``GET /metrics`` in
+the Prometheus text format.  Outgoing calls to other services add
+:func:`propagation_headers` so one id follows a study from the gateway through
+the agent to the experts.
+
+Pipeline stages are timed with :func:`span`.  Every span feeds the
+``stage_duration_seconds`` histogram, and inside :func:`record_spans` the
+durations are also collected per stage so they can be returned with a result.
+Context variables do not follow work handed to a thread pool on their own;
+submit such work with :func:`submit_with_context`.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import logging
+import time
+import uuid
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("timings", default=None)
+_timings_lock = Lock()
+
+Labels = Tuple[str, ...]
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextmanager
+def bind_request_id(request_id: Optional[str]) -> Iterator[Optional[str]]:
+    """Run the block under ``request_id``, e.g. in a background worker."""
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+def propagation_headers() -> Dict[str, str]:
+    """Headers carrying the current request id to another service."""
+    request_id = _request_id.get()
+    return {REQUEST_ID_HEADER: request_id} if request_id else {}
+
+
+def submit_with_context(pool: Executor, fn: Callable[..., Any], *args: Any) -> Future:
+    """Submit ``fn`` so it sees the caller's request id and span collector."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # per-bucket counts (last one is +Inf), sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: (list(v[0]), v[1]) for k, v in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labels, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A gauge set directly or read from ``fn`` at scrape time.
+
+    ``fn`` returns a number, or a mapping of label value tuples to numbers."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), fn: Callable[[], Any] | None = None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn
+        self._values: Dict[Labels, float] = {}
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.fn is not None:
+            try:
+                values = self.fn()
+            except Exception:
+                logger.exception("failed to read gauge %s", self.name)
+                return lines
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = Lock()
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, labels, buckets)
+            return self._metrics[name]
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), fn: Callable[[], Any] | None = None) -> Gauge:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Gauge(name, help, labels, fn)
+            elif fn is not None:
+                self._metrics[name].fn = fn
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram("stage_duration_seconds", "Duration of pipeline stages", ("stage",))
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration measured elsewhere, e.g. time spent queued."""
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    logger.debug("request %s: %s took %.3fs", _request_id.get(), stage, seconds)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the block as ``stage``; repeated stages are summed."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def record_spans(timings: Optional[Dict[str, float]] = None) -> Iterator[Dict[str, float]]:
+    """Collect the durations of the spans run inside the block.
+
+    Pass ``timings`` to keep adding to a dict collected earlier."""
+    timings = {} if timings is None else timings
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def instrument(app: Any) -> None:
+    """Add request id propagation, request metrics and ``GET /metrics`` to ``app``."""
+    from fastapi import Request
+    from fastapi.responses import PlainTextResponse
+
+    in_flight = metrics.gauge("http_requests_in_flight", "Requests being handled")
+    latency = metrics.histogram(
+        "http_request_duration_seconds", "Latency of handled requests", ("method", "route", "status")
+    )
+
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+        token = _request_id.set(request_id)
+        in_flight.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            in_flight.dec()
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            latency.observe(time.perf_counter() - start, method=request.method, route=route, status=str(status))
+            _request_id.reset(token)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -5,19 +5,30 @@ Recursively searches through a directory tree for files without an extension.
 If the file is a DICOM object whose pixel data is encoded with JPEG 2000,
 this script decompresses the dataset and writes it back with the `.dcm`
 extension. Optionally the original compressed file can be deleted.
+
+Files are triaged from their header only and converted on a process pool.
+Handled files are recorded in a manifest so an interrupted run resumes where
+it stopped.
 """
 
 from __future__ import annotations
 
 import argparse
+import contextlib
+import json
 import os
-from typing import Iterable
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterable, Optional, Set
 
 import pydicom
 from pydicom.uid import JPEG2000, JPEG2000Lossless, ExplicitVRLittleEndian
 
 JPEG2000_UIDS = {JPEG2000, JPEG2000Lossless}
 
+MANIFEST_NAME = ".decompress_manifest.jsonl"
+
 
 def iter_files(path: str) -> Iterable[str]:
     """Yield paths to files under ``path`` without an extension."""
@@ -29,7 +40,64 @@ def iter_files(path: str) -> Iterable[str]:
             yield os.path.join(root, name)
 
 
-def process(path: str, *, dry_run: bool = False, delete_original: bool = False) -> None:
+def _convert(file_path: str, dry_run: bool, delete_original: bool) -> Dict[str, object]:
+    """Triage ``file_path`` from its header and decompress it if needed.
+
+    Returns a manifest record; ``status`` is ``written``, ``skipped`` (not
+    JPEG 2000), ``dry_run`` or ``failed``."""
+    record: Dict[str, object] = {"src": file_path, "bytes": 0}
+    try:
+        record["bytes"] = os.path.getsize(file_path)
+        header = pydicom.dcmread(file_path, force=True, stop_before_pixels=True)
+        ts = header.file_meta.get("TransferSyntaxUID")
+    except Exception as exc:  # pragma: no cover - logging only
+        return {**record, "status": "failed", "message": f"Skipping {file_path}: {exc}"}
+
+    if ts not in JPEG2000_UIDS:
+        return {**record, "status": "skipped", "message": f"Skipping {file_path}: not JPEG 2000 (ts={ts})"}
+
+    out_path = f"{file_path}.dcm"
+    if dry_run:
+        return {**record, "status": "dry_run", "message": f"Would write {out_path}"}
+
+    try:
+        ds = pydicom.dcmread(file_path, force=True)
+        ds.decompress()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.save_as(out_path)
+        if delete_original:
+            os.remove(file_path)
+    except Exception as exc:  # pragma: no cover - logging only
+        return {**record, "status": "failed", "message": f"Failed to process {file_path}: {exc}"}
+    return {**record, "status": "written", "out": out_path, "message": f"Wrote {out_path}"}
+
+
+def _load_manifest(manifest: str) -> Set[str]:
+    """Return the files a previous run already handled."""
+    done: Set[str] = set()
+    if not os.path.exists(manifest):
+        return done
+    with open(manifest) as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # line cut short by an interrupted run
+            if record.get("status") == "skipped" or (
+                record.get("status") == "written" and os.path.exists(record.get("out", ""))
+            ):
+                done.add(record["src"])
+    return done
+
+
+def process(
+    path: str,
+    *,
+    dry_run: bool = False,
+    delete_original: bool = False,
+    workers: int = 1,
+    manifest: Optional[str] = None,
+) -> Dict[str, float]:
     """Decompress JPEG 2000 encoded DICOM files in ``path``.
 
     Parameters
@@ -41,33 +109,49 @@ def process(path: str, *, dry_run: bool = False, delete_original: bool = False)
     delete_original: bool, optional
         If ``True`` delete the original compressed file after writing the
         decompressed version.
+    workers: int, optional
+        Number of worker processes; ``1`` converts in the calling process.
+    manifest: str, optional
+        JSON-lines file recording handled files, so an interrupted run can be
+        resumed.  Defaults to ``.decompress_manifest.jsonl`` in ``path``.
+
+    Returns the number of files handled, written and failed together with
+    the elapsed time and throughput.
     """
-    for file_path in iter_files(path):
-        try:
-            ds = pydicom.dcmread(file_path, force=True)
-        except Exception as exc:  # pragma: no cover - logging only
-            print(f"Skipping {file_path}: {exc}")
-            continue
-
-        ts = ds.file_meta.get("TransferSyntaxUID")
-        if ts not in JPEG2000_UIDS:
-            print(f"Skipping {file_path}: not JPEG 2000 (ts={ts})")
-            continue
-
-        out_path = f"{file_path}.dcm"
-        if dry_run:
-            print(f"Would write {out_path}")
-            continue
-
-        try:
-            ds.decompress()
-            ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
-            ds.save_as(out_path)
-            if delete_original:
-                os.remove(file_path)
-            print(f"Wrote {out_path}")
-        except Exception as exc:  # pragma: no cover - logging only
-            print(f"Failed to process {file_path}: {exc}")
+    manifest = manifest or os.path.join(path, MANIFEST_NAME)
+    done = set() if dry_run else _load_manifest(manifest)
+    files = [f for f in iter_files(path) if f not in done]
+    if done:
+        print(f"Resuming: {len(done)} files already handled")
+
+    stats = {"files": 0, "written": 0, "failed": 0, "bytes": 0}
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        log = None if dry_run else stack.enter_context(open(manifest, "a"))
+        if workers > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = pool.map(_convert, files, repeat(dry_run), repeat(delete_original), chunksize=8)
+        else:
+            results = (_convert(f, dry_run, delete_original) for f in files)
+        for record in results:
+            print(record.pop("message"))
+            stats["files"] += 1
+            stats["bytes"] += record["bytes"]
+            stats["written"] += record["status"] == "written"
+            stats["failed"] += record["status"] == "failed"
+            if log is not None and record["status"] in ("written", "skipped"):
+                log.write(json.dumps(record) + "\n")
+                log.flush()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["files_per_s"] = stats["files"] / elapsed if elapsed else 0.0
+    stats["bytes_per_s"] = stats["bytes"] / elapsed if elapsed else 0.0
+    print(
+        f"Processed {stats['files']} files ({stats['written']} written, {stats['failed']} failed) "
+        f"in {elapsed:.1f}s: {stats['files_per_s']:.1f} files/s, {stats['bytes_per_s'] / 1e6:.1f} MB/s"
+    )
+    return stats
 
 
 def main() -> None:
@@ -79,8 +163,24 @@ def main() -> None:
         action="store_true",
         help="Delete the compressed file after successful conversion",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--manifest",
+        help=f"Progress manifest used to resume runs (default: <path>/{MANIFEST_NAME})",
+    )
     args = parser.parse_args()
-    process(args.path, dry_run=args.dry_run, delete_original=args.delete_original)
+    process(
+        args.path,
+        dry_run=args.dry_run,
+        delete_original=args.delete_original,
+        workers=args.workers,
+        manifest=args.manifest,
+    )
 
 
 if __name__ == "__main__":
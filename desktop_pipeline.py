@@ -2,65 +2,102 @@
 Local end-to-end analysis pipeline for the desktop application.
 
 Combines the previous gateway and agent functionality into a single
-function that operates purely on local files.
+process that operates purely on local files.  An :class:`AnalysisSession`
+loads the VLM and the expert models once and keeps them warm across
+studies; hold one for the lifetime of the application.
 """
 
 from __future__ import annotations
 
-import zipfile
+import gc
+import sys
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
-from agent.vila_loader import load_vila, run_vlm
-from agent.server import render_prompt, _impression, _bullets
-from gateway.app_sdk_io import write_dicom_sr, write_dicom_seg
+from agent.vila_loader import load_vila
+from agent.server import generate_report, _impression, _bullets, _summarize_stats
+from gateway.reports import submit_report_objects
+from gateway.ingest import extract_dicom
 from gateway.settings import ABNORMAL_THRESHOLD_CC
 
+# Expert models kept warm by a session
+SESSION_MODELS = ("brats",)
 
-def analyze_zip(zip_path: str, anatomy: str = "brain") -> Dict[str, Any]:
-    """Run the MRI analysis pipeline on a ZIP archive.
 
-    The archive is extracted into a temporary working directory, BraTS
-    segmentation is performed locally, a VLM drafts the report and DICOM SR/SEG
-    files are optionally written.  Returns a dictionary mirroring the previous
-    gateway response structure.
+class AnalysisSession:
+    """Keeps the VLM and expert models loaded between analyses.
+
+    Models are loaded on the first analysis, or immediately with
+    ``preload=True``.  Call :meth:`close` (or use the session as a context
+    manager) to release them.
     """
-    with TemporaryDirectory() as tmpdir:
-        job = Path(tmpdir)
-        dcm = job / "dicom"
-        work = job / "work"
-        out = job / "out"
-        for p in (dcm, work, out):
-            p.mkdir(parents=True, exist_ok=True)
-
-        with zipfile.ZipFile(zip_path) as zf:
-            for member in zf.namelist():
-                member_path = (dcm / member).resolve()
-                if not str(member_path).startswith(str(dcm.resolve())):
-                    raise ValueError("invalid file path in zip")
-                zf.extract(member, dcm)
 
+    def __init__(self, preload: bool = False):
+        self._vlm: Any = None
+        self._vlm_loaded = False
+        self._closed = False
+        if preload:
+            self.load()
+
+    def load(self) -> None:
+        """Load the VLM and the expert models if not loaded yet."""
+        if self._closed:
+            raise RuntimeError("analysis session is closed")
+        if not self._vlm_loaded:
+            try:
+                self._vlm = load_vila()
+            except Exception:
+                self._vlm = None
+            self._vlm_loaded = True
+        from experts.model_registry import registry
+        import experts.runners.brats_runner  # noqa: F401 - registers "brats"
+
+        registry.preload(SESSION_MODELS)
+
+    def analyze_zip(self, zip_path: str, anatomy: str = "brain") -> Dict[str, Any]:
+        """Run the MRI analysis pipeline on a ZIP archive.
+
+        The archive's DICOM members are extracted into a temporary working
+        directory and analysed with :meth:`analyze_dir`.
+        """
+        with TemporaryDirectory() as tmpdir:
+            dcm = Path(tmpdir) / "dicom"
+            dcm.mkdir()
+            extract_dicom(Path(zip_path), dcm)
+            return self.analyze_dir(str(dcm), anatomy, out_dir=str(Path(tmpdir) / "out"))
+
+    def analyze_dir(self, dicom_dir: str, anatomy: str = "brain", out_dir: Optional[str] = None) -> Dict[str, Any]:
+        """Run the MRI analysis pipeline on a folder of DICOM files.
+
+        BraTS segmentation is performed locally, the VLM drafts the report and
+        DICOM SR/SEG files are optionally written to ``out_dir`` (a temporary
+        folder if not given).  Returns a dictionary mirroring the gateway
+        response structure.
+        """
+        self.load()
         from experts.runners.brats_runner import run_brats
 
-        seg_path, vol_cc, n_lesions = run_brats(str(dcm), str(work / "brats_seg.nii.gz"))
-        stats = {"lesion_volume_cc": vol_cc, "num_lesions": n_lesions}
+        with TemporaryDirectory() as tmpdir:
+            work = Path(tmpdir) / "work"
+            out = Path(out_dir) if out_dir else Path(tmpdir) / "out"
+            for p in (work, out):
+                p.mkdir(parents=True, exist_ok=True)
+
+            brats = run_brats(dicom_dir, str(work / "brats_seg.nii.gz"))
+            seg_path = brats["seg"]
+            stats = _summarize_stats({"brats": brats})
 
-        try:
-            vlm = load_vila()
-        except Exception:
-            vlm = None
-        prompt = render_prompt(anatomy, stats, {})
-        text, prob = run_vlm(vlm, prompt)
-        abnormal = (stats.get("lesion_volume_cc", 0) or 0) > ABNORMAL_THRESHOLD_CC
+            text, prob, _ = generate_report(self._vlm, anatomy, stats, {})
+            abnormal = (stats.get("lesion_volume_cc", 0) or 0) > ABNORMAL_THRESHOLD_CC
 
-        impression = _impression(text, abnormal)
-        findings = _bullets(text)
+            impression = _impression(text, abnormal)
+            findings = _bullets(text)
 
-        sr_path = seg_dcm = None
-        try:
-            sr_path = write_dicom_sr(
-                study_dir=str(dcm),
+            # SR and SEG are written concurrently
+            futures = submit_report_objects(
+                dicom_dir,
+                str(out),
                 impression=impression,
                 findings=findings,
                 structured=stats,
@@ -68,24 +105,55 @@ def analyze_zip(zip_path: str, anatomy: str = "brain") -> Dict[str, Any]:
                     "vlm": {"name": "VILA-M3", "ckpt": "<fill>"},
                     "tools": [{"name": "brats", "version": "<fill>"}]
                 },
-                out_dir=str(out),
+                seg=seg_path if abnormal and seg_path else None,
             )
-            if abnormal and seg_path:
-                seg_dcm = write_dicom_seg(
-                    study_dir=str(dcm), seg_nifti=seg_path, out_dir=str(out)
-                )
-        except Exception:
-            sr_path = seg_dcm = None
-
-        result = {
-            "normal": not abnormal,
-            "confidence": max(prob, 0.5),
-            "impression": impression,
-            "findings": findings,
-            "structured": stats,
-            "downloads": {
-                "dicom_sr": sr_path,
-                "dicom_seg": seg_dcm,
-            },
-        }
-        return result
+            downloads = {"dicom_sr": None, "dicom_seg": None}
+            for name, future in futures.items():
+                try:
+                    downloads[name] = future.result()
+                except Exception:
+                    pass  # DICOM export is optional on the desktop
+
+            return {
+                "normal": not abnormal,
+                "confidence": max(prob, 0.5),
+                "impression": impression,
+                "findings": findings,
+                "structured": stats,
+                "downloads": downloads,
+            }
+
+    def close(self) -> None:
+        """Release the VLM and evict the expert models."""
+        if self._closed:
+            return
+        self._closed = True
+        close = getattr(self._vlm, "close", None)
+        if callable(close):
+            close()
+        self._vlm = None
+        model_registry = sys.modules.get("experts.model_registry")
+        if model_registry is None:  # experts were never loaded
+            return
+        for name in SESSION_MODELS:
+            model_registry.registry.evict(name)
+        gc.collect()
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def __enter__(self) -> "AnalysisSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def analyze_zip(zip_path: str, anatomy: str = "brain") -> Dict[str, Any]:
+    """Analyse a single ZIP archive in a throw-away session.
+
+    Loads every model for this call only; use an :class:`AnalysisSession`
+    to analyse several studies."""
+    with AnalysisSession() as session:
+        return session.analyze_zip(zip_path, anatomy)
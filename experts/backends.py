@@ -0,0 +1,292 @@
+"""CPU inference backends for the BraTS network.
+
+``BRATS_BACKEND`` selects how the bundle's network runs:
+
+* ``torch`` – the TorchScript ``model.ts`` in eager torch (default)
+* ``onnx`` – the network exported to ONNX, run by ONNX Runtime
+* ``onnx-int8-dynamic`` – the ONNX model with int8 weights, activations
+  quantized on the fly
+* ``onnx-int8-static`` – the ONNX model quantized to int8 (QDQ) with
+  activation ranges calibrated on sample windows
+
+ONNX backends are wrapped in a :class:`OnnxNetwork` module, so the model
+registry, the micro-batcher and sliding-window inference use them like the
+TorchScript network.  Their models are produced by the ``export`` command,
+which also writes a ``model.json`` with the window size; ``compare`` reports
+Dice against the torch backend and voxels/s for every exported variant::
+
+    python -m experts.backends export --studies /data/samples/* --out /tmp/brats_bundle/onnx
+    python -m experts.backends compare --out backends.json
+
+Without ``--studies`` both commands use a synthetic study and ``--stand-in``
+replaces the bundle by a tiny network (:mod:`experts.stand_in`).  ``onnx``
+and ``onnxruntime`` are optional (``requirements-onnx.txt``) and only
+imported by the ONNX backends.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from .settings import BRATS_ONNX_DIR, INFER_INTRA_OP_THREADS
+from .stand_in import stand_in_model, write_study
+
+BACKENDS = ("torch", "onnx", "onnx-int8-dynamic", "onnx-int8-static")
+
+# Model file of each ONNX backend under BRATS_ONNX_DIR
+ONNX_FILES = {
+    "onnx": "model.onnx",
+    "onnx-int8-dynamic": "model.int8-dynamic.onnx",
+    "onnx-int8-static": "model.int8-static.onnx",
+}
+CONFIG_FILE = "model.json"
+
+INPUT_NAME = "image"
+OUTPUT_NAME = "logits"
+
+
+def _optional(name: str) -> Any:
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:  # pragma: no cover - import guarded
+        raise RuntimeError(f"ONNX backends need {name}; install requirements-onnx.txt") from e
+
+
+class OnnxNetwork(torch.nn.Module):
+    """An ONNX Runtime session behind the ``torch.nn.Module`` interface."""
+
+    def __init__(self, path: str | Path, threads: int = INFER_INTRA_OP_THREADS):
+        super().__init__()
+        ort = _optional("onnxruntime")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.path = str(path)
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        # reported to the model registry in place of parameter sizes
+        self.nbytes = Path(path).stat().st_size
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        image = x.detach().to("cpu", torch.float32).contiguous().numpy()
+        (logits,) = self.session.run([OUTPUT_NAME], {INPUT_NAME: image})
+        return torch.from_numpy(logits).to(x.device)
+
+
+def load_onnx(backend: str, model_dir: str | Path = BRATS_ONNX_DIR) -> Tuple[torch.nn.Module, Dict[str, Any]]:
+    """Load an exported ONNX backend as a registry ``(network, config)`` pair."""
+    if backend not in ONNX_FILES:
+        raise ValueError(f"unknown backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    model_dir = Path(model_dir)
+    path = model_dir / ONNX_FILES[backend]
+    if not path.exists():
+        raise FileNotFoundError(f"{path} not found; create it with `python -m experts.backends export`")
+    config = json.loads((model_dir / CONFIG_FILE).read_text())
+    return OnnxNetwork(path), {"roi_size": tuple(config["roi_size"]), "backend": backend}
+
+
+def export_onnx(network: torch.nn.Module, path: str | Path, roi_size: Sequence[int], in_channels: int = 4) -> Path:
+    """Export ``network`` (TorchScript or eager) to ONNX with a dynamic batch."""
+    _optional("onnx")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    dummy = torch.rand(1, in_channels, *roi_size)
+    with torch.no_grad():
+        torch.onnx.export(
+            network.eval(),
+            dummy,
+            str(path),
+            input_names=[INPUT_NAME],
+            output_names=[OUTPUT_NAME],
+            dynamic_axes={INPUT_NAME: {0: "batch"}, OUTPUT_NAME: {0: "batch"}},
+            opset_version=17,
+            dynamo=False,  # the TorchScript exporter handles ScriptModules
+        )
+    return path
+
+
+def quantize_dynamic(model: str | Path, out: str | Path) -> Path:
+    """Quantize the weights of ``model`` to int8; activations at run time."""
+    _optional("onnxruntime")
+    from onnxruntime.quantization import QuantType, quantize_dynamic as ort_quantize_dynamic
+
+    ort_quantize_dynamic(str(model), str(out), weight_type=QuantType.QInt8)
+    return Path(out)
+
+
+def quantize_static(model: str | Path, out: str | Path, windows: Sequence[np.ndarray]) -> Path:
+    """Quantize ``model`` to int8 QDQ, calibrating activations on ``windows``."""
+    _optional("onnxruntime")
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType
+    from onnxruntime.quantization import quantize_static as ort_quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._windows = iter(windows)
+
+        def get_next(self):
+            window = next(self._windows, None)
+            return None if window is None else {INPUT_NAME: window[None].astype(np.float32)}
+
+    ort_quantize_static(
+        str(model),
+        str(out),
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    return Path(out)
+
+
+def sample_windows(volumes: np.ndarray, roi_size: Sequence[int], count: int, seed: int = 0) -> Iterator[np.ndarray]:
+    """Random network-sized windows of a ``(C, D, H, W)`` input, for calibration."""
+    rng = np.random.default_rng(seed)
+    shape = volumes.shape[1:]
+    for _ in range(count):
+        start = [int(rng.integers(0, max(1, n - r + 1))) for n, r in zip(shape, roi_size)]
+        window = volumes[(slice(None), *(slice(s, s + r) for s, r in zip(start, roi_size)))]
+        pad = [(0, 0)] + [(0, r - n) for n, r in zip(window.shape[1:], roi_size)]
+        yield np.pad(window, pad)
+
+
+def dice(labels: np.ndarray, reference: np.ndarray) -> float:
+    """Mean Dice over the foreground labels present in either mask."""
+    classes = np.union1d(np.unique(labels), np.unique(reference))
+    scores = [
+        2 * np.count_nonzero((labels == c) & (reference == c))
+        / (np.count_nonzero(labels == c) + np.count_nonzero(reference == c))
+        for c in classes
+        if c != 0
+    ]
+    return float(np.mean(scores)) if scores else 1.0
+
+
+def _network_inputs(studies: Sequence[str], roi_size: Sequence[int], overlap: float) -> List[np.ndarray]:
+    """The preprocessed 4-channel inputs of ``studies`` as the runner builds them."""
+    from .modalities import assemble
+    from .preprocess import preprocess
+    from .settings import PREPROCESS
+
+    inputs = []
+    for study in studies:
+        assembled = assemble(study)
+        if PREPROCESS:
+            assembled, _ = preprocess(assembled, roi_size, overlap)
+        inputs.append(np.ascontiguousarray(assembled.tensor()[0].numpy()))
+    return inputs
+
+
+def _torch_network(args) -> Tuple[torch.nn.Module, Tuple[int, ...]]:
+    if args.stand_in:
+        torch.manual_seed(0)  # the same weights for export and compare
+        return torch.jit.script(stand_in_model()), (64, 64, 64)
+    from .runners.brats_runner import _load_torchscript
+
+    network, config = _load_torchscript()
+    return network, tuple(config["roi_size"])
+
+
+def _studies(args, tmp: Path) -> List[str]:
+    if args.studies:
+        return list(args.studies)
+    study = tmp / "synthetic" / "dicom"
+    write_study(study, slices=args.slices, rows=args.size, cols=args.size)
+    return [str(study)]
+
+
+def cmd_export(args) -> int:
+    network, roi_size = _torch_network(args)
+    out = Path(args.out)
+    model = export_onnx(network, out / ONNX_FILES["onnx"], roi_size)
+    (out / CONFIG_FILE).write_text(json.dumps({"roi_size": list(roi_size), "stand_in": args.stand_in}))
+    print(f"exported {model}")
+    if "dynamic" in args.quantize:
+        print(f"wrote {quantize_dynamic(model, out / ONNX_FILES['onnx-int8-dynamic'])}")
+    if "static" in args.quantize:
+        with TemporaryDirectory() as tmpdir:
+            inputs = _network_inputs(_studies(args, Path(tmpdir)), roi_size, 0.25)
+            per_input = max(1, args.calibration_windows // len(inputs))
+            windows = [w for i, x in enumerate(inputs) for w in sample_windows(x, roi_size, per_input, seed=i)]
+            print(f"wrote {quantize_static(model, out / ONNX_FILES['onnx-int8-static'], windows)} "
+                  f"(calibrated on {len(windows)} windows)")
+    return 0
+
+
+def compare_backends(
+    networks: Dict[str, torch.nn.Module], inputs: Sequence[np.ndarray], roi_size: Sequence[int], repeat: int = 1
+) -> Dict[str, Dict[str, Any]]:
+    """Segment ``inputs`` with each network; Dice is against ``networks["torch"]``."""
+    from .inference import InferenceConfig, run_sliding_window
+
+    config = InferenceConfig(bf16=False, tile_size=0)
+    labels: Dict[str, List[np.ndarray]] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    voxels = sum(int(np.prod(x.shape[1:])) for x in inputs)
+    for name, network in networks.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            labels[name] = [
+                torch.argmax(run_sliding_window(network, torch.from_numpy(x)[None], roi_size, config), dim=1)[0].numpy()
+                for x in inputs
+            ]
+            best = min(best, time.perf_counter() - start)
+        report[name] = {"seconds": best, "voxels_per_s": voxels / best}
+    for name in networks:
+        scores = [dice(a, b) for a, b in zip(labels[name], labels["torch"])]
+        report[name]["dice_vs_torch"] = float(np.mean(scores))
+    return report
+
+
+def cmd_compare(args) -> int:
+    network, roi_size = _torch_network(args)
+    networks: Dict[str, torch.nn.Module] = {"torch": network}
+    for backend, name in ONNX_FILES.items():
+        if (Path(args.model_dir) / name).exists():
+            networks[backend] = load_onnx(backend, args.model_dir)[0]
+    with TemporaryDirectory() as tmpdir:
+        inputs = _network_inputs(_studies(args, Path(tmpdir)), roi_size, 0.25)
+        report = compare_backends(networks, inputs, roi_size, args.repeat)
+    print(f"{'backend':<20} {'voxels/s':>12} {'seconds':>9} {'dice':>7}")
+    for name, row in report.items():
+        print(f"{name:<20} {row['voxels_per_s']:>12.4g} {row['seconds']:>9.3f} {row['dice_vs_torch']:>7.4f}")
+    Path(args.out).write_text(json.dumps({"roi_size": list(roi_size), "backends": report}, indent=2))
+    return 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("export", "export the bundle to ONNX and quantize it"), ("compare", "compare the backends")):
+        cmd = sub.add_parser(name, help=help)
+        cmd.add_argument("--studies", nargs="+", help="DICOM study folders (default: a synthetic study)")
+        cmd.add_argument("--slices", type=int, default=64, help="slices of the synthetic study")
+        cmd.add_argument("--size", type=int, default=128, help="rows and columns of the synthetic study")
+        cmd.add_argument("--stand-in", action="store_true", help="use a tiny stand-in network instead of the bundle")
+    export = sub.choices["export"]
+    export.add_argument("--out", default=str(BRATS_ONNX_DIR))
+    export.add_argument("--quantize", nargs="*", choices=("dynamic", "static"), default=["dynamic", "static"])
+    export.add_argument("--calibration-windows", type=int, default=32)
+    compare = sub.choices["compare"]
+    compare.add_argument("--model-dir", default=str(BRATS_ONNX_DIR))
+    compare.add_argument("--repeat", type=int, default=3)
+    compare.add_argument("--out", default="backends.json")
+
+    args = parser.parse_args(argv)
+    return cmd_export(args) if args.command == "export" else cmd_compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
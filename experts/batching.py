@@ -0,0 +1,123 @@
+"""Dynamic micro-batching of sliding windows across concurrent requests.
+
+Each request still runs its own ``sliding_window_inference`` (and therefore
+its own output aggregator), but uses a :class:`MicroBatcher` as predictor.
+The batcher's worker thread concatenates the window batches submitted by all
+active requests into one model call of at most ``max_windows`` windows,
+waiting up to ``max_wait_ms`` for requests that have not submitted yet, and
+routes each slice of the output back to the request that submitted it.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import Empty, Queue
+from threading import Lock, Thread
+from typing import Callable, Iterator, List, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+_Item = Tuple[torch.Tensor, Future]
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        network: Callable[[], torch.nn.Module],
+        max_windows: int = 16,
+        max_wait_ms: float = 5.0,
+        bf16: bool = False,
+    ):
+        self.network = network
+        self.max_windows = max_windows
+        self.max_wait = max_wait_ms / 1000.0
+        self.bf16 = bf16
+        self._queue: "Queue[_Item]" = Queue()
+        self._lock = Lock()
+        self._active = 0
+        self._thread: Thread | None = None
+        self.batches = 0
+        self.windows = 0
+
+    @contextmanager
+    def session(self) -> Iterator["MicroBatcher"]:
+        """Mark a request as active while it runs sliding-window inference.
+
+        The batcher stops waiting for more windows once every active request
+        has submitted, so a lone request is never delayed."""
+        with self._lock:
+            self._active += 1
+            if self._thread is None:
+                self._thread = Thread(target=self._loop, name="micro-batcher", daemon=True)
+                self._thread.start()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def __call__(self, windows: torch.Tensor) -> torch.Tensor:
+        """Predictor for ``sliding_window_inference``; blocks until run."""
+        future: Future = Future()
+        self._queue.put((windows, future))
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._active,
+                "batches": self.batches,
+                "windows": self.windows,
+                "mean_batch": self.windows / self.batches if self.batches else 0.0,
+            }
+
+    def _collect(self, first: _Item) -> Tuple[List[_Item], _Item | None]:
+        items = [first]
+        size = first[0].shape[0]
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_windows:
+            with self._lock:
+                active = self._active
+            if len(items) >= active:
+                break  # every active request is waiting on this batch
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            w = item[0]
+            if size + w.shape[0] > self.max_windows or w.shape[1:] != first[0].shape[1:] or w.device != first[0].device:
+                return items, item  # starts the next batch
+            items.append(item)
+            size += w.shape[0]
+        return items, None
+
+    def _loop(self) -> None:
+        carry: _Item | None = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            items, carry = self._collect(first)
+            try:
+                batch = torch.cat([w for w, _ in items]) if len(items) > 1 else items[0][0]
+                with torch.inference_mode(), torch.autocast(
+                    device_type=batch.device.type, dtype=torch.bfloat16, enabled=self.bf16
+                ):
+                    out = self.network()(batch)
+                outputs = torch.split(out, [w.shape[0] for w, _ in items])
+            except Exception as e:
+                logger.exception("micro-batch of %d requests failed", len(items))
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            with self._lock:
+                self.batches += 1
+                self.windows += int(batch.shape[0])
+            for (_, future), o in zip(items, outputs):
+                future.set_result(o)
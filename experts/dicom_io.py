@@ -0,0 +1,206 @@
+"""Header-first loading of DICOM series into preallocated volumes.
+
+Slices are first read with ``stop_before_pixels`` to establish their order and
+the true slice spacing from ``ImagePositionPatient``.  The float32 output is
+then allocated once and pixel data is decoded by a thread pool directly into
+its slices, avoiding the list-of-arrays plus ``np.stack``/``astype`` copies.
+Uncompressed pixel data is read straight from the offset found by the header
+pass, so those files are parsed only once.  When the study was indexed at
+ingest (:mod:`common.study_index`) the header pass is skipped altogether and
+the largest image series of the index is loaded.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset
+
+from common import study_index
+from common.study_index import StudyIndex, load_index
+
+from .settings import DICOM_LOAD_WORKERS
+
+
+@dataclass
+class SliceHeader:
+    path: Path
+    ds: Dataset
+    # Offset of the Pixel Data value in the file, or ``None`` if unknown
+    pixel_offset: int | None = None
+
+
+# Instance record fields restored as header attributes
+_INDEX_ATTRIBUTES = {
+    "instance_number": "InstanceNumber",
+    "position": "ImagePositionPatient",
+    "orientation": "ImageOrientationPatient",
+    "pixel_spacing": "PixelSpacing",
+    "slice_thickness": "SliceThickness",
+    "spacing_between_slices": "SpacingBetweenSlices",
+    "rows": "Rows",
+    "columns": "Columns",
+    "bits_allocated": "BitsAllocated",
+    "bits_stored": "BitsStored",
+    "pixel_representation": "PixelRepresentation",
+    "samples_per_pixel": "SamplesPerPixel",
+    "number_of_frames": "NumberOfFrames",
+}
+
+
+def _indexed_series(study_dir: str) -> tuple[StudyIndex, str] | None:
+    index = load_index(study_dir)
+    uid = index.primary_series() if index is not None else None
+    return (index, uid) if uid is not None else None
+
+
+def series_files(study_dir: str) -> List[Path]:
+    """Return the files of the series to load from ``study_dir``."""
+    indexed = _indexed_series(study_dir)
+    if indexed is not None:
+        index, uid = indexed
+        return index.files(uid)
+    files = sorted(Path(study_dir).glob("*.dcm"))
+    if not files:
+        raise FileNotFoundError(f"no DICOM files found in {study_dir}")
+    return files
+
+
+def read_header(path: Path) -> SliceHeader:
+    """Read the header of ``path`` and locate its pixel data."""
+    ds, offset = study_index.read_header(path)
+    return SliceHeader(path, ds, offset)
+
+
+def index_headers(index: StudyIndex, series_uid: str) -> List[SliceHeader]:
+    """Build the slice headers of a series from its index records."""
+    headers = []
+    for inst in index.series()[series_uid]:
+        ds = Dataset()
+        for field, keyword in _INDEX_ATTRIBUTES.items():
+            if inst.get(field) is not None:
+                setattr(ds, keyword, inst[field])
+        headers.append(SliceHeader(index.root / inst["path"], ds, inst["pixel_offset"]))
+    return headers
+
+
+def read_headers(files: Sequence[Path], workers: int = DICOM_LOAD_WORKERS) -> List[SliceHeader]:
+    """Read the headers of ``files`` without their pixel data."""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(read_header, files))
+
+
+def _native_dtype(ds: Dataset) -> np.dtype | None:
+    """Return the dtype to read raw pixel data with, if it can be read raw."""
+    bits = int(getattr(ds, "BitsAllocated", 0))
+    signed = int(getattr(ds, "PixelRepresentation", 0)) == 1
+    if bits not in (8, 16, 32) or int(getattr(ds, "SamplesPerPixel", 1)) != 1:
+        return None
+    if int(getattr(ds, "NumberOfFrames", 1) or 1) != 1:
+        return None
+    if signed and int(getattr(ds, "BitsStored", bits)) != bits:
+        return None  # needs sign extension, leave it to pydicom
+    return np.dtype(f"<{'i' if signed else 'u'}{bits // 8}")
+
+
+def read_pixels(header: SliceHeader) -> np.ndarray:
+    """Return the pixel array for ``header``, reading native data directly."""
+    ds = header.ds
+    dtype = _native_dtype(ds) if header.pixel_offset is not None else None
+    if dtype is None:
+        return pydicom.dcmread(str(header.path)).pixel_array
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    pixels = np.fromfile(header.path, dtype=dtype, count=rows * cols, offset=header.pixel_offset)
+    if pixels.size != rows * cols:
+        raise ValueError(f"{header.path}: truncated pixel data")
+    return pixels.reshape(rows, cols)
+
+
+def slice_positions(headers: Sequence[Dataset]) -> np.ndarray | None:
+    """Project each slice's ``ImagePositionPatient`` on the slice normal.
+
+    Returns ``None`` when the geometry tags are missing so callers can fall
+    back to ``InstanceNumber`` ordering."""
+    try:
+        iop = np.asarray(headers[0].ImageOrientationPatient, dtype=np.float64)
+        ipp = np.asarray([h.ImagePositionPatient for h in headers], dtype=np.float64)
+    except AttributeError:
+        return None
+    normal = np.cross(iop[:3], iop[3:])
+    return ipp @ normal
+
+
+def sort_slices(headers: Sequence[Dataset]) -> Tuple[np.ndarray, np.ndarray | None]:
+    """Return the slice order and the sorted positions (if available)."""
+    positions = slice_positions(headers)
+    if positions is None:
+        order = np.argsort([int(getattr(h, "InstanceNumber", 0)) for h in headers], kind="stable")
+        return order, None
+    order = np.argsort(positions, kind="stable")
+    return order, positions[order]
+
+
+def slice_spacing(first: Dataset, positions: np.ndarray | None) -> float:
+    """Return the distance between slice centres in millimetres."""
+    if positions is not None and len(positions) > 1:
+        gaps = np.diff(positions)
+        gaps = gaps[gaps > 1e-6]
+        if gaps.size:
+            return float(np.median(gaps))
+    spacing = getattr(first, "SpacingBetweenSlices", None) or getattr(first, "SliceThickness", None)
+    return float(spacing) if spacing else 1.0
+
+
+def load_dicom_series(
+    study_dir: str, workers: int = DICOM_LOAD_WORKERS
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Load a DICOM series into a 3D float32 volume.
+
+    Returns ``(volume, affine, spacing)`` where ``volume`` has shape ``(D, H, W)``
+    and spacing is expressed in millimetres.
+    """
+
+    indexed = _indexed_series(study_dir)
+    if indexed is not None:
+        return load_indexed_series(*indexed, workers=workers)
+    return decode_series(read_headers(series_files(study_dir), workers), workers)
+
+
+def load_indexed_series(
+    index: StudyIndex, series_uid: str, workers: int = DICOM_LOAD_WORKERS
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Load one series of ``index`` like :func:`load_dicom_series`."""
+    return decode_series(index_headers(index, series_uid), workers)
+
+
+def decode_series(
+    headers: Sequence[SliceHeader], workers: int = DICOM_LOAD_WORKERS
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sort ``headers`` and decode their pixel data into one volume."""
+    order, positions = sort_slices([h.ds for h in headers])
+    first = headers[order[0]].ds
+
+    rows, cols = int(first.Rows), int(first.Columns)
+    volume = np.empty((len(headers), rows, cols), dtype=np.float32)
+
+    def decode(i: int) -> None:
+        header = headers[order[i]]
+        pixels = read_pixels(header)
+        if pixels.shape != (rows, cols):
+            raise ValueError(f"{header.path}: slice shape {pixels.shape} != {(rows, cols)}")
+        volume[i] = pixels  # cast to float32 while copying into the buffer
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # ``list`` re-raises the first decoding error, if any
+        list(pool.map(decode, range(len(headers))))
+
+    px, py = map(float, first.PixelSpacing)
+    pz = slice_spacing(first, positions)
+    spacing = np.array([px, py, pz], dtype=np.float32)
+    affine = np.diag(np.append(spacing, 1.0))
+    return volume, affine, spacing
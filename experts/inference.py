@@ -0,0 +1,141 @@
+"""Sliding-window inference engine with tunable CPU settings.
+
+Window batch size, overlap, blending mode, bfloat16 autocast and the tile
+size of :func:`run_tiled` come from an :class:`InferenceConfig`, built from
+the ``INFER_*`` environment variables and optionally overridden per request.
+Torch thread pools are process wide and therefore only configured once, via
+:func:`configure_threads`.
+"""
+
+from __future__ import annotations
+
+import itertools
+import logging
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Any, Callable, Dict, Sequence
+
+import numpy as np
+import torch
+from monai.data.utils import dense_patch_slices
+from monai.inferers import sliding_window_inference
+
+from .settings import (
+    INFER_BF16,
+    INFER_BLEND_MODE,
+    INFER_INTER_OP_THREADS,
+    INFER_INTRA_OP_THREADS,
+    INFER_OVERLAP,
+    INFER_SW_BATCH_SIZE,
+    INFER_TILE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+BLEND_MODES = ("constant", "gaussian")
+
+
+@dataclass(frozen=True)
+class InferenceConfig:
+    sw_batch_size: int = INFER_SW_BATCH_SIZE
+    overlap: float = INFER_OVERLAP
+    mode: str = INFER_BLEND_MODE
+    bf16: bool = INFER_BF16
+    tile_size: int = INFER_TILE_SIZE
+
+    def __post_init__(self):
+        if self.sw_batch_size < 1:
+            raise ValueError("sw_batch_size must be >= 1")
+        if not 0 <= self.overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        if self.mode not in BLEND_MODES:
+            raise ValueError(f"mode must be one of {BLEND_MODES}")
+        if self.tile_size < 0:
+            raise ValueError("tile_size must be >= 0")
+
+    def with_options(self, options: Dict[str, Any] | None) -> "InferenceConfig":
+        """Return a copy overridden by the per-request ``options``."""
+        if not options:
+            return self
+        known = {f.name for f in fields(self)}
+        unknown = set(options) - known
+        if unknown:
+            raise ValueError(f"unknown inference options: {sorted(unknown)}")
+        return replace(self, **options)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def configure_threads(intra_op: int = INFER_INTRA_OP_THREADS, inter_op: int = INFER_INTER_OP_THREADS) -> None:
+    """Size torch's intra- and inter-op thread pools (``0`` keeps the default).
+
+    The inter-op pool can only be sized before torch first uses it, so call
+    this once at process start."""
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError:
+            logger.warning("inter-op threads already initialised; keeping %d", torch.get_num_interop_threads())
+
+
+def run_sliding_window(
+    model: Callable[[torch.Tensor], torch.Tensor],
+    data: torch.Tensor,
+    roi_size: Sequence[int],
+    config: InferenceConfig | None = None,
+) -> torch.Tensor:
+    """Return the logits of ``model`` over ``data`` using sliding windows.
+
+    ``model`` may be any predictor, e.g. a
+    :class:`~experts.batching.MicroBatcher` shared with other requests."""
+    config = config or InferenceConfig()
+    with torch.inference_mode(), torch.autocast(
+        device_type=data.device.type, dtype=torch.bfloat16, enabled=config.bf16
+    ):
+        return sliding_window_inference(
+            data,
+            roi_size,
+            config.sw_batch_size,
+            model,
+            overlap=config.overlap,
+            mode=config.mode,
+        )
+
+
+def count_windows(shape: Sequence[int], roi_size: Sequence[int], overlap: float) -> int:
+    """Number of windows ``sliding_window_inference`` runs over ``shape``."""
+    image = [max(n, r) for n, r in zip(shape, roi_size)]
+    interval = [r if r == n else max(1, int(r * (1 - overlap))) for n, r in zip(image, roi_size)]
+    return len(dense_patch_slices(image, roi_size, interval))
+
+
+def run_tiled(
+    model: Callable[[torch.Tensor], torch.Tensor],
+    data: torch.Tensor,
+    roi_size: Sequence[int],
+    out: np.ndarray,
+    config: InferenceConfig | None = None,
+    device: torch.device | str = "cpu",
+) -> np.ndarray:
+    """Write the argmax labels of ``model`` over ``data`` into ``out``.
+
+    The volume is cut into cubes of ``config.tile_size`` voxels.  Each cube is
+    segmented with a margin of half a window on every side, so its voxels are
+    blended from the same window context as in whole-volume inference, and
+    only its labels are written to ``out`` (e.g. a memory-mapped ``uint8``
+    array).  ``data`` stays where it is, typically a view of a memory-mapped
+    volume; peak memory is bounded by the tile, not the volume."""
+    config = config or InferenceConfig()
+    tile = config.tile_size or max(data.shape[2:])
+    spatial = data.shape[2:]
+    margin = [r // 2 for r in roi_size]
+    for start in itertools.product(*(range(0, n, tile) for n in spatial)):
+        core = [slice(s, min(s + tile, n)) for s, n in zip(start, spatial)]
+        halo = [slice(max(0, c.start - m), min(n, c.stop + m)) for c, m, n in zip(core, margin, spatial)]
+        patch = data[(slice(None), slice(None), *halo)].to(device)
+        labels = torch.argmax(run_sliding_window(model, patch, roi_size, config), dim=1)[0]
+        inner = tuple(slice(c.start - h.start, c.stop - h.start) for c, h in zip(core, halo))
+        out[tuple(core)] = labels[inner].to(torch.uint8).cpu().numpy()
+    return out
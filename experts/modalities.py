@@ -0,0 +1,183 @@
+"""Assemble the multi-channel BraTS input from the series of a study.
+
+Series are mapped to the BraTS channels (:data:`~experts.settings.BRATS_CHANNELS`)
+by their series description and sequence name from the study index.  Each
+distinct series is decoded once and resampled onto the grid of the largest
+one with ``F.interpolate``, one series at a time, into a preallocated
+``(K, D, H, W)`` buffer.  Channels without a series of their own reuse a
+related one (T1 for T1c, T2 for FLAIR and vice versa) without copying it: a
+single series becomes an expanded view, otherwise the channels are gathered
+per window by :meth:`AssembledInput.wrap`.
+
+The loader's affines carry no origin, so the series are assumed to cover the
+same field of view, as co-registered acquisitions of one session do.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import warnings
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from common.study_index import StudyIndex, build_index, load_index
+
+from .settings import BRATS_CHANNELS
+from .volume_cache import load_series, series_key
+
+# Checked in order; FLAIR and post-contrast T1 before the plain weightings
+_PATTERNS = (
+    ("flair", re.compile(r"flair|dark.?fluid|tirm|\*tir", re.I)),
+    ("t1c", re.compile(r"t1.*(\+c|post|gd|gad|contrast|\bce\b)|t1c|t1ce|(post|gd|gad).*t1", re.I)),
+    ("t2", re.compile(r"t2|\*tse", re.I)),
+    ("t1", re.compile(r"t1|mprage|spgr|\*tfl|\*fl3d", re.I)),
+)
+
+# Stand-ins for a missing channel, best first
+_SUBSTITUTES = {
+    "t1c": ("t1",),
+    "t1": ("t1c",),
+    "t2": ("flair",),
+    "flair": ("t2",),
+}
+
+
+def classify(record: Dict[str, Any]) -> Optional[str]:
+    """Return the BraTS channel of an index record, if it can be told."""
+    if record.get("modality") not in (None, "MR"):
+        return None
+    text = " ".join(filter(None, (record.get("series_description"), record.get("sequence_name"))))
+    for channel, pattern in _PATTERNS:
+        if pattern.search(text):
+            return channel
+    return None
+
+
+def map_channels(index: StudyIndex, channels: Sequence[str] = BRATS_CHANNELS) -> Dict[str, Optional[str]]:
+    """Map each channel to the largest image series classified as it."""
+    found: Dict[str, Tuple[int, str]] = {}
+    for uid, records in index.series().items():
+        images = [r for r in records if r["rows"]]
+        channel = classify(images[0]) if images else None
+        if channel in channels and len(images) > found.get(channel, (0, ""))[0]:
+            found[channel] = (len(images), uid)
+    return {c: found[c][1] if c in found else None for c in channels}
+
+
+@dataclass
+class AssembledInput:
+    """The distinct series of a study on a common grid.
+
+    ``volumes`` has shape ``(K, D, H, W)``; channel ``c`` of the network
+    input is ``volumes[index[c]]``.  ``sources`` maps each channel to its
+    series and ``substituted`` lists the channels without a series of their
+    own.  ``key`` identifies the input by the volume cache keys of its series."""
+
+    volumes: np.ndarray
+    index: Tuple[int, ...]
+    affine: np.ndarray
+    spacing: np.ndarray
+    sources: Dict[str, str]
+    substituted: Tuple[str, ...]
+    key: str = ""
+
+    @property
+    def replicated(self) -> bool:
+        return len(self.volumes) == 1 and len(self.index) > 1
+
+    def tensor(self) -> torch.Tensor:
+        """Return the input as a ``(1, K, D, H, W)`` tensor sharing memory."""
+        data = as_tensor(self.volumes)[None]
+        if self.replicated:
+            return data.expand(-1, len(self.index), *data.shape[2:])
+        return data
+
+    def wrap(self, predictor: Callable[[torch.Tensor], torch.Tensor]) -> Callable[[torch.Tensor], torch.Tensor]:
+        """Adapt ``predictor`` to windows of :meth:`tensor`."""
+        if self.replicated or self.index == tuple(range(len(self.volumes))):
+            return predictor
+        index = torch.tensor(self.index)
+        return lambda window: predictor(window.index_select(1, index.to(window.device)))
+
+    def memory(self) -> Dict[str, int]:
+        """Bytes held by the input and by a copy per channel."""
+        per_channel = self.volumes[0].nbytes
+        return {"input_bytes": self.volumes.nbytes, "replicated_bytes": per_channel * len(self.index)}
+
+
+def as_tensor(array: np.ndarray) -> torch.Tensor:
+    """``torch.from_numpy`` that accepts read-only arrays."""
+    with warnings.catch_warnings():
+        # cached volumes are read-only memory maps; inference only reads them
+        warnings.filterwarnings("ignore", "The given NumPy array is not writable")
+        return torch.from_numpy(array)
+
+
+def resample(volume: np.ndarray, shape: Sequence[int]) -> np.ndarray:
+    """Trilinearly resample ``volume`` to ``shape`` over the same extent."""
+    if tuple(volume.shape) == tuple(shape):
+        return volume
+    data = as_tensor(np.ascontiguousarray(volume, dtype=np.float32))[None, None]
+    out = F.interpolate(data, size=tuple(shape), mode="trilinear", align_corners=False)
+    return out[0, 0].numpy()
+
+
+def _input_key(index: StudyIndex, channels: Sequence[str], sources: Dict[str, str]) -> str:
+    # the volume cache keys of the series, so studies with the same file
+    # names or missing UIDs never share a key
+    series = {uid: series_key(index.files(uid)) for uid in dict.fromkeys(sources.values())}
+    h = hashlib.blake2b(digest_size=20)
+    for c in channels:
+        h.update(f"{c}={series[sources[c]]};".encode())
+    return h.hexdigest()
+
+
+def assemble(
+    study_dir: str,
+    channels: Sequence[str] = BRATS_CHANNELS,
+    loader: Callable[[StudyIndex, str], Tuple[np.ndarray, np.ndarray, np.ndarray]] = load_series,
+) -> AssembledInput:
+    """Build the network input of the study in ``study_dir``.
+
+    Uses the study index stored at ingest, or indexes the folder in memory.
+    Studies without recognisable series use their largest series for every
+    channel."""
+    index = load_index(study_dir) or build_index(study_dir)
+    primary = index.primary_series()
+    if primary is None:
+        raise FileNotFoundError(f"no DICOM files found in {study_dir}")
+
+    mapped = map_channels(index, channels)
+    present = [c for c in channels if mapped[c]]
+    sources: Dict[str, str] = {}
+    for c in channels:
+        stand_ins = [mapped[s] for s in (*_SUBSTITUTES.get(c, ()), *present) if mapped.get(s)]
+        sources[c] = mapped[c] or (stand_ins[0] if stand_ins else primary)
+
+    uids: List[str] = list(dict.fromkeys(sources[c] for c in channels))
+    loaded = {uid: loader(index, uid) for uid in uids}
+    # the series with the most voxels defines the grid
+    reference = max(uids, key=lambda uid: loaded[uid][0].size)
+    shape = loaded[reference][0].shape
+    _, affine, spacing = loaded[reference]
+
+    if len(uids) == 1:
+        volumes = np.asarray(loaded[reference][0])[None]
+    else:
+        volumes = np.empty((len(uids), *shape), dtype=np.float32)
+        for i, uid in enumerate(uids):
+            volumes[i] = resample(loaded.pop(uid)[0], shape)
+    return AssembledInput(
+        volumes=volumes,
+        index=tuple(uids.index(sources[c]) for c in channels),
+        affine=affine,
+        spacing=spacing,
+        sources=sources,
+        substituted=tuple(c for c in channels if not mapped[c]),
+        key=_input_key(index, channels, sources),
+    )
@@ -0,0 +1,169 @@
+"""Process-resident registry of warm expert models.
+
+Loading a MONAI bundle (pull, TorchScript deserialisation, device transfer)
+takes seconds, which dominated every ``/infer/*`` request when done per call.
+The registry keeps loaded networks in memory, evicting the least recently used
+ones when the configured memory budget would be exceeded.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+import torch
+
+from .settings import MODEL_CACHE_MB
+
+logger = logging.getLogger(__name__)
+
+Loader = Callable[[], Tuple[torch.nn.Module, Dict[str, Any]]]
+
+
+@dataclass
+class LoadedModel:
+    name: str
+    network: torch.nn.Module
+    config: Dict[str, Any] = field(default_factory=dict)
+    device: torch.device = torch.device("cpu")
+    nbytes: int = 0
+    load_time_s: float = 0.0
+
+
+def model_nbytes(network: torch.nn.Module) -> int:
+    """Return the memory held by the parameters and buffers of ``network``.
+
+    Modules wrapping another runtime report their size as ``nbytes``."""
+    if isinstance(getattr(network, "nbytes", None), int):
+        return network.nbytes
+    tensors = list(network.parameters()) + list(network.buffers())
+    return int(sum(t.numel() * t.element_size() for t in tensors))
+
+
+def optimize_for_inference(network: torch.nn.Module) -> torch.nn.Module:
+    """Put ``network`` in eval mode and freeze TorchScript graphs.
+
+    Freezing inlines parameters as constants which lets TorchScript fold
+    batch-norm/conv pairs; failures fall back to the unfrozen module."""
+    network.eval()
+    for p in network.parameters():
+        p.requires_grad_(False)
+    if isinstance(network, torch.jit.ScriptModule):
+        try:
+            network = torch.jit.optimize_for_inference(torch.jit.freeze(network))
+        except Exception:  # pragma: no cover - depends on the exported graph
+            logger.warning("could not freeze TorchScript model", exc_info=True)
+    return network
+
+
+class ModelRegistry:
+    """LRU cache of loaded networks bounded by ``max_bytes``."""
+
+    def __init__(self, max_bytes: int, device: torch.device | None = None):
+        self.max_bytes = max_bytes
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self._loaders: Dict[str, Loader] = {}
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._lock = Lock()
+        self._load_locks: Dict[str, Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def register(self, name: str, loader: Loader) -> None:
+        """Register ``loader`` which returns ``(network, config)`` for ``name``."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, Lock())
+
+    def get(self, name: str) -> LoadedModel:
+        """Return the warm model ``name``, loading it on first use."""
+        with self._lock:
+            if name not in self._loaders:
+                raise KeyError(f"unknown model: {name}")
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                self.hits += 1
+                return model
+            load_lock = self._load_locks[name]
+
+        # Load outside the registry lock so other models stay available, but
+        # make sure concurrent first requests only load the bundle once.
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+                if model is not None:
+                    self._models.move_to_end(name)
+                    self.hits += 1
+                    return model
+                self.misses += 1
+                loader = self._loaders[name]
+            model = self._load(name, loader)
+            with self._lock:
+                self._evict_for(model.nbytes)
+                self._models[name] = model
+            return model
+
+    def preload(self, names: Iterable[str]) -> None:
+        for name in names:
+            try:
+                self.get(name)
+            except Exception:
+                logger.exception("failed to preload model %s", name)
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            if self._models.pop(name, None) is None:
+                return False
+            self.evictions += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "max_bytes": self.max_bytes,
+                "used_bytes": sum(m.nbytes for m in self._models.values()),
+                "models": {
+                    m.name: {"nbytes": m.nbytes, "load_time_s": m.load_time_s, "device": str(m.device)}
+                    for m in self._models.values()
+                },
+            }
+
+    def _load(self, name: str, loader: Loader) -> LoadedModel:
+        start = time.perf_counter()
+        network, config = loader()
+        network = network.to(self.device)
+        # Measure before freezing: frozen graphs hold weights as constants.
+        nbytes = model_nbytes(network)
+        network = optimize_for_inference(network)
+        elapsed = time.perf_counter() - start
+        logger.info("loaded model %s in %.2fs", name, elapsed)
+        return LoadedModel(
+            name=name,
+            network=network,
+            config=dict(config),
+            device=self.device,
+            nbytes=nbytes,
+            load_time_s=elapsed,
+        )
+
+    def _evict_for(self, nbytes: int) -> None:
+        # Always keep at least the model being inserted, even if it alone
+        # exceeds the budget.
+        used = sum(m.nbytes for m in self._models.values())
+        while self._models and used + nbytes > self.max_bytes:
+            name, old = self._models.popitem(last=False)
+            used -= old.nbytes
+            self.evictions += 1
+            logger.info("evicted model %s (%d bytes)", name, old.nbytes)
+
+
+registry = ModelRegistry(max_bytes=int(MODEL_CACHE_MB * 1024 * 1024))
@@ -0,0 +1,159 @@
+"""Crop, resample and normalise the BraTS input before inference.
+
+:func:`preprocess` crops the assembled input to the bounding box of its
+foreground (plus a margin), resamples the crop to the bundle's target spacing
+with one ``interpolate`` call over all series and z-score normalises each
+series over its non-zero voxels.  Most sliding windows over a raw study cover
+air, and the number of voxels varies with the acquisition resolution; after
+preprocessing both are bounded by the head.  The returned
+:class:`Preprocessing` maps labels predicted on the preprocessed grid back to
+the original one and reports how many windows were saved.
+
+Results are stored in the volume cache under a key derived from the input
+and the parameters, so re-analyses of a study skip the stage.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from . import volume_cache as vc
+from .inference import count_windows
+from .lesion_stats import foreground_bbox
+from .modalities import AssembledInput, as_tensor
+from .settings import PREPROCESS_FOREGROUND, PREPROCESS_MARGIN, PREPROCESS_SPACING
+
+# Bump when the stage's output changes for the same parameters
+VERSION = 1
+
+
+@dataclass
+class Preprocessing:
+    """Where the preprocessed grid lies in the original volume."""
+
+    shape: Tuple[int, ...]
+    bbox: Tuple[Tuple[int, int], ...]
+    grid: Tuple[int, ...]
+    windows_before: int
+    windows_after: int
+    cached: bool = False
+
+    def restore(self, labels: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """Map ``labels`` on the preprocessed grid onto the original grid.
+
+        Nearest-neighbour lookup, consistent with the resampling; voxels
+        outside the crop are background.  Writes into ``out`` if given."""
+        if out is None:
+            out = np.zeros(self.shape, dtype=labels.dtype)
+        else:
+            out[...] = 0
+        lookup = [
+            np.minimum(((np.arange(stop - start) + 0.5) * n / (stop - start)).astype(np.intp), n - 1)
+            for (start, stop), n in zip(self.bbox, labels.shape)
+        ]
+        out[tuple(slice(a, b) for a, b in self.bbox)] = labels[np.ix_(*lookup)]
+        return out
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "shape": list(self.shape),
+            "bbox": [list(b) for b in self.bbox],
+            "grid": list(self.grid),
+            "windows_before": self.windows_before,
+            "windows_after": self.windows_after,
+            "windows_saved": self.windows_before - self.windows_after,
+            "cached": self.cached,
+        }
+
+
+def axis_spacing(spacing: Sequence[float]) -> np.ndarray:
+    """Spacing per array axis ``(D, H, W)`` of a loader's ``(x, y, z)`` spacing."""
+    return np.asarray([spacing[2], spacing[0], spacing[1]], dtype=np.float64)
+
+
+def foreground_box(
+    volumes: np.ndarray, fraction: float = PREPROCESS_FOREGROUND, margin: int = PREPROCESS_MARGIN
+) -> Tuple[Tuple[int, int], ...]:
+    """Bounding box of the voxels of any series above ``fraction`` of its
+    99th percentile, grown by ``margin``; the whole volume if there is none."""
+    shape = volumes.shape[1:]
+    foreground = np.zeros(shape, dtype=bool)
+    for volume in volumes:
+        threshold = fraction * np.percentile(volume[::4, ::4, ::4], 99)
+        foreground |= volume > threshold
+    bbox = foreground_bbox(foreground)
+    if bbox is None:
+        return tuple((0, n) for n in shape)
+    return tuple((max(0, s.start - margin), min(n, s.stop + margin)) for s, n in zip(bbox, shape))
+
+
+def normalize(data: torch.Tensor) -> torch.Tensor:
+    """Z-score each channel of ``(K, D, H, W)`` over its non-zero voxels, in place."""
+    nonzero = data != 0
+    count = nonzero.sum(dim=(1, 2, 3)).clamp(min=1)
+    mean = (data * nonzero).sum(dim=(1, 2, 3)) / count
+    var = (((data - mean[:, None, None, None]) * nonzero) ** 2).sum(dim=(1, 2, 3)) / count
+    std = var.sqrt().clamp(min=1e-8)
+    data.sub_(mean[:, None, None, None]).div_(std[:, None, None, None]).mul_(nonzero)
+    return data
+
+
+def _cache_key(inputs: AssembledInput, params: Dict[str, Any]) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    h.update(inputs.key.encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return f"prep-{h.hexdigest()}"
+
+
+def preprocess(
+    inputs: AssembledInput,
+    roi_size: Sequence[int],
+    overlap: float,
+    spacing: Sequence[float] = PREPROCESS_SPACING,
+) -> Tuple[AssembledInput, Preprocessing]:
+    """Return the preprocessed input and how to map results back."""
+    shape = tuple(inputs.volumes.shape[1:])
+    params = {
+        "version": VERSION,
+        "spacing": list(spacing),
+        "foreground": PREPROCESS_FOREGROUND,
+        "margin": PREPROCESS_MARGIN,
+    }
+    cache = vc.volume_cache
+    key = _cache_key(inputs, params) if cache.enabled and inputs.key else None
+    cached = cache.get(key) if key else None
+    meta = cache.get_meta(key) if cached is not None else None
+
+    if cached is not None and meta is not None:
+        volumes, bbox = cached[0], tuple(tuple(b) for b in meta["bbox"])
+    else:
+        bbox = foreground_box(inputs.volumes)
+        crop = inputs.volumes[(slice(None), *(slice(a, b) for a, b in bbox))]
+        extent = np.asarray([b - a for a, b in bbox]) * axis_spacing(inputs.spacing)
+        grid = tuple(int(n) for n in np.maximum(1, np.round(extent / np.asarray(spacing))))
+        data = as_tensor(np.ascontiguousarray(crop, dtype=np.float32))
+        if grid != crop.shape[1:]:
+            data = F.interpolate(data[None], size=grid, mode="trilinear", align_corners=False)[0]
+        else:
+            data = data.clone()
+        volumes = normalize(data).numpy()
+        if key:
+            volumes = cache.put(key, volumes, inputs.affine, inputs.spacing, meta={"bbox": [list(b) for b in bbox]})[0]
+
+    grid = tuple(volumes.shape[1:])
+    info = Preprocessing(
+        shape=shape,
+        bbox=bbox,
+        grid=grid,
+        windows_before=count_windows(shape, roi_size, overlap),
+        windows_after=count_windows(grid, roi_size, overlap),
+        cached=meta is not None,
+    )
+    return replace(inputs, volumes=volumes), info
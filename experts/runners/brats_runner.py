@@ -1,83 +1,199 @@
 """Run BraTS tumour segmentation on a DICOM study.
 
-This runner downloads the `brats_mri_segmentation` bundle from the MONAI model
-zoo, converts the given DICOM series into a 3D volume, performs inference and
-writes the resulting mask as a NIfTI file.  It also computes simple lesion
-statistics which are returned to the caller.
-
-The implementation is intentionally light–weight and executes entirely on the
-CPU so it can run inside the execution environment used for the unit tests.  It
-is **not** optimised for speed nor intended for clinical use.
+:func:`run_brats` assembles the multi-channel input from the series of the
+study (:mod:`experts.modalities`), crops, resamples and normalises it
+(:mod:`experts.preprocess`) and runs the network held by the model registry
+with the configured backend (TorchScript from the `brats_mri_segmentation`
+bundle, or ONNX Runtime; see :mod:`experts.backends`).  Inference is
+sliding-window over the whole volume or tiled into a memory-mapped mask
+(:mod:`experts.inference`); unless ``MICRO_BATCH`` is off the window batches
+of concurrent requests are combined by a
+:class:`~experts.batching.MicroBatcher`.  The mask is mapped back to the
+original grid, handed over as an artifact and/or written as a NIfTI file,
+and summarised in a lesion statistics table.
+
+Everything runs on the CPU by default; the runner is not intended for
+clinical use.
 """
 
+import os
+import tempfile
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Tuple
+from typing import Any, Dict, Sequence, Tuple
 
 import nibabel as nib
 import numpy as np
-import pydicom
 import torch
-from monai.bundle import BundleClient
-from monai.inferers import sliding_window_inference
-from scipy.ndimage import label
+
+from common.artifacts import artifacts
+from common.tracing import span
+
+from ..backends import load_onnx
+from ..batching import MicroBatcher
+from ..inference import InferenceConfig, run_sliding_window, run_tiled
+from ..lesion_stats import lesion_stats
+from ..modalities import assemble
+from ..model_registry import registry
+from ..preprocess import preprocess
+from ..settings import (
+    BRATS_BACKEND,
+    BUNDLE_DIR,
+    INFER_BF16,
+    MICRO_BATCH,
+    MICRO_BATCH_MAX_WAIT_MS,
+    MICRO_BATCH_MAX_WINDOWS,
+    PREPROCESS,
+)
+from ..volume_cache import load_volume
 
 
 def _load_dicom_volume(study_dir: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     """Load a DICOM study into a 3D numpy array.
 
     Returns ``(volume, affine, spacing)`` where ``volume`` has shape ``(D, H, W)``
-    and spacing is expressed in millimetres.
+    and spacing is expressed in millimetres.  Decoded series are shared through
+    :mod:`experts.volume_cache`, so the volume may be a read-only memory map.
     """
 
-    files = sorted(Path(study_dir).glob("*.dcm"))
-    if not files:
-        raise FileNotFoundError(f"no DICOM files found in {study_dir}")
+    return load_volume(study_dir)
+
+
+def _load_bundle() -> tuple[torch.nn.Module, Dict[str, Any]]:
+    """Load the BraTS network with the configured backend and its config.
 
-    slices = [pydicom.dcmread(str(f)) for f in files]
-    slices.sort(key=lambda d: int(getattr(d, "InstanceNumber", 0)))
-    volume = np.stack([s.pixel_array for s in slices]).astype(np.float32)
+    Called once per process through :data:`~experts.model_registry.registry`;
+    use ``registry.get("brats")`` rather than calling this directly."""
+    if BRATS_BACKEND == "torch":
+        return _load_torchscript()
+    return load_onnx(BRATS_BACKEND)
 
-    px, py = map(float, slices[0].PixelSpacing)
-    pz = float(getattr(slices[0], "SliceThickness", 1.0))
-    spacing = np.array([px, py, pz], dtype=np.float32)
-    affine = np.diag(np.append(spacing, 1.0))
-    return volume, affine, spacing
 
+def _load_torchscript() -> tuple[torch.nn.Module, Dict[str, Any]]:
+    """Download the BraTS bundle and load its TorchScript network."""
 
-def _load_bundle() -> tuple[torch.nn.Module, tuple[int, int, int]]:
-    """Download and load the BraTS bundle returning the model and ROI size."""
+    from monai.bundle import BundleClient
 
-    client = BundleClient(name="brats_mri_segmentation", bundle_dir="/tmp/brats_bundle")
+    client = BundleClient(name="brats_mri_segmentation", bundle_dir=BUNDLE_DIR)
     client.pull()  # download if necessary
     network = client.load("model.ts")  # TorchScript model
     roi_size = tuple(client.configs["inference"].get("roi_size", (128, 128, 128)))
-    return network, roi_size
-
-
-def run_brats(study_dir: str, mask_out: str | None) -> Tuple[str, float, int]:
-    volume, affine, spacing = _load_dicom_volume(study_dir)
-
-    # network expects 4 modality input; replicate single modality if necessary
-    if volume.ndim == 3:
-        volume = np.stack([volume] * 4, axis=0)
-
-    model, roi_size = _load_bundle()
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device)
-    model.eval()
-
-    data = torch.from_numpy(volume[None]).to(device)
-    with torch.no_grad():
-        logits = sliding_window_inference(data, roi_size, 1, model)
-    mask = torch.argmax(logits, dim=1).cpu().numpy().astype(np.uint8)[0]
+    return network, {"roi_size": roi_size, "backend": "torch"}
+
+
+registry.register("brats", _load_bundle)
+
+
+def _mask_buffer(
+    shape: Sequence[int], affine: np.ndarray, job_id: str | None, scratch: Path
+) -> Tuple[np.ndarray, Dict[str, Any] | None]:
+    """Allocate the memory-mapped ``uint8`` mask filled by tiled inference.
+
+    With a ``job_id`` the mask is the job's artifact itself; otherwise it is
+    an unlinked scratch file under ``scratch``, which stays mapped until the
+    array is released."""
+    if job_id is not None:
+        mask, handle = artifacts.empty(job_id, "brats_seg", tuple(shape), np.uint8, affine, labels={"1": "Lesion"})
+        return mask, handle.to_dict()
+    scratch.mkdir(parents=True, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=".brats_mask-", suffix=".npy", dir=scratch)
+    os.close(fd)
+    try:
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=tuple(shape)), None
+    finally:
+        os.unlink(path)
+
+
+# Shared by concurrent requests so their windows are batched together; runs
+# with the service-wide autocast setting.
+batcher = MicroBatcher(
+    lambda: registry.get("brats").network,
+    max_windows=MICRO_BATCH_MAX_WINDOWS,
+    max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+    bf16=INFER_BF16,
+)
+
+
+def run_brats(
+    study_dir: str,
+    mask_out: str | None,
+    options: Dict[str, Any] | None = None,
+    job_id: str | None = None,
+) -> Dict[str, Any]:
+    """Segment the study in ``study_dir``.
+
+    With a ``job_id`` the mask is handed over through the local artifact store
+    and a NIfTI file is only written if ``mask_out`` is given; without one the
+    mask is written to ``mask_out`` (default ``<study>/../work/brats_seg.nii.gz``).
+    ``options`` override the :class:`~experts.inference.InferenceConfig`
+    defaults for this call; with micro-batching enabled the window batches
+    are run by the shared :data:`batcher`, which ignores the ``bf16`` option.
+    With a ``tile_size`` the volume is segmented tile by tile straight into a
+    memory-mapped mask (see :func:`~experts.inference.run_tiled`).  Unless
+    ``PREPROCESS`` is off the input is cropped, resampled and normalised
+    first (:mod:`experts.preprocess`) and the mask mapped back to the
+    original grid.
+
+    Returns a dict with ``seg`` (NIfTI path or ``None``), ``seg_artifact``
+    (artifact handle or ``None``), ``lesion_volume_cc``, ``num_lesions`` and
+    the full :func:`~experts.lesion_stats.lesion_stats` table as
+    ``lesion_stats``, plus the series used for each input channel under
+    ``channels``, the size of the network input under ``input_memory`` and
+    the :meth:`~experts.preprocess.Preprocessing.report` as ``preprocessing``.
+    """
+    config = InferenceConfig().with_options(options)
+    with span("decode"):
+        # one buffer per distinct series; missing channels are views
+        inputs = assemble(study_dir)
+    affine, spacing, shape = inputs.affine, inputs.spacing, inputs.volumes.shape[1:]
+    input_memory = inputs.memory()
+
+    loaded = registry.get("brats")
+    model, device = loaded.network, loaded.device
+    roi_size = loaded.config["roi_size"]
+
+    prep = None
+    if PREPROCESS:
+        with span("preprocess"):
+            inputs, prep = preprocess(inputs, roi_size, config.overlap)
 
     out = Path(mask_out) if mask_out else Path(study_dir).parent / "work" / "brats_seg.nii.gz"
-    out.parent.mkdir(parents=True, exist_ok=True)
-    nib.save(nib.Nifti1Image(mask, affine), str(out))
-
-    # compute lesion statistics
-    voxel_vol_cc = float(np.prod(spacing) / 1000.0)
-    labeled, n = label(mask > 0)
-    vol_cc = float((mask > 0).sum() * voxel_vol_cc)
-
-    return str(out), vol_cc, int(n)
+    seg_artifact = None
+    predictor = inputs.wrap(batcher if MICRO_BATCH else model)
+    with span("inference"), batcher.session() if MICRO_BATCH else nullcontext():
+        if config.tile_size:
+            mask, seg_artifact = _mask_buffer(shape, affine, job_id, out.parent)
+            # the preprocessed grid is labelled in memory, then mapped back
+            labels = np.empty(inputs.volumes.shape[1:], dtype=np.uint8) if prep else mask
+            run_tiled(predictor, inputs.tensor(), roi_size, labels, config, device)
+        else:
+            logits = run_sliding_window(predictor, inputs.tensor().to(device), roi_size, config)
+            mask = labels = torch.argmax(logits, dim=1).cpu().numpy().astype(np.uint8)[0]
+            del logits
+    if prep is not None:
+        with span("restore"):
+            mask = prep.restore(labels, out=mask if config.tile_size else None)
+
+    if job_id is not None and seg_artifact is None:
+        with span("artifact"):
+            seg_artifact = artifacts.put(job_id, "brats_seg", mask, affine, labels={"1": "Lesion"}).to_dict()
+
+    seg = None
+    if job_id is None or mask_out:
+        with span("nifti_save"):
+            out.parent.mkdir(parents=True, exist_ok=True)
+            nib.save(nib.Nifti1Image(np.asarray(mask), affine), str(out))
+        seg = str(out)
+
+    with span("lesion_stats"):
+        stats = lesion_stats(mask, spacing)
+    return {
+        "seg": seg,
+        "seg_artifact": seg_artifact,
+        "lesion_volume_cc": stats["lesion_volume_cc"],
+        "num_lesions": stats["num_lesions"],
+        "lesion_stats": stats,
+        "channels": {"sources": inputs.sources, "substituted": list(inputs.substituted)},
+        "input_memory": input_memory,
+        "preprocessing": prep.report() if prep is not None else None,
+    }
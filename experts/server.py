@@ -1,22 +1,103 @@
-from fastapi import FastAPI
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from .runners.brats_runner import run_brats
+
+from common.admission import CapacityLimiter, admission
+from common.tracing import instrument, metrics, record_spans, submit_with_context
+
+from .inference import InferenceConfig, configure_threads
+from .model_registry import registry
+from .runners.brats_runner import batcher, run_brats
+from .settings import EXPERTS_MAX_IN_FLIGHT, MICRO_BATCH_MAX_STUDIES, PRELOAD_MODELS
+from .volume_cache import volume_cache
 
 app = FastAPI()
+# a batch request holds one slot however many studies it carries
+admission(app, CapacityLimiter(EXPERTS_MAX_IN_FLIGHT, "experts"), ("/infer/",))
+instrument(app)
+
+metrics.gauge(
+    "micro_batch_active_requests", "Requests sharing the micro-batcher",
+    fn=lambda: batcher.stats()["active"],
+)
+
+
+@app.on_event("startup")
+def preload_models():
+    configure_threads()
+    registry.preload(PRELOAD_MODELS)
 
 
 class InferReq(BaseModel):
     study_dir: str
     mask_out: str | None = None
+    # gateway job the study belongs to; enables artifact handoff of the mask
+    job_id: str | None = None
+    # per-request overrides of the inference settings, e.g. {"overlap": 0.5}
+    options: Dict[str, Any] = {}
+
+
+class InferBatchReq(BaseModel):
+    studies: List[InferReq]
+
+
+def _check_options(req: InferReq) -> None:
+    try:
+        InferenceConfig().with_options(req.options)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(422, f"invalid inference options: {e}") from e
 
 
 @app.post("/infer/brats")
 def infer_brats(req: InferReq):
-    seg, vol_cc, n = run_brats(req.study_dir, req.mask_out)
-    return {"ok": True, "seg": seg, "lesion_volume_cc": vol_cc, "num_lesions": n}
+    _check_options(req)
+    with record_spans() as timings:
+        out = run_brats(req.study_dir, req.mask_out, req.options, job_id=req.job_id)
+    return {"ok": True, **out, "timings": timings}
+
+
+@app.post("/infer/brats/batch")
+def infer_brats_batch(req: InferBatchReq):
+    """Segment several studies at once; their windows share model batches."""
+    for study in req.studies:
+        _check_options(study)
+
+    def run(study: InferReq) -> Dict[str, Any]:
+        try:
+            with record_spans() as timings:
+                out = run_brats(study.study_dir, study.mask_out, study.options, job_id=study.job_id)
+        except Exception as e:
+            return {"ok": False, "study_dir": study.study_dir, "error": str(e)}
+        return {"ok": True, **out, "timings": timings}
+
+    workers = max(1, min(len(req.studies), MICRO_BATCH_MAX_STUDIES))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [submit_with_context(pool, run, study) for study in req.studies]
+        results = [f.result() for f in futures]
+    return {"ok": all(r["ok"] for r in results), "results": results}
 
 
 @app.post("/infer/wmh")
 def infer_wmh(req: InferReq):
     # Placeholder WMH implementation
-    return {"ok": True, "seg": None, "lesion_volume_cc": 0.0, "num_lesions": 0}
+    return {
+        "ok": True,
+        "seg": None,
+        "seg_artifact": None,
+        "lesion_volume_cc": 0.0,
+        "num_lesions": 0,
+        "lesion_stats": None,
+        "timings": {},
+    }
+
+
+@app.get("/models")
+def models():
+    return {**registry.stats(), "micro_batching": batcher.stats()}
+
+
+@app.get("/cache")
+def cache():
+    return volume_cache.stats()
@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+
+# Directory where MONAI bundles are downloaded and unpacked
+BUNDLE_DIR = os.getenv("BUNDLE_DIR", "/tmp/brats_bundle")
+
+# How the BraTS network runs: torch, onnx, onnx-int8-dynamic or
+# onnx-int8-static (see experts.backends); ONNX models are read from
+# BRATS_ONNX_DIR
+BRATS_BACKEND = os.getenv("BRATS_BACKEND", "torch")
+BRATS_ONNX_DIR = Path(os.getenv("BRATS_ONNX_DIR", str(Path(BUNDLE_DIR) / "onnx")))
+
+# Upper bound on the memory held by warm models, in megabytes
+MODEL_CACHE_MB = float(os.getenv("MODEL_CACHE_MB", "4096"))
+
+# Comma separated list of models to load when the service starts
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "brats").split(",") if m.strip()]
+
+# Threads used to decode DICOM slices
+DICOM_LOAD_WORKERS = int(os.getenv("DICOM_LOAD_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Job data shared with the gateway
+JOB_BASE = Path(os.getenv("JOB_BASE", "/data/jobs"))
+
+# Decoded volumes are cached here as memory-mappable .npy files
+VOLUME_CACHE_DIR = Path(os.getenv("VOLUME_CACHE_DIR", str(JOB_BASE / ".volume_cache")))
+# Size bound of the volume cache in megabytes; 0 disables caching
+VOLUME_CACHE_MB = float(os.getenv("VOLUME_CACHE_MB", "8192"))
+
+# Sliding-window inference defaults; requests may override them via ``options``
+INFER_SW_BATCH_SIZE = int(os.getenv("INFER_SW_BATCH_SIZE", "4"))
+INFER_OVERLAP = float(os.getenv("INFER_OVERLAP", "0.25"))
+INFER_BLEND_MODE = os.getenv("INFER_BLEND_MODE", "constant")
+INFER_BF16 = os.getenv("INFER_BF16", "0") == "1"
+# Edge of the cubic tiles segmented one at a time into a memory-mapped mask;
+# 0 segments the whole volume at once
+INFER_TILE_SIZE = int(os.getenv("INFER_TILE_SIZE", "0"))
+
+# Torch thread pools (0 keeps torch's default); process wide, set at startup
+INFER_INTRA_OP_THREADS = int(os.getenv("INFER_INTRA_OP_THREADS", "0"))
+INFER_INTER_OP_THREADS = int(os.getenv("INFER_INTER_OP_THREADS", "0"))
+
+# Dynamic micro-batching of sliding windows across concurrent requests
+MICRO_BATCH = os.getenv("MICRO_BATCH", "1") == "1"
+MICRO_BATCH_MAX_WINDOWS = int(os.getenv("MICRO_BATCH_MAX_WINDOWS", "16"))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+# Studies of one /infer/brats/batch request segmented concurrently
+MICRO_BATCH_MAX_STUDIES = int(os.getenv("MICRO_BATCH_MAX_STUDIES", "4"))
+
+# Inference requests handled at once; further requests are rejected with 429
+EXPERTS_MAX_IN_FLIGHT = int(os.getenv("EXPERTS_MAX_IN_FLIGHT", "4"))
+
+# Input channels of the BraTS network, in order; series are mapped to them by
+# their description (see experts.modalities)
+BRATS_CHANNELS = tuple(c.strip() for c in os.getenv("BRATS_CHANNELS", "t1c,t1,t2,flair").split(",") if c.strip())
+
+# Preprocessing in front of the BraTS network: foreground crop, resampling to
+# PREPROCESS_SPACING (mm, D/H/W) and channel-wise intensity normalisation
+PREPROCESS = os.getenv("PREPROCESS", "1") == "1"
+PREPROCESS_SPACING = tuple(float(v) for v in os.getenv("PREPROCESS_SPACING", "1.0,1.0,1.0").split(","))
+# Foreground is above this fraction of the 99th intensity percentile
+PREPROCESS_FOREGROUND = float(os.getenv("PREPROCESS_FOREGROUND", "0.05"))
+# Voxels kept around the foreground bounding box
+PREPROCESS_MARGIN = int(os.getenv("PREPROCESS_MARGIN", "4"))
@@ -0,0 +1,93 @@
+"""Stand-ins for the BraTS bundle and for real studies.
+
+:func:`stand_in_model` is a tiny network shaped like the bundle's and
+:func:`write_study` writes a synthetic DICOM series; the benchmarks and the
+``--stand-in`` mode of :mod:`experts.backends` use them where no bundle or
+sample data is at hand.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.pixels.encoders import JPEG2000LosslessEncoder
+from pydicom.uid import ExplicitVRLittleEndian, JPEG2000Lossless, MRImageStorage, generate_uid
+
+
+def stand_in_model(in_channels: int = 4, out_channels: int = 3) -> torch.nn.Module:
+    """A tiny 3D conv net roughly shaped like a segmentation network."""
+    return torch.nn.Sequential(
+        torch.nn.Conv3d(in_channels, 16, 3, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.Conv3d(16, 16, 3, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.Conv3d(16, out_channels, 1),
+    ).eval()
+
+
+def jpeg2000_available() -> bool:
+    """Whether pydicom has a JPEG 2000 encoder (pylibjpeg-openjpeg or GDCM)."""
+    return JPEG2000LosslessEncoder.is_available
+
+
+def write_study(
+    out_dir: str | Path,
+    slices: int = 64,
+    rows: int = 256,
+    cols: int = 256,
+    bits: int = 16,
+    seed: int = 0,
+    jpeg2000: bool = False,
+    suffix: str = ".dcm",
+) -> List[Path]:
+    """Write a single MR series of random slices into ``out_dir``.
+
+    Files are written in shuffled order so loaders have to sort them.  With
+    ``jpeg2000`` the pixel data is JPEG 2000 lossless compressed, which needs
+    an encoder (see :func:`jpeg2000_available`).  ``suffix=""`` writes files
+    without an extension, as found in the raw archives."""
+    if jpeg2000 and not jpeg2000_available():
+        raise RuntimeError("JPEG 2000 encoding needs pylibjpeg-openjpeg or GDCM")
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtype = np.uint8 if bits == 8 else np.uint16
+    high = min(2 ** bits, 4096)
+    study_uid, series_uid = generate_uid(), generate_uid()
+    paths = []
+    for n, z in enumerate(rng.permutation(slices)):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = MRImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = MRImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = "MR"
+        ds.SeriesDescription = "T1 synthetic"
+        ds.InstanceNumber = int(z) + 1
+        ds.Rows, ds.Columns = rows, cols
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = ds.BitsStored = bits
+        ds.HighBit = bits - 1
+        ds.PixelRepresentation = 0
+        ds.PixelSpacing = [1.0, 1.0]
+        ds.SliceThickness = 1.0
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [0, 0, float(z)]
+        pixels = rng.integers(0, high, (rows, cols), dtype=dtype)
+        ds.PixelData = pixels.tobytes()
+        if jpeg2000:
+            ds.compress(JPEG2000Lossless, pixels)
+        path = out / f"IM{n:05d}{suffix}"
+        ds.save_as(str(path), enforce_file_format=True)
+        paths.append(path)
+    return paths
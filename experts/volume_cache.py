@@ -0,0 +1,190 @@
+"""On-disk cache of decoded DICOM volumes.
+
+Entries are keyed by a hash of the series files' paths, sizes and
+modification times, so a lookup costs one ``stat`` per file rather than
+reading the series, and stored as ``volume.npy``, ``affine.npy`` and
+``spacing.npy`` under :data:`~experts.settings.VOLUME_CACHE_DIR`.  Hits are
+served with ``np.load(mmap_mode="r")`` so repeated expert calls and re-runs of
+the same study do not decode the series again.  The least recently used
+entries are removed once the cache grows beyond its size bound.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+import numpy as np
+
+from common.study_index import StudyIndex
+
+from .dicom_io import load_dicom_series, load_indexed_series, series_files
+from .settings import VOLUME_CACHE_DIR, VOLUME_CACHE_MB
+
+logger = logging.getLogger(__name__)
+
+Volume = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def series_key(files: Sequence[Path]) -> str:
+    """Return the key of a series made of ``files``.
+
+    Built from each file's absolute path, size and ``mtime_ns``: a file
+    rewritten in place gets a new key, and studies in different job
+    directories never share one."""
+    h = hashlib.blake2b(digest_size=20)
+    for f in files:
+        st = os.stat(f)
+        h.update(os.path.abspath(f).encode())
+        h.update(st.st_size.to_bytes(8, "little"))
+        h.update(st.st_mtime_ns.to_bytes(8, "little"))
+    return h.hexdigest()
+
+
+class VolumeCache:
+    """Size-bounded on-disk cache of ``(volume, affine, spacing)`` tuples."""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Volume | None:
+        entry = self.root / key
+        try:
+            volume = np.load(entry / "volume.npy", mmap_mode="r")
+            affine = np.load(entry / "affine.npy")
+            spacing = np.load(entry / "spacing.npy")
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(entry)  # mark as recently used
+        except FileNotFoundError:  # pragma: no cover - evicted concurrently
+            pass
+        return volume, affine, spacing
+
+    def get_meta(self, key: str) -> Dict[str, Any] | None:
+        """Return the metadata stored with an entry by :meth:`put`."""
+        try:
+            return json.loads((self.root / key / "meta.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(
+        self,
+        key: str,
+        volume: np.ndarray,
+        affine: np.ndarray,
+        spacing: np.ndarray,
+        meta: Dict[str, Any] | None = None,
+    ) -> Volume:
+        """Store an entry and return it memory-mapped from the cache."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        entry = self.root / key
+        tmp = self.root / f".{key}.{uuid.uuid4().hex}"
+        tmp.mkdir()
+        np.save(tmp / "volume.npy", np.ascontiguousarray(volume, dtype=np.float32))
+        np.save(tmp / "affine.npy", affine)
+        np.save(tmp / "spacing.npy", spacing)
+        if meta is not None:
+            (tmp / "meta.json").write_text(json.dumps(meta))
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another worker stored the same series first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict(keep=key)
+        cached = self.get(key)
+        return cached if cached is not None else (volume, affine, spacing)
+
+    def load(self, study_dir: str, loader: Callable[[str], Volume] = load_dicom_series) -> Volume:
+        """Return the decoded series in ``study_dir``, decoding it on a miss."""
+        if not self.enabled:
+            return loader(study_dir)
+        return self._load(series_files(study_dir), lambda: loader(study_dir))
+
+    def load_series(self, index: StudyIndex, series_uid: str) -> Volume:
+        """Return the decoded series ``series_uid`` of an indexed study."""
+        if not self.enabled:
+            return load_indexed_series(index, series_uid)
+        return self._load(index.files(series_uid), lambda: load_indexed_series(index, series_uid))
+
+    def _load(self, files: Sequence[Path], decode: Callable[[], Volume]) -> Volume:
+        key = series_key(files)
+        cached = self.get(key)
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            return cached
+        return self.put(key, *decode())
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "used_bytes": sum(size for _, _, size in entries),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _entries(self) -> list[tuple[float, Path, int]]:
+        if not self.root.exists():
+            return []
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, entry, size))
+            except FileNotFoundError:  # pragma: no cover - evicted concurrently
+                continue
+        return entries
+
+    def _evict(self, keep: str) -> None:
+        entries = sorted(self._entries())
+        used = sum(size for _, _, size in entries)
+        for _, entry, size in entries:
+            if used <= self.max_bytes:
+                break
+            if entry.name == keep:
+                continue
+            # Open memory maps stay valid after unlinking on POSIX.
+            shutil.rmtree(entry, ignore_errors=True)
+            used -= size
+            with self._lock:
+                self.evictions += 1
+            logger.info("evicted cached volume %s (%d bytes)", entry.name, size)
+
+
+volume_cache = VolumeCache(VOLUME_CACHE_DIR, max_bytes=int(VOLUME_CACHE_MB * 1024 * 1024))
+
+
+def load_volume(study_dir: str) -> Volume:
+    """Load the series in ``study_dir`` through the shared volume cache."""
+    return volume_cache.load(study_dir)
+
+
+def load_series(index: StudyIndex, series_uid: str) -> Volume:
+    """Load one series of an indexed study through the shared volume cache."""
+    return volume_cache.load_series(index, series_uid)
@@ -1,5 +1,12 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Tuple, Union
+
+import numpy as np
+
+from common.tracing import span
 
 
 def write_dicom_sr(
@@ -12,10 +19,10 @@ def write_dicom_sr(
 ) -> str:
     """Format report text and write a DICOM SR via MONAI Deploy App SDK.
 
+    The SR is stored under ``<out_dir>/sr`` and its path returned.
+
     Raises ``RuntimeError`` if the MONAI Deploy operator is unavailable or fails
     to generate an SR."""
-    out = Path(out_dir)
-    out.mkdir(parents=True, exist_ok=True)
     text = _format_sr_text(impression, findings, structured, provenance)
 
     try:
@@ -25,18 +32,20 @@ def write_dicom_sr(
             "DICOMTextSRWriterOperator is not available. Install monai-deploy-app-sdk."
         ) from e
 
-    op = DICOMTextSRWriterOperator(app=None, output_folder=out)
-    return _run_sr_writer(op, study_dir, text)
+    with span("write_sr"), _staging(out_dir, "sr") as (staging, dest):
+        op = DICOMTextSRWriterOperator(app=None, output_folder=staging)
+        return _publish(_run_sr_writer(op, study_dir, text), dest)
 
 
-def write_dicom_seg(study_dir: str, seg_nifti: str, out_dir: str) -> str:
-    """Write a DICOM SEG from a NIfTI mask using MONAI Deploy App SDK.
+def write_dicom_seg(study_dir: str, seg: Union[str, np.ndarray], out_dir: str) -> str:
+    """Write a DICOM SEG from a mask using MONAI Deploy App SDK.
+
+    ``seg`` is either the path of a NIfTI mask or the mask array itself, e.g.
+    one mapped from the artifact store, which avoids re-reading the file.  The
+    SEG is stored under ``<out_dir>/seg`` and its path returned.
 
     Raises ``RuntimeError`` if the MONAI Deploy operator is unavailable or fails
     to generate a SEG."""
-    out = Path(out_dir)
-    out.mkdir(parents=True, exist_ok=True)
-
     try:
         from monai.deploy.operators import DICOMSegmentationWriterOperator
     except Exception as e:  # pragma: no cover - import guarded
@@ -44,8 +53,32 @@ def write_dicom_seg(study_dir: str, seg_nifti: str, out_dir: str) -> str:
             "DICOMSegmentationWriterOperator is not available. Install monai-deploy-app-sdk."
         ) from e
 
-    op = DICOMSegmentationWriterOperator(app=None, output_folder=out, segment_descriptions=["Lesion"])
-    return _run_seg_writer(op, study_dir, seg_nifti)
+    with span("write_seg"), _staging(out_dir, "seg") as (staging, dest):
+        op = DICOMSegmentationWriterOperator(app=None, output_folder=staging, segment_descriptions=["Lesion"])
+        return _publish(_run_seg_writer(op, study_dir, seg), dest)
+
+
+@contextmanager
+def _staging(out_dir: str, kind: str) -> Iterator[Tuple[Path, Path]]:
+    """Yield a private folder for one writer call and ``<out_dir>/<kind>``.
+
+    The operators name their output themselves; writing into an empty folder
+    of its own tells each call exactly which file it produced, even when the
+    SR and SEG of a study are written concurrently."""
+    dest = Path(out_dir) / kind
+    dest.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=dest))
+    try:
+        yield staging, dest
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _publish(path: str, dest: Path) -> str:
+    """Move a writer's output from its staging folder to ``dest``."""
+    target = dest / Path(path).name
+    Path(path).replace(target)
+    return str(target)
 
 
 def _format_sr_text(impression: str, findings: List[str], structured: Dict[str, Any], provenance: Dict[str, Any]) -> str:
@@ -57,6 +90,15 @@ def _format_sr_text(impression: str, findings: List[str], structured: Dict[str,
     return "\n".join(lines)
 
 
+def _single_output(folder: Path, what: str) -> str:
+    outputs = list(Path(folder).glob("*.dcm"))
+    if not outputs:
+        raise RuntimeError(f"DICOM {what} writer produced no output")
+    if len(outputs) > 1:
+        raise RuntimeError(f"DICOM {what} writer produced {len(outputs)} files")
+    return str(outputs[0])
+
+
 def _run_sr_writer(op, study_dir: str, text: str) -> str:
     """Helper to invoke :class:`DICOMTextSRWriterOperator`.
 
@@ -66,24 +108,16 @@ def _run_sr_writer(op, study_dir: str, text: str) -> str:
         op(study_list=[study_dir], text=text)
     except Exception as e:
         raise RuntimeError("Failed to write DICOM SR") from e
-
-    outputs = sorted(Path(op.output_folder).glob("*.dcm"))
-    if not outputs:
-        raise RuntimeError("DICOM SR writer produced no output")
-    return str(outputs[0])
+    return _single_output(op.output_folder, "SR")
 
 
-def _run_seg_writer(op, study_dir: str, seg_nifti: str) -> str:
+def _run_seg_writer(op, study_dir: str, seg: Union[str, np.ndarray]) -> str:
     """Helper to invoke :class:`DICOMSegmentationWriterOperator`.
 
     Returns the path to the generated SEG and surfaces any errors from the
     underlying operator."""
     try:
-        op(study_list=[study_dir], seg_image=seg_nifti)
+        op(study_list=[study_dir], seg_image=seg)
     except Exception as e:
         raise RuntimeError("Failed to write DICOM SEG") from e
-
-    outputs = sorted(Path(op.output_folder).glob("*.dcm"))
-    if not outputs:
-        raise RuntimeError("DICOM SEG writer produced no output")
-    return str(outputs[0])
+    return _single_output(op.output_folder, "SEG")
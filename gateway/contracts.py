@@ -8,6 +8,7 @@ class AgentAnalyzeReq(BaseModel):
     tools: List[str] = ["brats"]
     constraints: Dict[str, Any] = {}
     abnormal_threshold_cc: Optional[float] = None
+    job_id: Optional[str] = None
 
 
 class AgentAnalyzeResp(BaseModel):
@@ -18,3 +19,5 @@ class AgentAnalyzeResp(BaseModel):
     structured: Dict[str, Any]
     provenance: Dict[str, Any]
     aux: Optional[Dict[str, Any]] = None
+    # stage durations (seconds) measured by the agent and the experts
+    timings: Dict[str, float] = {}
@@ -0,0 +1,100 @@
+"""Study archive ingestion: streamed storage and pooled extraction.
+
+Uploads are copied to the job directory in fixed-size chunks while their
+SHA-256 is computed, so the event loop never holds a whole archive.  This is
+not streaming from the socket: by the time the handler runs, Starlette has
+already spooled the multipart body to a temporary file, so the copy is a
+second one.  The gateway deletes the copy once it is extracted.  Member
+validation and extraction run in :data:`pool`; only DICOM members are kept and
+large archives are split across several workers, each with its own
+``ZipFile`` handle.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from .settings import INGEST_WORKERS, UPLOAD_CHUNK_BYTES
+
+# Archives with at least this many DICOM members are extracted in parallel
+PARALLEL_MIN_MEMBERS = 64
+
+pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+
+async def stream_to_disk(upload: UploadFile, dest: Path) -> Tuple[str, int]:
+    """Copy the spooled ``upload`` to ``dest`` chunk by chunk.
+
+    Returns the SHA-256 hex digest and the number of bytes written."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest, "wb") as fp:
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+            await run_in_threadpool(fp.write, chunk)
+            size += len(chunk)
+        await run_in_threadpool(fp.flush)
+    return digest.hexdigest(), size
+
+
+def _is_dicom_member(z: zipfile.ZipFile, info: zipfile.ZipInfo) -> bool:
+    if info.filename.lower().endswith(".dcm"):
+        return True
+    if info.file_size < 132:
+        return False
+    with z.open(info) as fp:
+        return fp.read(132)[128:] == b"DICM"
+
+
+def list_dicom_members(archive: Path, dest: Path) -> List[str]:
+    """Return the DICOM members of ``archive``.
+
+    Raises ``ValueError`` if the file is not a ZIP archive or a member would be
+    extracted outside ``dest``."""
+    if not zipfile.is_zipfile(archive):
+        raise ValueError("invalid ZIP file")
+    root = dest.resolve()
+    with zipfile.ZipFile(archive) as z:
+        members = []
+        for info in z.infolist():
+            member_path = (dest / info.filename).resolve()
+            if not member_path.is_relative_to(root):
+                raise ValueError("invalid file path in zip")
+            if not info.is_dir() and _is_dicom_member(z, info):
+                members.append(info.filename)
+    return members
+
+
+def _extract_members(archive: Path, members: List[str], dest: Path) -> None:
+    with zipfile.ZipFile(archive) as z:
+        for member in members:
+            target = dest / member
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with z.open(member) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, UPLOAD_CHUNK_BYTES)
+
+
+def extract_dicom(archive: Path, dest: Path, members: List[str] | None = None) -> int:
+    """Extract the DICOM members of ``archive`` into ``dest``.
+
+    Returns the number of extracted files.  Must be called from a worker
+    thread, never from the event loop."""
+    if members is None:
+        members = list_dicom_members(archive, dest)
+    workers = INGEST_WORKERS if len(members) >= PARALLEL_MIN_MEMBERS else 1
+    if workers == 1:
+        _extract_members(archive, members, dest)
+    else:
+        # zlib releases the GIL, so threads decompress members in parallel
+        parts = [members[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers) as extractors:
+            list(extractors.map(lambda part: _extract_members(archive, part, dest), parts))
+    return len(members)
@@ -0,0 +1,144 @@
+"""Bounded background execution of analysis jobs.
+
+``POST /analyze`` only enqueues work; a fixed pool of worker threads drives
+the agent call and the SR/SEG writing.  Jobs wait in one FIFO per priority.
+Workers always take the highest priority job whose priority is below its
+concurrency limit, so a burst of low priority studies cannot occupy every
+worker.  With ``max_queued`` set, :meth:`JobQueue.submit` refuses jobs
+beyond that backlog with :class:`QueueFull` instead of letting it grow.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable, Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("high", "normal", "low")
+
+Task = Tuple[str, Callable[[], None]]
+
+# Weight of the latest job in the job duration average
+EWMA_WEIGHT = 0.2
+
+
+class QueueFull(Exception):
+    """The backlog is at ``max_queued``; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"analysis queue is full; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    def __init__(self, workers: int, limits: Dict[str, int] | None = None, max_queued: int = 0):
+        self.workers = workers
+        self.limits = {p: (limits or {}).get(p, workers) for p in PRIORITIES}
+        # 0 leaves the backlog unbounded
+        self.max_queued = max_queued
+        self._job_s: float | None = None
+        self._queues: Dict[str, Deque[Task]] = {p: deque() for p in PRIORITIES}
+        self._running: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._cond = Condition()
+        self._threads: List[Thread] = []
+        self._stopping = False
+
+    def start(self) -> None:
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                t = Thread(target=self._work, name=f"analyze-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout: float | None = None) -> List[str]:
+        """Stop the workers after their current job; queued jobs are dropped.
+
+        Returns the ids of the dropped jobs so their owner can settle them."""
+        with self._cond:
+            self._stopping = True
+            dropped = [job_id for p in PRIORITIES for job_id, _ in self._queues[p]]
+            for q in self._queues.values():
+                q.clear()
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for t in threads:
+            t.join(timeout)
+        return dropped
+
+    def submit(self, job_id: str, fn: Callable[[], None], priority: str = "normal") -> int:
+        """Queue ``fn`` for ``job_id``; returns the number of jobs ahead of it.
+
+        Raises :class:`QueueFull` if ``max_queued`` jobs are waiting."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority: {priority}")
+        self.start()
+        with self._cond:
+            if self.max_queued and sum(len(q) for q in self._queues.values()) >= self.max_queued:
+                raise QueueFull(self.retry_after())
+            ahead = sum(len(self._queues[p]) for p in PRIORITIES[: PRIORITIES.index(priority) + 1])
+            self._queues[priority].append((job_id, fn))
+            self._cond.notify()
+        return ahead
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                p: {"queued": len(self._queues[p]), "running": self._running[p], "limit": self.limits[p]}
+                for p in PRIORITIES
+            }
+
+    def retry_after(self) -> int:
+        """Seconds until a worker is likely to take the next job.
+
+        With every worker busy one frees up about every ``job duration /
+        workers`` seconds."""
+        return max(1, math.ceil((self._job_s or 1.0) / self.workers))
+
+    def _next(self) -> Tuple[str, Task] | None:
+        for p in PRIORITIES:
+            if self._queues[p] and self._running[p] < self.limits[p]:
+                return p, self._queues[p].popleft()
+        return None
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    picked = self._next()
+                    if picked is not None:
+                        break
+                    self._cond.wait()
+                priority, (job_id, fn) = picked
+                self._running[priority] += 1
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception:
+                logger.exception("job %s failed", job_id)
+            finally:
+                seconds = time.perf_counter() - start
+                with self._cond:
+                    self._running[priority] -= 1
+                    prev = self._job_s
+                    self._job_s = seconds if prev is None else prev + EWMA_WEIGHT * (seconds - prev)
+                    # a slot for this priority opened up
+                    self._cond.notify_all()
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parse ``"high=2,normal=2,low=1"`` into a limits mapping."""
+    limits = {}
+    for part in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, value = part.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
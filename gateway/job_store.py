@@ -1,56 +1,244 @@
 import sqlite3
 import json
+import threading
+import time
 from pathlib import Path
-from threading import Lock
+from typing import Any, Dict, List, Optional, Sequence
 from .settings import JOB_DB
 
+_COLUMNS = {
+    "id": "TEXT PRIMARY KEY",
+    "state": "TEXT",
+    "paths": "TEXT",
+    "result": "TEXT",
+    "created_at": "REAL",
+    "updated_at": "REAL",
+    "stage": "TEXT",
+    "request_id": "TEXT",
+    "timings": "TEXT",
+    # sha256 of the uploaded archive, for deduplicating re-uploads
+    "content_hash": "TEXT",
+    # PIPELINE_VERSION that produced the stored result
+    "pipeline_version": "TEXT",
+}
+
+
 class JobStore:
+    """SQLite-backed job state.
+
+    The database runs in WAL mode so readers never block the writer, and each
+    thread uses its own connection instead of sharing one behind a lock.
+    ``db_path`` must therefore be a file, not ``:memory:``."""
+
     def __init__(self, db_path: Path = JOB_DB):
-        self._conn = sqlite3.connect(db_path, check_same_thread=False)
-        self._conn.execute(
-            """CREATE TABLE IF NOT EXISTS jobs (
-            id TEXT PRIMARY KEY,
-            state TEXT,
-            paths TEXT,
-            result TEXT
-            )"""
-        )
-        self._lock = Lock()
+        self._db_path = str(db_path)
+        self._local = threading.local()
+        conn = self._conn
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                + ", ".join(f"{name} {decl}" for name, decl in _COLUMNS.items())
+                + ")"
+            )
+            # databases created before the newer columns existed
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, decl in _COLUMNS.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET created_at=COALESCE(created_at, ?), updated_at=COALESCE(updated_at, ?)"
+                " WHERE updated_at IS NULL",
+                (now, now),
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state_updated_at ON jobs (state, updated_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_stage ON jobs (stage)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_content_hash ON jobs (content_hash, created_at)")
+            # header-only index of each study's instances (see common.study_index)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS instances ("
+                "job_id TEXT, path TEXT, series_uid TEXT, modality TEXT, series_description TEXT, record TEXT,"
+                " PRIMARY KEY (job_id, path))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS instances_series ON instances (job_id, series_uid)")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_path, timeout=30)
+            # WAL makes NORMAL durable across application crashes
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
 
-    def create(self, job_id: str, paths: dict, state: str = "uploaded"):
-        with self._lock:
-            self._conn.execute(
-                "INSERT INTO jobs (id, state, paths, result) VALUES (?, ?, ?, ?)",
-                (job_id, state, json.dumps(paths), None),
+    def create(
+        self,
+        job_id: str,
+        paths: dict,
+        state: str = "uploaded",
+        request_id: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ) -> str:
+        """Insert a job and return its id.
+
+        With a ``content_hash`` the id of an existing job with the same
+        content is returned instead, unless that job could not be extracted;
+        the check and the insert are one transaction."""
+        now = time.time()
+        with self._conn as conn:
+            if content_hash is not None:
+                conn.execute("BEGIN IMMEDIATE")
+                existing = self._find_by_hash(conn, content_hash)
+                if existing is not None:
+                    return existing
+            conn.execute(
+                "INSERT INTO jobs (id, state, paths, result, created_at, updated_at, request_id, content_hash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, state, json.dumps(paths), None, now, now, request_id, content_hash),
             )
-            self._conn.commit()
+        return job_id
+
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        """Return the newest usable job uploaded with ``content_hash``."""
+        return self._find_by_hash(self._conn, content_hash)
 
-    def update_state(self, job_id: str, state: str):
-        with self._lock:
-            self._conn.execute(
-                "UPDATE jobs SET state=? WHERE id=?",
-                (state, job_id),
+    @staticmethod
+    def _find_by_hash(conn: sqlite3.Connection, content_hash: str) -> Optional[str]:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE content_hash=? AND state != 'extract_failed'"
+            " ORDER BY created_at DESC LIMIT 1",
+            (content_hash,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def transition(self, job_id: str, state: str, from_states: Sequence[str]) -> bool:
+        """Set ``state`` only if the job is in one of ``from_states``.
+
+        Returns whether it was set; concurrent callers cannot both succeed."""
+        marks = ",".join("?" * len(from_states))
+        with self._conn as conn:
+            cur = conn.execute(
+                f"UPDATE jobs SET state=?, updated_at=? WHERE id=? AND state IN ({marks})",
+                (state, time.time(), job_id, *from_states),
             )
-            self._conn.commit()
+        return cur.rowcount == 1
 
-    def set_result(self, job_id: str, result: dict, state: str = "done"):
-        with self._lock:
-            self._conn.execute(
-                "UPDATE jobs SET state=?, result=? WHERE id=?",
-                (state, json.dumps(result), job_id),
+    def update_state(self, job_id: str, state: str, stage: Optional[str] = None):
+        with self._conn as conn:
+            conn.execute(
+                "UPDATE jobs SET state=?, stage=COALESCE(?, stage), updated_at=? WHERE id=?",
+                (state, stage, time.time(), job_id),
+            )
+
+    def set_stage(self, job_id: str, stage: str):
+        with self._conn as conn:
+            conn.execute(
+                "UPDATE jobs SET stage=?, updated_at=? WHERE id=?",
+                (stage, time.time(), job_id),
+            )
+
+    def set_timings(self, job_id: str, timings: Dict[str, float]):
+        """Store the durations (seconds) of the stages run before the analysis."""
+        with self._conn as conn:
+            conn.execute("UPDATE jobs SET timings=? WHERE id=?", (json.dumps(timings), job_id))
+
+    def add_instances(self, job_id: str, records: List[Dict[str, Any]]):
+        """Store the study index records of ``job_id``."""
+        with self._conn as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO instances (job_id, path, series_uid, modality, series_description, record)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, r["path"], r["series_uid"], r["modality"], r["series_description"], json.dumps(r))
+                    for r in records
+                ],
+            )
+
+    def instances(self, job_id: str, series_uid: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = "SELECT record FROM instances WHERE job_id=?"
+        params: list = [job_id]
+        if series_uid is not None:
+            query += " AND series_uid=?"
+            params.append(series_uid)
+        return [json.loads(record) for (record,) in self._conn.execute(query + " ORDER BY path", params)]
+
+    def series(self, job_id: str) -> List[Dict[str, Any]]:
+        """Return the series of a job's study with their instance counts, largest first."""
+        rows = self._conn.execute(
+            "SELECT series_uid, MIN(modality), MIN(series_description), COUNT(*) FROM instances"
+            " WHERE job_id=? GROUP BY series_uid ORDER BY COUNT(*) DESC, series_uid",
+            (job_id,),
+        )
+        return [
+            {"series_uid": uid, "modality": modality, "description": description, "instances": n}
+            for uid, modality, description, n in rows
+        ]
+
+    def set_result(self, job_id: str, result: dict, state: str = "done", pipeline_version: Optional[str] = None):
+        with self._conn as conn:
+            conn.execute(
+                "UPDATE jobs SET state=?, result=?, stage=NULL, updated_at=?, pipeline_version=? WHERE id=?",
+                (state, json.dumps(result), time.time(), pipeline_version, job_id),
             )
-            self._conn.commit()
 
     def get(self, job_id: str):
         cur = self._conn.execute(
-            "SELECT state, paths, result FROM jobs WHERE id=?", (job_id,)
+            "SELECT state, paths, result, stage, created_at, updated_at, request_id, timings, content_hash,"
+            " pipeline_version FROM jobs WHERE id=?",
+            (job_id,),
         )
         row = cur.fetchone()
         if not row:
             return None
-        state, paths, result = row
+        state, paths, result, stage, created_at, updated_at, request_id, timings, content_hash, version = row
         return {
             "state": state,
             "paths": json.loads(paths),
             "result": json.loads(result) if result else None,
+            "stage": stage,
+            "created_at": created_at,
+            "updated_at": updated_at,
+            "request_id": request_id,
+            "timings": json.loads(timings) if timings else {},
+            "content_hash": content_hash,
+            "pipeline_version": version,
         }
+
+    def list(self, limit: int = 50, offset: int = 0, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return a page of jobs, newest first, without their results."""
+        query = "SELECT id, state, stage, created_at, updated_at FROM jobs"
+        params: list = []
+        if state is not None:
+            query += " WHERE state=?"
+            params.append(state)
+        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return [
+            {"job_id": job_id, "state": st, "stage": stage, "created_at": created, "updated_at": updated}
+            for job_id, st, stage, created, updated in self._conn.execute(query, params)
+        ]
+
+    def in_states(self, states: Sequence[str]) -> List[str]:
+        """Return the ids of the jobs in one of ``states``."""
+        marks = ",".join("?" * len(states))
+        return [job_id for (job_id,) in self._conn.execute(f"SELECT id FROM jobs WHERE state IN ({marks})", states)]
+
+    def prune(self, older_than: float) -> List[Dict[str, Any]]:
+        """Delete jobs last updated before ``older_than`` (epoch seconds).
+
+        Any state qualifies: finished jobs, uploads that were never analysed
+        and analyses left in flight by a crash alike.  Returns the ids and
+        paths of the deleted jobs so their files can be removed."""
+        rows = self._conn.execute("SELECT id, paths FROM jobs WHERE updated_at < ?", (older_than,)).fetchall()
+        pruned = []
+        with self._conn as conn:
+            for job_id, paths in rows:
+                # re-check in case the job was updated in the meantime
+                cur = conn.execute("DELETE FROM jobs WHERE id=? AND updated_at < ?", (job_id, older_than))
+                if cur.rowcount:
+                    conn.execute("DELETE FROM instances WHERE job_id=?", (job_id,))
+                    pruned.append({"job_id": job_id, "paths": json.loads(paths)})
+        return pruned
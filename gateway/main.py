@@ -1,39 +1,136 @@
 import json
 import logging
+import shutil
+import time
 import uuid
-import zipfile
 from pathlib import Path
+from typing import Optional
 
 import requests
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+from common.artifacts import artifacts
+from common.client import ResilientClient
+from common.study_index import build_index, index_path
+from common.tracing import (
+    bind_request_id,
+    get_request_id,
+    instrument,
+    metrics,
+    observe_stage,
+    propagation_headers,
+    record_spans,
+    span,
+    submit_with_context,
+)
 
 from .contracts import AgentAnalyzeReq, AgentAnalyzeResp
-from .app_sdk_io import write_dicom_sr, write_dicom_seg
-from .settings import BASE, ABNORMAL_THRESHOLD_CC
+from .reports import submit_report_objects, when_written
+from .settings import (
+    BASE,
+    ABNORMAL_THRESHOLD_CC,
+    AGENT_BREAKER_FAILURES,
+    AGENT_BREAKER_RESET_S,
+    AGENT_RETRIES,
+    ANALYZE_LIMITS,
+    ANALYZE_QUEUE_LIMIT,
+    ANALYZE_WORKERS,
+    INGEST_WORKERS,
+    JOB_RETENTION_DAYS,
+    JOB_RETENTION_INTERVAL_S,
+    PIPELINE_VERSION,
+)
 from .job_store import JobStore
+from .job_queue import JobQueue, PRIORITIES, QueueFull, parse_limits
+from .retention import RetentionTask
+from .ingest import extract_dicom, list_dicom_members, pool as ingest_pool, stream_to_disk
 
 AGENT_URL = "http://agent:8001/analyze"
 
+# Download of a DICOM object that is still being written
+PENDING = "pending"
+DOWNLOAD_KINDS = {"dicom_sr": "sr", "dicom_seg": "seg"}
+
+# States of a job whose analysis is under way; new requests join it
+IN_FLIGHT_STATES = ("queued", "running", "reporting")
+
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+instrument(app)
 
 logger = logging.getLogger(__name__)
 store = JobStore()
+jobs = JobQueue(ANALYZE_WORKERS, parse_limits(ANALYZE_LIMITS), max_queued=ANALYZE_QUEUE_LIMIT)
+# only the analysis workers call the agent
+agent = ResilientClient(
+    "agent",
+    max_concurrency=ANALYZE_WORKERS,
+    retries=AGENT_RETRIES,
+    breaker_failures=AGENT_BREAKER_FAILURES,
+    breaker_reset_s=AGENT_BREAKER_RESET_S,
+)
+retention = RetentionTask(store, JOB_RETENTION_DAYS * 86400, JOB_RETENTION_INTERVAL_S)
+
+metrics.gauge(
+    "analysis_jobs_queued", "Analysis jobs waiting for a worker", ("priority",),
+    fn=lambda: {(p,): s["queued"] for p, s in jobs.stats().items()},
+)
+metrics.gauge(
+    "analysis_jobs_running", "Analysis jobs being run", ("priority",),
+    fn=lambda: {(p,): s["running"] for p, s in jobs.stats().items()},
+)
+
+
+def recover_jobs() -> None:
+    """Settle jobs a previous gateway process left unfinished.
+
+    Their queue and threads died with it, so nothing would ever move them on
+    and ``/analyze`` would keep coalescing onto them."""
+    error = "interrupted by a gateway restart"
+    for job_id in store.in_states(("queued", "running")):
+        _fail(job_id, error)
+    for job_id in store.in_states(("reporting",)):
+        job = store.get(job_id)
+        result = job["result"]
+        if not result or result.get("state") != "reporting":
+            _fail(job_id, error)
+            continue
+        # the findings were published; only the DICOM objects being written are lost
+        for name, link in result["downloads"].items():
+            if link == PENDING:
+                result["downloads"][name] = None
+        result.update(state="failed", error=error)
+        _publish(job_id, job["paths"], result, result.get("timings") or {}, state="failed")
+    for job_id in store.in_states(("extracting",)):
+        store.update_state(job_id, "extract_failed")
+
+
+@app.on_event("startup")
+def start_workers():
+    recover_jobs()
+    jobs.start()
+    retention.start()
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    for job_id in jobs.stop():
+        _fail(job_id, "gateway stopped before the analysis ran")
+    retention.stop()
 
 
 @app.post("/upload")
 async def upload(study: UploadFile = File(...)):
     if study.content_type != "application/zip":
         raise HTTPException(400, "file must be a ZIP archive")
-    study.file.seek(0)
-    if not zipfile.is_zipfile(study.file):
-        raise HTTPException(400, "invalid ZIP file")
 
     job_id = str(uuid.uuid4())
     job = BASE / job_id
@@ -43,27 +140,130 @@ async def upload(study: UploadFile = File(...)):
     for p in (dcm, work, out):
         p.mkdir(parents=True, exist_ok=True)
 
-    study.file.seek(0)
-    with zipfile.ZipFile(study.file) as z:
-        for member in z.namelist():
-            member_path = (dcm / member).resolve()
-            if not str(member_path).startswith(str(dcm.resolve())):
-                raise HTTPException(400, "invalid file path in zip")
-            z.extract(member, dcm)
+    archive = job / "study.zip"
+    # the id of this request follows the job through the agent and experts
+    request_id = get_request_id()
+    with record_spans() as timings:
+        with span("upload"):
+            sha256, size = await stream_to_disk(study, archive)
+        # a re-upload (e.g. a PACS retry) maps to the job of the same content
+        existing = store.find_by_hash(sha256)
+        if existing is not None:
+            return _duplicate(job, existing, sha256, request_id)
+        try:
+            with span("validate"):
+                members = await run_in_threadpool(list_dicom_members, archive, dcm)
+        except ValueError as e:
+            shutil.rmtree(job, ignore_errors=True)
+            raise HTTPException(400, str(e)) from e
+
+    paths = {"dicom": str(dcm), "work": str(work), "out": str(out)}
+    stored = store.create(job_id, paths, state="extracting", request_id=request_id, content_hash=sha256)
+    if stored != job_id:
+        return _duplicate(job, stored, sha256, request_id)
+    submit_with_context(ingest_pool, _extract, job_id, archive, dcm, members, timings)
+    logger.info("stored upload %s (%d bytes, sha256=%s, request %s)", job_id, size, sha256, request_id)
+    return {"job_id": job_id, "sha256": sha256, "request_id": request_id, "duplicate": False}
+
+
+def _duplicate(job: Path, existing: str, sha256: str, request_id: str) -> dict:
+    shutil.rmtree(job, ignore_errors=True)
+    logger.info("upload with sha256=%s is a duplicate of job %s (request %s)", sha256, existing, request_id)
+    return {"job_id": existing, "sha256": sha256, "request_id": request_id, "duplicate": True}
+
+
+def _extract(job_id: str, archive: Path, dcm: Path, members: list, timings: dict) -> None:
+    try:
+        with record_spans(timings):
+            with span("extract"):
+                n = extract_dicom(archive, dcm, members)
+            # one header pass shared by every later stage
+            with span("index"):
+                index = build_index(dcm, workers=INGEST_WORKERS)
+                index.save(index_path(dcm))
+                store.add_instances(job_id, index.instances)
+    except Exception:
+        logger.exception("extraction failed for job %s", job_id)
+        store.update_state(job_id, "extract_failed")
+        return
+    # the extracted tree is all later stages read
+    archive.unlink(missing_ok=True)
+    logger.info(
+        "extracted %d DICOM files for job %s (%d instances in %d series)",
+        n, job_id, len(index.instances), len(index.series()),
+    )
+    store.set_timings(job_id, timings)
+    store.update_state(job_id, "uploaded")
 
-    store.create(job_id, {"dicom": str(dcm), "work": str(work), "out": str(out)})
-    return {"job_id": job_id}
 
+@app.post("/analyze/{job_id}", status_code=202)
+def analyze(job_id: str, anatomy: dict, response: Response):
+    """Queue the analysis of ``job_id``.
 
-@app.post("/analyze/{job_id}")
-def analyze(job_id: str, anatomy: dict):
+    A job that is already being analysed is not queued again: the request
+    joins the running analysis (``coalesced``).  A finished result of the
+    current ``PIPELINE_VERSION`` is reused (``cached``) unless ``force`` is
+    set; both answer 200 instead of 202.  With ``ANALYZE_QUEUE_LIMIT``
+    analyses waiting, new ones are rejected with 429 and ``Retry-After``."""
     job = store.get(job_id)
     if not job:
         raise HTTPException(404, "job not found")
-    paths = job["paths"]
+    if job["state"] == "extracting":
+        raise HTTPException(409, "study is still being extracted")
+    if job["state"] == "extract_failed":
+        raise HTTPException(409, "study could not be extracted")
+    priority = anatomy.get("priority", "normal")
+    if priority not in PRIORITIES:
+        raise HTTPException(400, f"priority must be one of {', '.join(PRIORITIES)}")
+
+    if job["state"] == "done" and job["pipeline_version"] == PIPELINE_VERSION and not anatomy.get("force"):
+        response.status_code = 200
+        return {"job_id": job_id, "state": "done", "cached": True}
+    # only one request moves the job out of its current state
+    if job["state"] in IN_FLIGHT_STATES or not store.transition(job_id, "queued", from_states=(job["state"],)):
+        response.status_code = 200
+        return {"job_id": job_id, "state": store.get(job_id)["state"], "coalesced": True}
+
+    queued_at = time.perf_counter()
+    try:
+        ahead = jobs.submit(
+            job_id,
+            lambda: _run_job(job_id, job, anatomy.get("anatomy", "brain"), queued_at),
+            priority=priority,
+        )
+    except QueueFull as e:
+        store.transition(job_id, job["state"], from_states=("queued",))
+        raise HTTPException(429, str(e), headers={"Retry-After": str(e.retry_after)}) from e
+    return {"job_id": job_id, "state": "queued", "queue_position": ahead, "cached": False, "coalesced": False}
+
+
+def _run_job(job_id: str, job: dict, anatomy: str, queued_at: float) -> None:
+    # Hold the job's artifacts (e.g. the mask mapped by the SEG writer) for
+    # the duration of the analysis; they are removed on release.
+    artifacts.acquire(job_id)
+    try:
+        with bind_request_id(job.get("request_id")), record_spans(dict(job.get("timings") or {})) as timings:
+            observe_stage("queue_wait", time.perf_counter() - queued_at)
+            _run_analysis(job_id, job["paths"], anatomy, timings)
+    except Exception:
+        logger.exception("analysis of job %s failed", job_id)
+        _fail(job_id, "internal error")
+    finally:
+        artifacts.release(job_id)
+
+
+def _run_analysis(job_id: str, paths: dict, anatomy: str, timings: dict) -> None:
+    """Run the agent for ``job_id`` and start writing its DICOM SR/SEG.
+
+    Executed by a :data:`jobs` worker through :func:`_run_job`; the outcome
+    is published through the job store and polled via ``/result/{job_id}``.
+    The result is published in state ``reporting`` with the DICOM downloads
+    ``pending`` as soon as the agent answers, and completed by the report
+    writers.  Stage durations are collected in ``timings`` and stored with
+    the result."""
     payload = AgentAnalyzeReq(
         study_dir=paths["dicom"],
-        anatomy=anatomy.get("anatomy", "brain"),
+        anatomy=anatomy,
         tools=["brats", "wmh"],
         constraints={
             "style": "radiology-impression-first",
@@ -72,57 +272,105 @@ def analyze(job_id: str, anatomy: dict):
             "regulatory_disclaimer": True,
         },
         abnormal_threshold_cc=ABNORMAL_THRESHOLD_CC,
+        job_id=job_id,
     ).dict()
-    store.update_state(job_id, "running")
+    store.update_state(job_id, "running", stage="agent")
     try:
-        r = requests.post(AGENT_URL, json=payload, timeout=600)
-        r.raise_for_status()
-        data = r.json()
-    except requests.RequestException as e:
+        with span("agent"):
+            r = agent.post(AGENT_URL, json=payload, timeout=600, headers=propagation_headers())
+            r.raise_for_status()
+            data = r.json()
+    except requests.RequestException:
         logger.exception("agent request failed")
-        raise HTTPException(502, "agent request failed") from e
-    except ValueError as e:
+        return _fail(job_id, "agent request failed")
+    except ValueError:
         logger.exception("invalid JSON from agent")
-        raise HTTPException(502, "invalid agent response") from e
+        return _fail(job_id, "invalid agent response")
     resp = AgentAnalyzeResp(**data)
+    # stages timed by the agent and, through it, the experts
+    timings.update(resp.timings)
 
-    # Write DICOM SR/SEG via App SDK
-    sr_path = write_dicom_sr(
-        study_dir=paths["dicom"],
-        impression=resp.impression,
-        findings=resp.findings,
-        structured=resp.structured,
-        provenance=resp.provenance,
-        out_dir=paths["out"],
-    )
-    seg_path = None
+    aux = resp.aux or {}
+    seg = None
     if (
         not resp.normal
         and resp.structured.get("lesion_volume_cc", 0) > ABNORMAL_THRESHOLD_CC
-        and (resp.aux or {}).get("seg_nifti")
+        and (aux.get("seg_artifact") or aux.get("seg_nifti"))
     ):
-        seg_path = write_dicom_seg(
-            study_dir=paths["dicom"],
-            seg_nifti=resp.aux["seg_nifti"],
-            out_dir=paths["out"],
-        )
+        # map the mask handed over by the expert instead of re-reading NIfTI
+        seg = artifacts.open(aux["seg_artifact"]) if aux.get("seg_artifact") else aux["seg_nifti"]
 
     result = {
         "job_id": job_id,
-        "state": "done",
+        "state": "reporting",
         "normal": resp.normal,
         "confidence": resp.confidence,
         "impression": resp.impression,
         "findings": resp.findings,
         "downloads": {
-            "dicom_sr": f"/download/sr/{Path(sr_path).name}",
-            "dicom_seg": f"/download/seg/{Path(seg_path).name}" if seg_path else None,
+            "dicom_sr": PENDING,
+            "dicom_seg": PENDING if seg is not None else None,
             "json": f"/download/json/{job_id}.json",
         },
+        "request_id": get_request_id(),
+        "pipeline_version": PIPELINE_VERSION,
     }
+    # the findings are final; publish them while the DICOM objects are written
+    _publish(job_id, paths, result, timings, state="reporting")
+
+    # held until the SEG writer is done with the mapped mask
+    artifacts.acquire(job_id)
+    try:
+        futures = submit_report_objects(
+            paths["dicom"],
+            paths["out"],
+            impression=resp.impression,
+            findings=resp.findings,
+            structured=resp.structured,
+            provenance=resp.provenance,
+            seg=seg,
+        )
+    except BaseException:
+        artifacts.release(job_id)
+        raise
+    started = time.perf_counter()
+    when_written(
+        futures,
+        lambda written, errors: _finish_report(job_id, paths, result, timings, written, errors, started),
+    )
+
+
+def _finish_report(
+    job_id: str, paths: dict, result: dict, timings: dict, written: dict, errors: dict, started: float
+) -> None:
+    """Publish the final result once the SR/SEG writers are done."""
+    try:
+        observe_stage("report", time.perf_counter() - started)
+        for name, path in written.items():
+            result["downloads"][name] = f"/download/{DOWNLOAD_KINDS[name]}/{Path(path).name}"
+        if errors:
+            logger.error("writing DICOM objects of job %s failed: %s", job_id, errors)
+            for name in errors:
+                result["downloads"][name] = None
+            result.update(state="failed", error="; ".join(errors.values()))
+        else:
+            result["state"] = "done"
+        _publish(job_id, paths, result, timings, state=result["state"])
+    except Exception:
+        logger.exception("publishing the result of job %s failed", job_id)
+        _fail(job_id, "internal error")
+    finally:
+        artifacts.release(job_id)
+
+
+def _publish(job_id: str, paths: dict, result: dict, timings: dict, state: str) -> None:
+    result["timings"] = {k: round(v, 4) for k, v in timings.items()}
     (Path(paths["out"]) / f"{job_id}.json").write_text(json.dumps(result, indent=2))
-    store.set_result(job_id, result)
-    return result
+    store.set_result(job_id, result, state=state, pipeline_version=PIPELINE_VERSION)
+
+
+def _fail(job_id: str, error: str) -> None:
+    store.set_result(job_id, {"job_id": job_id, "state": "failed", "error": error}, state="failed")
 
 
 @app.get("/result/{job_id}")
@@ -130,4 +378,47 @@ def result(job_id: str):
     job = store.get(job_id)
     if not job:
         raise HTTPException(404, "job not found")
-    return job.get("result") or {"job_id": job_id, "state": job["state"]}
+    stored = job.get("result")
+    if stored and stored.get("state") == job["state"]:
+        out = stored
+    else:
+        # the job is being (re-)analysed; the stored result is an older run's
+        out = {"job_id": job_id, "state": job["state"]}
+        if stored:
+            out["previous"] = stored
+    series = store.series(job_id)
+    out["study"] = {
+        "num_series": len(series),
+        "num_instances": sum(s["instances"] for s in series),
+        "series": series,
+    }
+    return out
+
+
+@app.get("/jobs")
+def list_jobs(limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0), state: Optional[str] = None):
+    page = store.list(limit=limit, offset=offset, state=state)
+    return {
+        "jobs": page,
+        "limit": limit,
+        "offset": offset,
+        "next_offset": offset + limit if len(page) == limit else None,
+    }
+
+
+@app.get("/queue")
+def queue():
+    return jobs.stats()
+
+
+@app.get("/capacity")
+def capacity():
+    stats = jobs.stats()
+    return {
+        "workers": jobs.workers,
+        "max_queued": jobs.max_queued,
+        "queued": sum(s["queued"] for s in stats.values()),
+        "running": sum(s["running"] for s in stats.values()),
+        "retry_after_s": jobs.retry_after(),
+        "agent": agent.stats(),
+    }
@@ -0,0 +1,93 @@
+"""Report-object generation as a pipeline stage of its own.
+
+The DICOM SR and SEG of a study do not depend on each other, so they are
+written concurrently on a small worker pool instead of one after the other on
+the analysis worker.  The SEG is written from the mask handed over in memory
+(see :mod:`common.artifacts`).  Callers publish the JSON result right away
+and fill in the DICOM downloads from :func:`when_written`.
+"""
+
+from __future__ import annotations
+
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, List, Union
+
+import numpy as np
+
+from common.tracing import metrics, submit_with_context
+
+from .app_sdk_io import write_dicom_seg, write_dicom_sr
+from .settings import REPORT_WORKERS
+
+pool = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+_in_flight = metrics.gauge("report_writes_in_flight", "DICOM SR/SEG objects being written", ("object",))
+
+
+def _write(name: str, writer: Callable[..., str], kwargs: Dict[str, Any]) -> str:
+    _in_flight.inc(object=name)
+    try:
+        return writer(**kwargs)
+    finally:
+        _in_flight.dec(object=name)
+
+
+def submit_report_objects(
+    study_dir: str,
+    out_dir: str,
+    *,
+    impression: str,
+    findings: List[str],
+    structured: Dict[str, Any],
+    provenance: Dict[str, Any],
+    seg: Union[str, np.ndarray, None] = None,
+) -> Dict[str, Future]:
+    """Start writing the SR, and the SEG if a ``seg`` mask is given.
+
+    Returns futures of the written paths keyed ``dicom_sr`` / ``dicom_seg``."""
+    futures = {
+        "dicom_sr": submit_with_context(pool, _write, "sr", write_dicom_sr, {
+            "study_dir": study_dir,
+            "impression": impression,
+            "findings": findings,
+            "structured": structured,
+            "provenance": provenance,
+            "out_dir": out_dir,
+        }),
+    }
+    if seg is not None:
+        futures["dicom_seg"] = submit_with_context(pool, _write, "seg", write_dicom_seg, {
+            "study_dir": study_dir,
+            "seg": seg,
+            "out_dir": out_dir,
+        })
+    return futures
+
+
+def when_written(
+    futures: Dict[str, Future], callback: Callable[[Dict[str, str], Dict[str, str]], None]
+) -> None:
+    """Call ``callback(paths, errors)`` once all ``futures`` have finished.
+
+    The callback runs on the thread finishing last, in the caller's context
+    (request id and span collector)."""
+    ctx = contextvars.copy_context()
+    remaining = [len(futures)]
+    lock = Lock()
+
+    def done(_: Future) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        paths, errors = {}, {}
+        for name, f in futures.items():
+            if f.exception() is not None:
+                errors[name] = str(f.exception())
+            else:
+                paths[name] = f.result()
+        ctx.run(callback, paths, errors)
+
+    for f in futures.values():
+        f.add_done_callback(done)
@@ -0,0 +1,65 @@
+"""Background pruning of stale jobs and their files."""
+
+from __future__ import annotations
+
+import logging
+import shutil
+import time
+from pathlib import Path
+from threading import Event, Thread
+from typing import List
+
+from common.artifacts import artifacts
+
+from .job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+
+def prune_jobs(store: JobStore, max_age_s: float, now: float | None = None) -> List[str]:
+    """Delete jobs not updated for ``max_age_s`` and their job directories.
+
+    Returns the ids of the pruned jobs."""
+    cutoff = (now if now is not None else time.time()) - max_age_s
+    pruned = store.prune(cutoff)
+    for job in pruned:
+        # dicom/, work/ and out/ share the job directory
+        dirs = {Path(p).parent for key, p in job["paths"].items() if key in ("dicom", "work", "out")}
+        for d in dirs:
+            shutil.rmtree(d, ignore_errors=True)
+        shutil.rmtree(artifacts.job_dir(job["job_id"]), ignore_errors=True)
+    if pruned:
+        logger.info("pruned %d stale jobs", len(pruned))
+    return [job["job_id"] for job in pruned]
+
+
+class RetentionTask:
+    """Periodically calls :func:`prune_jobs` from a daemon thread."""
+
+    def __init__(self, store: JobStore, max_age_s: float, interval_s: float):
+        self.store = store
+        self.max_age_s = max_age_s
+        self.interval_s = interval_s
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        if self.max_age_s <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="job-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                prune_jobs(self.store, self.max_age_s)
+            except Exception:
+                logger.exception("job retention sweep failed")
+            self._stop.wait(self.interval_s)
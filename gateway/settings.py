@@ -11,3 +11,36 @@ ABNORMAL_THRESHOLD_CC = float(os.getenv("ABNORMAL_THRESHOLD_CC", "0.5"))
 # Persistent job state database
 JOB_DB = Path(os.getenv("JOB_DB", "/data/job_state.db"))
 JOB_DB.parent.mkdir(parents=True, exist_ok=True)
+
+# Chunk size used when streaming uploads to disk and extracting archives
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1 << 20)))
+
+# Worker threads used to extract uploaded archives
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+
+# Background workers running analyses, and per-priority concurrency limits
+# (e.g. "high=2,normal=2,low=1"; unspecified priorities may use every worker)
+ANALYZE_WORKERS = int(os.getenv("ANALYZE_WORKERS", "2"))
+ANALYZE_LIMITS = os.getenv("ANALYZE_LIMITS", "")
+# Analyses waiting for a worker; further requests are rejected with 429
+ANALYZE_QUEUE_LIMIT = int(os.getenv("ANALYZE_QUEUE_LIMIT", "64"))
+
+# Retries of agent calls refused or answered with 429/503, and the
+# consecutive failures after which the agent is not called for
+# AGENT_BREAKER_RESET_S seconds
+AGENT_RETRIES = int(os.getenv("AGENT_RETRIES", "3"))
+AGENT_BREAKER_FAILURES = int(os.getenv("AGENT_BREAKER_FAILURES", "5"))
+AGENT_BREAKER_RESET_S = float(os.getenv("AGENT_BREAKER_RESET_S", "30"))
+
+# Jobs (rows and files) not updated for this many days are deleted, whatever
+# their state; 0 keeps them
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "30"))
+# Seconds between retention sweeps
+JOB_RETENTION_INTERVAL_S = float(os.getenv("JOB_RETENTION_INTERVAL_S", "3600"))
+
+# Version of the analysis pipeline (models, prompts, thresholds); results of
+# other versions are recomputed when a study is analysed again
+PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "1")
+
+# Worker threads writing the DICOM SR/SEG of finished analyses
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "4"))
@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 import json
 
-from desktop_pipeline import analyze_zip
+from desktop_pipeline import AnalysisSession
 
 
 class App(tk.Tk):
@@ -11,6 +11,9 @@ class App(tk.Tk):
         self.title("MRI Analyzer")
         self.geometry("500x400")
         self.file_path = tk.StringVar()
+        # models stay loaded between analyses until the window is closed
+        self.session = AnalysisSession()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
         tk.Button(self, text="Select ZIP", command=self.select_file).pack(pady=5)
         tk.Label(self, textvariable=self.file_path).pack()
@@ -30,12 +33,16 @@ class App(tk.Tk):
             messagebox.showerror("Error", "Please select a ZIP file")
             return
         try:
-            data = analyze_zip(path)
+            data = self.session.analyze_zip(path)
             self.output.delete("1.0", tk.END)
             self.output.insert(tk.END, json.dumps(data, indent=2))
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+    def on_close(self):
+        self.session.close()
+        self.destroy()
+
 
 def main():
     App().mainloop()
@@ -1,28 +1,192 @@
+"""Convert the raw DICOM instances in ``data/raw`` into NIfTI volumes.
+
+Instances are grouped into series by ``SeriesInstanceUID`` (read from the
+headers only) and each series is converted into one volume.  Series are
+converted in parallel worker processes, and a manifest of source hashes and
+outputs in the output directory lets later runs skip series whose files have
+not changed and whose volumes are still there.  The manifest is rewritten
+atomically as series complete, so an interrupted run keeps its progress.
+Optionally the preprocessed tensors are cached with ``PersistentDataset`` so
+training and evaluation jobs do not decode the volumes again.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pydicom
 from monai.transforms import Compose, LoadImaged, SaveImaged
 from monai.data import Dataset
 
-def main():
-    raw_dir = Path("data/raw")
-    nifti_dir = Path("data/nifti")
-    nifti_dir.mkdir(parents=True, exist_ok=True)
+MANIFEST_NAME = ".manifest.json"
+# Series converted between manifest writes; a killed run redoes at most these
+MANIFEST_EVERY = 16
+
 
-    items = []
+def _instance_files(raw_dir: Path) -> List[Path]:
+    """Return the instance files in ``raw_dir`` (flat or one folder per item)."""
+    files = []
     for p in sorted(raw_dir.iterdir()):
         if p.is_dir():
-            dicom_file = p / p.name
-            if dicom_file.exists():
-                items.append({"image": str(dicom_file)})
+            files += sorted(f for f in p.iterdir() if f.is_file())
+        elif p.is_file() and not p.name.startswith("."):
+            files.append(p)
+    return files
+
+
+def _series_uid(path: Path) -> str:
+    try:
+        ds = pydicom.dcmread(str(path), stop_before_pixels=True, force=True, specific_tags=["SeriesInstanceUID"])
+        uid = ds.get("SeriesInstanceUID")
+    except Exception:
+        uid = None
+    # files without a readable series are converted on their own
+    return str(uid) if uid else f"file:{path}"
+
+
+def group_series(files: List[Path], workers: int = 8) -> Dict[str, List[Path]]:
+    """Group instance ``files`` by series."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        uids = list(pool.map(_series_uid, files))
+    series: Dict[str, List[Path]] = {}
+    for uid, f in zip(uids, files):
+        series.setdefault(uid, []).append(f)
+    return series
 
+
+def source_hash(files: List[Path]) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    for f in files:
+        h.update(f.name.encode())
+        with open(f, "rb") as fp:
+            while chunk := fp.read(1 << 20):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _series_input(uid: str, files: List[Path], staging: Path) -> str:
+    """Return what ``LoadImaged`` should read for a series.
+
+    Multi-file series are linked into a folder of their own, which MONAI
+    reads as one DICOM series."""
+    if len(files) == 1:
+        return str(files[0])
+    folder = staging / uid
+    folder.mkdir(parents=True, exist_ok=True)
+    for f in files:
+        link = folder / f.name
+        if not link.exists():
+            link.symlink_to(f.resolve())
+    return str(folder)
+
+
+def _convert(image: str, nifti_dir: str) -> List[str]:
+    """Convert one series; returns the paths of the written volumes."""
     transforms = Compose([
         LoadImaged(keys="image"),
-        SaveImaged(keys="image", output_dir=str(nifti_dir), output_ext=".nii.gz", resample=False)
+        SaveImaged(keys="image", output_dir=nifti_dir, output_ext=".nii.gz", resample=False,
+                   savepath_in_metadict=True)
     ])
+    return [str(item["image"].meta["saved_to"]) for item in Dataset(data=[{"image": image}], transform=transforms)]
+
+
+def _convert_all(images: Dict[str, str], nifti_dir: Path, workers: int) -> Iterator[Tuple[str, List[str]]]:
+    """Yield ``(uid, outputs)`` for each series as it is converted."""
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_convert, image, str(nifti_dir)): uid for uid, image in images.items()}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    else:
+        for uid, image in images.items():
+            yield uid, _convert(image, str(nifti_dir))
+
 
-    dataset = Dataset(data=items, transform=transforms)
-    for _ in dataset:
+def _is_current(entry: Any, digest: str, nifti_dir: Path) -> bool:
+    """Whether a manifest entry matches ``digest`` and its volumes still exist."""
+    if not isinstance(entry, dict) or entry.get("hash") != digest or not entry.get("outputs"):
+        return False
+    return all((nifti_dir / p).exists() for p in entry["outputs"])
+
+
+def _save_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, path)
+
+
+def _cache_tensors(nifti_dir: Path, cache_dir: Path) -> int:
+    """Populate a ``PersistentDataset`` cache of the converted volumes."""
+    from monai.data import PersistentDataset
+    from monai.transforms import EnsureChannelFirstd, Orientationd
+
+    items = [{"image": str(p)} for p in sorted(nifti_dir.rglob("*.nii.gz"))]
+    transforms = Compose([
+        LoadImaged(keys="image"),
+        EnsureChannelFirstd(keys="image"),
+        Orientationd(keys="image", axcodes="RAS"),
+    ])
+    for _ in PersistentDataset(data=items, transform=transforms, cache_dir=str(cache_dir)):
         pass
-    print(f"Converted {len(items)} files to {nifti_dir}")
+    return len(items)
+
+
+def main(
+    raw_dir: str = "data/raw",
+    nifti_dir: str = "data/nifti",
+    workers: int = 1,
+    cache_dir: str | None = None,
+    force: bool = False,
+):
+    raw_dir = Path(raw_dir)
+    nifti_dir = Path(nifti_dir)
+    nifti_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = nifti_dir / MANIFEST_NAME
+    manifest = {} if force or not manifest_path.exists() else json.loads(manifest_path.read_text())
+
+    series = group_series(_instance_files(raw_dir))
+    todo = []
+    for uid, files in series.items():
+        digest = source_hash(files)
+        if _is_current(manifest.get(uid), digest, nifti_dir):
+            continue
+        todo.append((uid, files, digest))
+
+    images = {uid: _series_input(uid, files, nifti_dir / ".series") for uid, files, _ in todo}
+    digests = {uid: digest for uid, _, digest in todo}
+    try:
+        for n, (uid, outputs) in enumerate(_convert_all(images, nifti_dir, workers), 1):
+            manifest[uid] = {"hash": digests[uid], "outputs": [os.path.relpath(p, nifti_dir) for p in outputs]}
+            if n % MANIFEST_EVERY == 0:
+                _save_manifest(manifest_path, manifest)
+    finally:
+        _save_manifest(manifest_path, manifest)
+
+    n_files = sum(len(files) for _, files, _ in todo)
+    print(
+        f"Converted {n_files} files in {len(todo)} series to {nifti_dir} "
+        f"({len(series) - len(todo)} unchanged series skipped)"
+    )
+    if cache_dir:
+        n = _cache_tensors(nifti_dir, Path(cache_dir))
+        print(f"Cached {n} preprocessed volumes in {cache_dir}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--raw-dir", default="data/raw")
+    parser.add_argument("--nifti-dir", default="data/nifti")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Series converted in parallel"
+    )
+    parser.add_argument("--cache-dir", help="Also cache preprocessed tensors with PersistentDataset here")
+    parser.add_argument("--force", action="store_true", help="Reconvert series even if unchanged")
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    main()
+    main(**vars(parse_args()))
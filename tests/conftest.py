@@ -1,6 +1,67 @@
+import os
 import sys
+import tempfile
 from pathlib import Path
 
+import numpy as np
+import pytest
+
 ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+# Keep the gateway's job tree and database out of /data during tests
+_DATA = Path(tempfile.mkdtemp(prefix="mri-tests-"))
+os.environ.setdefault("JOB_BASE", str(_DATA / "jobs"))
+os.environ.setdefault("JOB_DB", str(_DATA / "job_state.db"))
+
+
+def write_dicom_series(directory, pixels, spacing=(1.0, 1.0, 2.0), order=None, **tags):
+    """Write ``pixels`` (``(D, H, W)`` uint16) as an MR series in ``directory``.
+
+    ``order`` permutes the files on disk and their ``InstanceNumber`` so tests
+    can check that slices are placed by ``ImagePositionPatient``."""
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    series_uid = tags.pop("SeriesInstanceUID", generate_uid())
+    study_uid = tags.pop("StudyInstanceUID", generate_uid())
+    order = list(order) if order is not None else list(range(len(pixels)))
+    paths = []
+    for n, z in enumerate(order):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = MRImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = MRImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = "MR"
+        ds.InstanceNumber = n + 1
+        ds.Rows, ds.Columns = pixels.shape[1:]
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.PixelSpacing = [spacing[0], spacing[1]]
+        ds.SliceThickness = spacing[2]
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [0, 0, z * spacing[2]]
+        for key, value in tags.items():
+            setattr(ds, key, value)
+        ds.PixelData = np.ascontiguousarray(pixels[z], dtype=np.uint16).tobytes()
+        path = directory / f"IM{n:04d}.dcm"
+        ds.save_as(str(path), enforce_file_format=True)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def dicom_series():
+    return write_dicom_series
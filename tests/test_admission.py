@@ -0,0 +1,59 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from common.admission import CapacityLimiter, admission
+
+
+def test_limiter_admits_up_to_capacity():
+    limiter = CapacityLimiter(2, "test")
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    limiter.release(4.0)
+    assert limiter.try_acquire()
+    assert limiter.stats()["rejected"] == 1
+    # two slots, ~4 s each: one frees up about every 2 s
+    assert limiter.retry_after() == 2
+
+    with pytest.raises(ValueError):
+        CapacityLimiter(0, "none")
+
+
+def test_requests_over_capacity_get_429_with_retry_after():
+    app = FastAPI()
+    limiter = CapacityLimiter(1, "slow")
+    admission(app, limiter, ("/work",))
+    started, release = threading.Event(), threading.Event()
+
+    @app.post("/work")
+    def work():
+        started.set()
+        release.wait(5)
+        return {"ok": True}
+
+    @app.get("/health")
+    def health():
+        return {"ok": True}
+
+    client = TestClient(app)
+    with ThreadPoolExecutor(1) as pool:
+        first = pool.submit(client.post, "/work")
+        assert started.wait(5)
+
+        rejected = client.post("/work")
+        assert rejected.status_code == 429
+        assert int(rejected.headers["Retry-After"]) >= 1
+        # other routes are not limited
+        assert client.get("/health").status_code == 200
+        assert client.get("/capacity").json()["available"] == 0
+
+        release.set()
+        assert first.result().status_code == 200
+    assert client.post("/work").status_code == 200
+    assert client.get("/capacity").json() | {"service_s": None} == {
+        "capacity": 1, "in_flight": 0, "available": 1, "admitted": 2, "rejected": 1, "service_s": None,
+    }
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import pytest
+
+from gateway import app_sdk_io
+
+
+class _Op:
+    def __init__(self, output_folder, files=("1.2.3.dcm",)):
+        self.output_folder = output_folder
+        self.files = files
+
+    def __call__(self, study_list, **kwargs):
+        for name in self.files:
+            (Path(self.output_folder) / name).write_bytes(b"x")
+
+
+def test_writer_returns_its_own_output(tmp_path):
+    (tmp_path / "sr").mkdir()
+    (tmp_path / "sr" / "older.dcm").write_bytes(b"x")
+
+    with app_sdk_io._staging(str(tmp_path), "sr") as (staging, dest):
+        path = app_sdk_io._publish(app_sdk_io._run_sr_writer(_Op(staging), "study", "text"), dest)
+
+    assert path == str(tmp_path / "sr" / "1.2.3.dcm")
+    assert sorted(p.name for p in (tmp_path / "sr").iterdir()) == ["1.2.3.dcm", "older.dcm"]
+
+
+def test_writer_without_output_raises(tmp_path):
+    with app_sdk_io._staging(str(tmp_path), "seg") as (staging, _):
+        with pytest.raises(RuntimeError, match="no output"):
+            app_sdk_io._run_seg_writer(_Op(staging, files=()), "study", "mask.nii.gz")
+    assert list((tmp_path / "seg").iterdir()) == []
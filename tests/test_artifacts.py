@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+
+from common.artifacts import ArtifactStore
+
+
+def test_put_and_open_maps_without_copy(tmp_path):
+    store = ArtifactStore(tmp_path)
+    mask = np.arange(24, dtype=np.uint8).reshape(2, 3, 4)
+
+    handle = store.put("job-1", "seg", mask, affine=np.eye(4), labels={"1": "Lesion"})
+    # handles travel between services as JSON
+    mapped = store.open(json.loads(json.dumps(handle.to_dict())))
+
+    assert isinstance(mapped, np.memmap)
+    np.testing.assert_array_equal(mapped, mask)
+    assert handle.shape == (2, 3, 4) and handle.dtype == "uint8"
+    assert handle.affine == np.eye(4).tolist()
+    assert handle.meta == {"labels": {"1": "Lesion"}}
+
+
+def test_artifacts_removed_when_last_reference_released(tmp_path):
+    store = ArtifactStore(tmp_path)
+    assert store.acquire("job-1") == 1
+    assert store.acquire("job-1") == 2
+    store.put("job-1", "seg", np.zeros(3, dtype=np.uint8))
+
+    assert store.release("job-1") == 1
+    assert (tmp_path / "job-1" / "seg.npy").exists()
+    assert store.release("job-1") == 0
+    assert not (tmp_path / "job-1").exists()
+
+
+def test_rejects_path_like_names(tmp_path):
+    store = ArtifactStore(tmp_path)
+    with pytest.raises(ValueError):
+        store.put("../job", "seg", np.zeros(1))
+
+
+def test_open_resolves_handles_in_its_own_root(tmp_path):
+    producer = ArtifactStore(tmp_path / "experts")
+    handle = producer.put("job-1", "seg", np.ones(3, dtype=np.uint8)).to_dict()
+    # the same directory mounted at another path in the consumer
+    (tmp_path / "experts").rename(tmp_path / "gateway")
+    consumer = ArtifactStore(tmp_path / "gateway")
+
+    np.testing.assert_array_equal(consumer.open(handle), [1, 1, 1])
+    # the reported path is never read
+    np.save(tmp_path / "elsewhere.npy", np.zeros(3, dtype=np.uint8))
+    np.testing.assert_array_equal(consumer.open({**handle, "path": str(tmp_path / "elsewhere.npy")}), [1, 1, 1])
+    with pytest.raises(ValueError):
+        consumer.open({**handle, "name": "../../elsewhere"})
+
+
+def test_empty_artifact_is_filled_in_place(tmp_path):
+    store = ArtifactStore(tmp_path)
+    mask, handle = store.empty("job-1", "seg", (2, 3), np.uint8, labels={"1": "Lesion"})
+    mask[1] = 1
+    mask.flush()
+
+    np.testing.assert_array_equal(store.open(handle), [[0, 0, 0], [1, 1, 1]])
+    assert handle.meta == {"labels": {"1": "Lesion"}}
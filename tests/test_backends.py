@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import torch
+
+from experts.backends import compare_backends, dice, export_onnx, load_onnx, sample_windows
+from experts.model_registry import model_nbytes
+
+
+def test_dice_over_foreground_labels():
+    reference = np.array([0, 1, 1, 2, 2, 0])
+    labels = np.array([0, 1, 0, 2, 2, 2])
+    assert dice(labels, reference) == pytest.approx((2 / 3 + 4 / 5) / 2)
+    assert dice(np.zeros(3), np.zeros(3)) == 1.0
+
+
+def test_calibration_windows_are_padded_to_the_window_size():
+    volumes = np.ones((4, 10, 6, 30), dtype=np.float32)
+    windows = list(sample_windows(volumes, (8, 8, 8), count=3))
+    assert len(windows) == 3 and all(w.shape == (4, 8, 8, 8) for w in windows)
+
+
+def test_compare_reports_dice_and_throughput():
+    torch.manual_seed(0)
+    network = torch.nn.Conv3d(4, 3, 1).eval()
+    inputs = [np.random.default_rng(0).random((4, 12, 12, 12), dtype=np.float32)]
+
+    report = compare_backends({"torch": network, "copy": network}, inputs, (8, 8, 8))
+
+    assert report["copy"]["dice_vs_torch"] == 1.0
+    assert report["torch"]["voxels_per_s"] > 0
+
+
+def test_onnx_backend_matches_torch(tmp_path):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    torch.manual_seed(0)
+    network = torch.nn.Sequential(torch.nn.Conv3d(4, 8, 3, padding=1), torch.nn.ReLU(), torch.nn.Conv3d(8, 3, 1)).eval()
+    export_onnx(network, tmp_path / "model.onnx", (8, 8, 8))
+    (tmp_path / "model.json").write_text('{"roi_size": [8, 8, 8]}')
+
+    onnx_network, config = load_onnx("onnx", tmp_path)
+    x = torch.rand(2, 4, 8, 8, 8)
+
+    assert config["roi_size"] == (8, 8, 8)
+    assert model_nbytes(onnx_network) == (tmp_path / "model.onnx").stat().st_size
+    torch.testing.assert_close(onnx_network(x), network(x), rtol=1e-4, atol=1e-4)
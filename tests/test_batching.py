@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from experts.batching import MicroBatcher
+from experts.inference import InferenceConfig, run_sliding_window
+
+
+class CountingNet(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv3d(1, 2, 3, padding=1)
+        self.sizes = []
+
+    def forward(self, x):
+        self.sizes.append(x.shape[0])
+        return self.conv(x)
+
+
+def test_concurrent_requests_share_batches_and_get_their_own_outputs():
+    torch.manual_seed(0)
+    net = CountingNet().eval()
+    batcher = MicroBatcher(lambda: net, max_windows=8, max_wait_ms=200)
+    volumes = [torch.rand(1, 1, 16, 16, 16) for _ in range(2)]
+    config = InferenceConfig(sw_batch_size=2, overlap=0.0)
+    expected = [run_sliding_window(net.conv, v, (8, 8, 8), config) for v in volumes]
+    started = threading.Barrier(2)
+
+    def infer(v):
+        with batcher.session():
+            started.wait()
+            return run_sliding_window(batcher, v, (8, 8, 8), config)
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(infer, volumes))
+
+    for got, want in zip(results, expected):
+        torch.testing.assert_close(got, want)
+    assert max(net.sizes) == 4  # two requests x two windows
+    assert batcher.stats()["windows"] == 16
+
+
+def test_lone_request_is_not_delayed():
+    net = CountingNet().eval()
+    batcher = MicroBatcher(lambda: net, max_windows=8, max_wait_ms=10_000)
+
+    with batcher.session():
+        out = run_sliding_window(batcher, torch.rand(1, 1, 16, 16, 8), (8, 8, 8), InferenceConfig(sw_batch_size=1, overlap=0.0))
+
+    assert out.shape == (1, 2, 16, 16, 8)
+    assert net.sizes == [1, 1, 1, 1]
@@ -0,0 +1,25 @@
+import json
+
+from benchmarks import suite
+
+
+def _result(**values):
+    better = {"load_s": "lower", "ops_per_s": "higher"}
+    return {"params": {}, "metrics": {k: {"value": v, "unit": "", "better": better[k]} for k, v in values.items()}}
+
+
+def test_compare_flags_regressions_in_either_direction():
+    baseline = _result(load_s=1.0, ops_per_s=100.0)
+
+    assert suite.compare(baseline, _result(load_s=1.1, ops_per_s=95.0), threshold=0.15) == []
+    assert suite.compare(baseline, _result(load_s=1.3, ops_per_s=120.0), threshold=0.15) == ["load_s"]
+    assert suite.compare(baseline, _result(load_s=0.5, ops_per_s=50.0), threshold=0.15) == ["ops_per_s"]
+
+
+def test_compare_command_exit_status(tmp_path):
+    base, cur = tmp_path / "base.json", tmp_path / "cur.json"
+    base.write_text(json.dumps(_result(load_s=1.0)))
+    cur.write_text(json.dumps(_result(load_s=2.0)))
+
+    assert suite.main(["compare", str(base), str(base)]) == 0
+    assert suite.main(["compare", str(base), str(cur), "--threshold", "0.5"]) == 1
@@ -0,0 +1,111 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from common.client import CircuitBreaker, CircuitOpenError, ResilientClient
+
+
+class _Resp:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def _client(outcomes, **kwargs):
+    """A client whose session answers with ``outcomes`` in turn."""
+    sleeps = []
+    client = ResilientClient("test", max_concurrency=2, sleep=sleeps.append, **kwargs)
+    calls = []
+
+    def post(url, **k):
+        calls.append(url)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    client.session.post = post
+    return client, calls, sleeps
+
+
+def test_busy_upstream_is_retried_after_its_retry_after():
+    client, calls, sleeps = _client([_Resp(429, {"Retry-After": "3"}), _Resp(503), _Resp(200)], retries=2)
+
+    assert client.post("http://up/x", json={}).status_code == 200
+    assert len(calls) == 3
+    # Retry-After plus jitter, then jittered backoff alone
+    assert 3 <= sleeps[0] <= 3.5 and 0 <= sleeps[1] <= 1.0
+    assert client.stats()["retries"] == 2
+
+
+def test_last_response_is_returned_when_retries_run_out():
+    client, calls, _ = _client([_Resp(429), _Resp(429)], retries=1)
+
+    assert client.post("http://up/x").status_code == 429
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_failed_upstream_is_not_retried(status):
+    # the upstream has used up its own retries of the next hop
+    client, calls, sleeps = _client([_Resp(status), _Resp(200)], retries=3)
+
+    assert client.post("http://up/x").status_code == status
+    assert len(calls) == 1 and not sleeps
+
+
+def _refused():
+    return requests.ConnectionError(MaxRetryError(None, "/x", NewConnectionError(None, "refused")))
+
+
+def test_refused_connections_are_retried_but_read_timeouts_are_not():
+    client, calls, _ = _client([_refused(), _Resp(200)], retries=1)
+    assert client.post("http://up/x").status_code == 200
+
+    client, calls, _ = _client([requests.ConnectTimeout("slow to connect"), _Resp(200)], retries=1)
+    assert client.post("http://up/x").status_code == 200
+
+    client, calls, _ = _client([requests.ReadTimeout("slow"), _Resp(200)], retries=1)
+    with pytest.raises(requests.ReadTimeout):
+        client.post("http://up/x")
+    assert len(calls) == 1
+
+
+def test_connections_dropped_after_sending_are_not_retried():
+    # the upstream may have died or reset mid-request, having done the work
+    dropped = requests.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError()))
+    client, calls, sleeps = _client([dropped, _Resp(200)], retries=2)
+
+    with pytest.raises(requests.ConnectionError):
+        client.post("http://up/x")
+    assert len(calls) == 1 and not sleeps
+
+
+def test_breaker_short_circuits_a_failing_upstream():
+    client, calls, _ = _client([_Resp(500), _Resp(502)], retries=0, breaker_failures=2)
+    client.post("http://up/x")
+    client.post("http://up/x")
+
+    with pytest.raises(CircuitOpenError):
+        client.post("http://up/x")
+    assert len(calls) == 2
+    assert client.stats()["breaker"] == "open"
+
+
+def test_breaker_closes_after_a_successful_trial():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=1, reset_s=10, clock=lambda: now[0])
+    breaker.record(False)
+    assert not breaker.allow() and breaker.remaining() == 10
+
+    now[0] = 10
+    assert breaker.allow()
+    # one trial at a time
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.allow()
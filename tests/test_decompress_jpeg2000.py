@@ -34,7 +34,10 @@ def test_process_decompresses_and_writes(mock_dcmread, tmp_path):
 
     dj.process(str(tmp_path))
 
-    mock_dcmread.assert_called_once_with(str(src), force=True)
+    assert mock_dcmread.call_args_list == [
+        mock.call(str(src), force=True, stop_before_pixels=True),
+        mock.call(str(src), force=True),
+    ]
     ds.decompress.assert_called_once()
     ds.save_as.assert_called_once_with(str(src) + ".dcm")
 
@@ -73,3 +76,37 @@ def test_process_delete_original(mock_dcmread, mock_remove, tmp_path):
     dj.process(str(tmp_path), delete_original=True)
 
     mock_remove.assert_called_once_with(str(src))
+
+
+@mock.patch("decompress_jpeg2000.pydicom.dcmread")
+def test_process_triages_from_header_only(mock_dcmread, tmp_path):
+    (tmp_path / "file").write_text("data")
+
+    ds = mock.Mock()
+    ds.file_meta.get.return_value = "1.2.840.10008.1.2.1"
+    mock_dcmread.return_value = ds
+
+    stats = dj.process(str(tmp_path))
+
+    mock_dcmread.assert_called_once_with(str(tmp_path / "file"), force=True, stop_before_pixels=True)
+    ds.decompress.assert_not_called()
+    assert stats["files"] == 1 and stats["written"] == 0
+
+
+@mock.patch("decompress_jpeg2000.pydicom.dcmread")
+def test_process_resumes_from_manifest(mock_dcmread, tmp_path):
+    (tmp_path / "first").write_text("data")
+
+    ds = mock.Mock()
+    ds.file_meta.get.return_value = JPEG2000
+    ds.save_as.side_effect = lambda out: open(out, "w").close()
+    mock_dcmread.return_value = ds
+
+    dj.process(str(tmp_path))
+    (tmp_path / "second").write_text("data")
+    ds.decompress.reset_mock()
+    stats = dj.process(str(tmp_path))
+
+    assert stats["files"] == 1
+    ds.decompress.assert_called_once()
+    assert mock_dcmread.call_args_list[-1] == mock.call(str(tmp_path / "second"), force=True)
@@ -0,0 +1,41 @@
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+import desktop_pipeline
+from experts.model_registry import registry
+from experts.runners import brats_runner
+
+
+def test_session_loads_models_once(monkeypatch, tmp_path, dicom_series):
+    series = tmp_path / "series"
+    dicom_series(series, np.zeros((3, 4, 4), dtype=np.uint16))
+    archive = tmp_path / "study.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        for f in series.iterdir():
+            zf.write(f, f.name)
+
+    calls = {"vila": 0, "preload": 0, "brats": []}
+
+    def load_vila():
+        calls["vila"] += 1
+        return None
+
+    def run_brats(study_dir, mask_out):
+        calls["brats"].append(sorted(p.name for p in Path(study_dir).iterdir()))
+        return {"seg": None, "lesion_volume_cc": 0.0, "num_lesions": 0, "lesion_stats": None}
+
+    monkeypatch.setattr(desktop_pipeline, "load_vila", load_vila)
+    monkeypatch.setattr(registry, "preload", lambda names: calls.__setitem__("preload", calls["preload"] + 1))
+    monkeypatch.setattr(brats_runner, "run_brats", run_brats)
+
+    with desktop_pipeline.AnalysisSession() as session:
+        first = session.analyze_zip(str(archive))
+        second = session.analyze_dir(str(series))
+
+    assert calls["vila"] == 1
+    assert calls["brats"][0] == sorted(f.name for f in series.iterdir())
+    assert len(calls["brats"]) == 2
+    assert first["normal"] and second["normal"]
+    assert first["downloads"]["dicom_seg"] is None
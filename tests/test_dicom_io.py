@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from common.study_index import build_index, index_path, load_index
+from experts.dicom_io import load_dicom_series
+
+
+def test_slices_sorted_by_position_with_true_spacing(tmp_path, dicom_series):
+    pixels = np.arange(5 * 4 * 3, dtype=np.uint16).reshape(5, 4, 3)
+    # files and InstanceNumbers disagree with the physical slice order
+    dicom_series(tmp_path, pixels, spacing=(0.5, 0.75, 2.5), order=[3, 0, 4, 1, 2],
+                 SliceThickness=1.0)
+
+    volume, affine, spacing = load_dicom_series(str(tmp_path), workers=2)
+
+    assert volume.dtype == np.float32
+    np.testing.assert_array_equal(volume, pixels.astype(np.float32))
+    np.testing.assert_allclose(spacing, [0.5, 0.75, 2.5])
+    np.testing.assert_allclose(np.diag(affine), [0.5, 0.75, 2.5, 1.0])
+
+
+def test_missing_series_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_dicom_series(str(tmp_path))
+
+
+def test_indexed_study_loads_its_largest_series(tmp_path, dicom_series):
+    dcm = tmp_path / "job" / "dicom"
+    pixels = np.arange(4 * 3 * 3, dtype=np.uint16).reshape(4, 3, 3)
+    dicom_series(dcm / "t1", pixels, order=[2, 0, 3, 1], SeriesDescription="T1")
+    dicom_series(dcm / "loc", pixels[:2] + 100, SeriesDescription="localizer")
+
+    index = build_index(dcm, workers=2)
+    index.save(index_path(dcm))
+    loaded = load_index(dcm)
+
+    assert loaded.instances == index.instances
+    assert len(loaded.instances) == 6 and len(loaded.series()) == 2
+    assert all(inst["pixel_offset"] for inst in loaded.instances)
+    volume, _, spacing = load_dicom_series(str(dcm), workers=2)
+    np.testing.assert_array_equal(volume, pixels.astype(np.float32))
+    np.testing.assert_allclose(spacing, [1.0, 1.0, 2.0])
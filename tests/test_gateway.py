@@ -0,0 +1,401 @@
+import io
+import os
+import threading
+import time
+import zipfile
+
+import numpy as np
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+from gateway import main, reports
+from gateway.job_queue import QueueFull
+
+
+def _zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+def _wait_for_state(job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = main.store.get(job_id)["state"]
+        if state != "extracting":
+            return state
+        time.sleep(0.01)
+    pytest.fail("extraction did not finish")
+
+
+def test_upload_keeps_only_dicom_members():
+    dicm = b"\0" * 128 + b"DICM" + b"\0" * 16
+    body = _zip({"a.dcm": b"x", "series/IM0001": dicm, "README.txt": b"hello"})
+    client = TestClient(main.app)
+
+    r = client.post("/upload", files={"study": ("s.zip", body, "application/zip")})
+
+    assert r.status_code == 200
+    job_id = r.json()["job_id"]
+    assert len(r.json()["sha256"]) == 64
+    assert _wait_for_state(job_id) == "uploaded"
+    dcm = main.BASE / job_id / "dicom"
+    files = sorted(p.relative_to(dcm).as_posix() for p in dcm.rglob("*") if p.is_file())
+    assert files == ["a.dcm", "series/IM0001"]
+    # the archive is not kept once it is extracted
+    assert not (main.BASE / job_id / "study.zip").exists()
+
+
+def test_upload_indexes_the_study(tmp_path, dicom_series):
+    pixels = np.zeros((3, 4, 4), dtype=np.uint16)
+    files = dicom_series(tmp_path / "t1", pixels, SeriesDescription="T1")
+    files += dicom_series(tmp_path / "flair", pixels[:2], SeriesDescription="FLAIR")
+    body = _zip({p.relative_to(tmp_path).as_posix(): p.read_bytes() for p in files})
+    client = TestClient(main.app)
+
+    job_id = client.post("/upload", files={"study": ("s.zip", body, "application/zip")}).json()["job_id"]
+
+    assert _wait_for_state(job_id) == "uploaded"
+    assert (main.BASE / job_id / "work" / "index.json").exists()
+    study = client.get(f"/result/{job_id}").json()["study"]
+    assert study["num_series"] == 2 and study["num_instances"] == 5
+    assert [s["description"] for s in study["series"]] == ["T1", "FLAIR"]
+    assert "index" in main.store.get(job_id)["timings"]
+
+
+def test_upload_rejects_path_traversal():
+    body = _zip({"../evil.dcm": b"x"})
+    client = TestClient(main.app)
+
+    r = client.post("/upload", files={"study": ("s.zip", body, "application/zip")})
+
+    assert r.status_code == 400
+
+
+def test_upload_rejects_invalid_zip():
+    client = TestClient(main.app)
+    r = client.post("/upload", files={"study": ("s.zip", b"not a zip", "application/zip")})
+    assert r.status_code == 400
+
+
+def test_analyze_is_queued_and_polled(monkeypatch, tmp_path):
+    class Resp:
+        status_code = 200
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"normal": True, "confidence": 0.8, "impression": "ok", "findings": [],
+                    "structured": {"lesion_volume_cc": 0.0}, "provenance": {}}
+
+    sr = tmp_path / "sr.dcm"
+    sent = {}
+
+    def post(*a, headers=None, **k):
+        sent.update(headers or {})
+        return Resp()
+
+    monkeypatch.setattr(main.agent.session, "post", post)
+    monkeypatch.setattr(reports, "write_dicom_sr", lambda **k: str(sr))
+    client = TestClient(main.app)
+    upload = client.post(
+        "/upload", files={"study": ("s.zip", _zip({"a.dcm": os.urandom(16)}), "application/zip")}
+    )
+    job_id = upload.json()["job_id"]
+    _wait_for_state(job_id)
+
+    r = client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+
+    assert r.status_code == 202
+    assert r.json()["state"] == "queued"
+    deadline = time.monotonic() + 5
+    while client.get(f"/result/{job_id}").json()["state"] != "done":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    result = client.get(f"/result/{job_id}").json()
+    assert result["downloads"]["dicom_sr"] == "/download/sr/sr.dcm"
+    # the upload's request id is carried to the agent and stored with the result
+    assert sent["X-Request-ID"] == upload.headers["X-Request-ID"] == result["request_id"]
+    assert {"upload", "extract", "queue_wait", "agent"} <= set(result["timings"])
+    assert "analysis_jobs_queued" in client.get("/metrics").text
+
+
+def test_failed_expert_call_is_not_retried_by_the_gateway(monkeypatch):
+    class Resp:
+        status_code = 502
+        headers = {}
+
+        def raise_for_status(self):
+            raise requests.HTTPError("502 expert request failed", response=self)
+
+    calls = []
+
+    def post(*a, **k):
+        calls.append(1)
+        return Resp()
+
+    monkeypatch.setattr(main.agent.session, "post", post)
+    client = TestClient(main.app)
+    job_id = client.post(
+        "/upload", files={"study": ("s.zip", _zip({"a.dcm": os.urandom(16)}), "application/zip")}
+    ).json()["job_id"]
+    _wait_for_state(job_id)
+
+    client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+    deadline = time.monotonic() + 5
+    while client.get(f"/result/{job_id}").json()["state"] != "failed":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    # the agent already retried the experts; the gateway calls it once
+    assert len(calls) == 1
+
+
+def test_result_is_published_before_dicom_objects_land(monkeypatch, tmp_path):
+    class Resp:
+        status_code = 200
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"normal": False, "confidence": 0.9, "impression": "lesion", "findings": ["mass"],
+                    "structured": {"lesion_volume_cc": 5.0}, "provenance": {},
+                    "aux": {"seg_nifti": str(tmp_path / "seg.nii.gz")}}
+
+    release = threading.Event()
+    written = []
+
+    def write_sr(**k):
+        release.wait(5)
+        written.append("sr")
+        return str(tmp_path / "sr" / "1.dcm")
+
+    def write_seg(**k):
+        release.wait(5)
+        written.append("seg")
+        return str(tmp_path / "seg" / "2.dcm")
+
+    monkeypatch.setattr(main.agent.session, "post", lambda *a, **k: Resp())
+    monkeypatch.setattr(reports, "write_dicom_sr", write_sr)
+    monkeypatch.setattr(reports, "write_dicom_seg", write_seg)
+    client = TestClient(main.app)
+    job_id = client.post(
+        "/upload", files={"study": ("s.zip", _zip({"a.dcm": os.urandom(16)}), "application/zip")}
+    ).json()["job_id"]
+    _wait_for_state(job_id)
+    client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+
+    deadline = time.monotonic() + 5
+    while (result := client.get(f"/result/{job_id}").json())["state"] != "reporting":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert result["impression"] == "lesion"
+    assert result["downloads"]["dicom_sr"] == result["downloads"]["dicom_seg"] == "pending"
+
+    release.set()
+    while (result := client.get(f"/result/{job_id}").json())["state"] != "done":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert sorted(written) == ["seg", "sr"]
+    assert result["downloads"]["dicom_sr"] == "/download/sr/1.dcm"
+    assert result["downloads"]["dicom_seg"] == "/download/seg/2.dcm"
+
+
+def test_reupload_maps_to_the_existing_job():
+    body = _zip({"a.dcm": os.urandom(16)})
+    client = TestClient(main.app)
+
+    first = client.post("/upload", files={"study": ("s.zip", body, "application/zip")}).json()
+    jobs_before = set(main.BASE.iterdir())
+    again = client.post("/upload", files={"study": ("s.zip", body, "application/zip")}).json()
+
+    assert again["job_id"] == first["job_id"]
+    assert not first["duplicate"] and again["duplicate"]
+    # the second copy is not kept
+    assert set(main.BASE.iterdir()) == jobs_before
+
+
+def test_analysis_is_single_flight_and_versioned(monkeypatch, tmp_path):
+    class Resp:
+        status_code = 200
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"normal": True, "confidence": 0.8, "impression": "ok", "findings": [],
+                    "structured": {"lesion_volume_cc": 0.0}, "provenance": {}}
+
+    release = threading.Event()
+    calls = []
+
+    def post(*a, **k):
+        calls.append(1)
+        release.wait(5)
+        return Resp()
+
+    monkeypatch.setattr(main.agent.session, "post", post)
+    monkeypatch.setattr(reports, "write_dicom_sr", lambda **k: str(tmp_path / "sr.dcm"))
+    client = TestClient(main.app)
+    job_id = client.post(
+        "/upload", files={"study": ("s.zip", _zip({"a.dcm": os.urandom(16)}), "application/zip")}
+    ).json()["job_id"]
+    _wait_for_state(job_id)
+
+    def wait_done():
+        deadline = time.monotonic() + 5
+        while main.store.get(job_id)["state"] != "done":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    first = client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+    second = client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+    release.set()
+    wait_done()
+
+    assert first.status_code == 202 and not first.json()["coalesced"]
+    assert second.status_code == 200 and second.json()["coalesced"]
+    assert len(calls) == 1
+    cached = client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+    assert cached.status_code == 200 and cached.json()["cached"]
+    assert len(calls) == 1
+    assert client.get(f"/result/{job_id}").json()["pipeline_version"] == main.PIPELINE_VERSION
+
+    # a new pipeline version recomputes the result
+    monkeypatch.setattr(main, "PIPELINE_VERSION", "next")
+    rerun = client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+    assert rerun.status_code == 202
+    wait_done()
+    assert len(calls) == 2
+    assert main.store.get(job_id)["pipeline_version"] == "next"
+
+
+def test_result_of_a_forced_rerun_reports_the_live_state(monkeypatch, tmp_path):
+    class Resp:
+        status_code = 200
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"normal": True, "confidence": 0.8, "impression": "ok", "findings": [],
+                    "structured": {"lesion_volume_cc": 0.0}, "provenance": {}}
+
+    release = threading.Event()
+    release.set()
+
+    def post(*a, **k):
+        release.wait(5)
+        return Resp()
+
+    monkeypatch.setattr(main.agent.session, "post", post)
+    monkeypatch.setattr(reports, "write_dicom_sr", lambda **k: str(tmp_path / "sr.dcm"))
+    client = TestClient(main.app)
+    job_id = client.post(
+        "/upload", files={"study": ("s.zip", _zip({"a.dcm": os.urandom(16)}), "application/zip")}
+    ).json()["job_id"]
+    _wait_for_state(job_id)
+
+    def poll_until(states):
+        deadline = time.monotonic() + 5
+        while True:
+            out = client.get(f"/result/{job_id}").json()
+            if out["state"] in states:
+                return out
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+    assert poll_until({"done"})["impression"] == "ok"
+
+    release.clear()
+    rerun = client.post(f"/analyze/{job_id}", json={"anatomy": "brain", "force": True})
+    assert rerun.status_code == 202
+    out = client.get(f"/result/{job_id}").json()
+    # the finished result of the previous run is not passed off as this one's
+    assert out["state"] in main.IN_FLIGHT_STATES
+    assert "impression" not in out and out["previous"]["state"] == "done"
+
+    release.set()
+    assert poll_until({"done"})["impression"] == "ok"
+
+
+def test_analysis_is_rejected_when_the_queue_is_full(monkeypatch):
+    def submit(*a, **k):
+        raise QueueFull(7)
+
+    monkeypatch.setattr(main.jobs, "submit", submit)
+    client = TestClient(main.app)
+    job_id = client.post(
+        "/upload", files={"study": ("s.zip", _zip({"a.dcm": os.urandom(16)}), "application/zip")}
+    ).json()["job_id"]
+    _wait_for_state(job_id)
+
+    r = client.post(f"/analyze/{job_id}", json={"anatomy": "brain"})
+
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "7"
+    # the job can be queued again once there is room
+    assert main.store.get(job_id)["state"] == "uploaded"
+    assert client.get("/capacity").json()["max_queued"] == main.ANALYZE_QUEUE_LIMIT
+
+
+def test_jobs_left_in_flight_are_settled_on_startup(monkeypatch, tmp_path):
+    from gateway.job_store import JobStore
+
+    store = JobStore(tmp_path / "jobs.db")
+    for job_id, state in [("q", "queued"), ("r", "running"), ("x", "extracting"), ("d", "done")]:
+        store.create(job_id, {}, state=state)
+    monkeypatch.setattr(main, "store", store)
+
+    main.recover_jobs()
+
+    assert {j: store.get(j)["state"] for j in "qrxd"} == {
+        "q": "failed", "r": "failed", "x": "extract_failed", "d": "done"
+    }
+    assert "restart" in store.get("q")["result"]["error"]
+
+
+def test_published_findings_survive_a_restart_while_reporting(monkeypatch, tmp_path):
+    from gateway.job_store import JobStore
+
+    store = JobStore(tmp_path / "jobs.db")
+    out = tmp_path / "out"
+    out.mkdir()
+    store.create("j", {"out": str(out)}, state="uploaded")
+    result = {
+        "job_id": "j",
+        "state": "reporting",
+        "impression": "lesion",
+        "findings": ["enhancing lesion"],
+        "downloads": {"dicom_sr": main.PENDING, "dicom_seg": main.PENDING, "json": "/download/json/j.json"},
+        "timings": {"agent": 1.5},
+    }
+    store.set_result("j", result, state="reporting")
+    monkeypatch.setattr(main, "store", store)
+
+    main.recover_jobs()
+
+    job = store.get("j")
+    assert job["state"] == "failed"
+    assert job["result"]["impression"] == "lesion" and job["result"]["findings"] == ["enhancing lesion"]
+    assert job["result"]["downloads"] == {"dicom_sr": None, "dicom_seg": None, "json": "/download/json/j.json"}
+    assert job["result"]["error"] == "interrupted by a gateway restart"
+    assert job["result"]["timings"] == {"agent": 1.5}
+    assert (out / "j.json").exists()
+
+
+def test_queued_jobs_are_failed_on_shutdown(monkeypatch):
+    monkeypatch.setattr(main.jobs, "stop", lambda: ["dropped"])
+    failed = []
+    monkeypatch.setattr(main, "_fail", lambda job_id, error: failed.append(job_id))
+    monkeypatch.setattr(main.retention, "stop", lambda: None)
+
+    main.stop_workers()
+
+    assert failed == ["dropped"]
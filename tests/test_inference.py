@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import torch
+
+from experts.inference import InferenceConfig, run_sliding_window, run_tiled
+
+
+def test_options_override_defaults():
+    config = InferenceConfig(sw_batch_size=1).with_options({"sw_batch_size": 8, "mode": "gaussian"})
+    assert config.sw_batch_size == 8
+    assert config.mode == "gaussian"
+
+
+@pytest.mark.parametrize("options", [{"overlap": 1.5}, {"mode": "max"}, {"threads": 4}])
+def test_invalid_options_rejected(options):
+    with pytest.raises(ValueError):
+        InferenceConfig().with_options(options)
+
+
+def test_window_batch_size_does_not_change_result():
+    torch.manual_seed(0)
+    model = torch.nn.Conv3d(2, 3, 3, padding=1).eval()
+    data = torch.rand(1, 2, 20, 20, 12)
+
+    one = run_sliding_window(model, data, (8, 8, 8), InferenceConfig(sw_batch_size=1))
+    many = run_sliding_window(model, data, (8, 8, 8), InferenceConfig(sw_batch_size=16))
+
+    assert one.shape == (1, 3, 20, 20, 12)
+    torch.testing.assert_close(one, many)
+
+
+@pytest.mark.parametrize("tile_size", [5, 8, 64])
+def test_tiled_labels_match_whole_volume(tmp_path, tile_size):
+    torch.manual_seed(0)
+    # voxel-wise, so window placement cannot change the result
+    model = torch.nn.Conv3d(2, 3, 1).eval()
+    data = torch.rand(1, 2, 13, 11, 9)
+    config = InferenceConfig(sw_batch_size=2, overlap=0.5, tile_size=tile_size)
+    whole = torch.argmax(run_sliding_window(model, data, (6, 6, 6), config), dim=1)[0]
+    out = np.lib.format.open_memmap(tmp_path / "mask.npy", mode="w+", dtype=np.uint8, shape=(13, 11, 9))
+
+    run_tiled(model, data, (6, 6, 6), out, config)
+
+    np.testing.assert_array_equal(out, whole.numpy())
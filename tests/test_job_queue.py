@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from gateway.job_queue import JobQueue, QueueFull, parse_limits
+
+
+def _wait(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not pred():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_higher_priority_runs_first():
+    q = JobQueue(workers=1)
+    gate = threading.Event()
+    order = []
+    q.submit("blocker", gate.wait)
+    _wait(lambda: q.stats()["normal"]["running"] == 1)
+    q.submit("low", lambda: order.append("low"), priority="low")
+    q.submit("normal", lambda: order.append("normal"))
+    q.submit("high", lambda: order.append("high"), priority="high")
+
+    gate.set()
+    _wait(lambda: len(order) == 3)
+    q.stop()
+
+    assert order == ["high", "normal", "low"]
+
+
+def test_priority_limit_leaves_workers_for_others():
+    q = JobQueue(workers=2, limits=parse_limits("low=1"))
+    gate = threading.Event()
+    done = []
+    q.submit("low-1", gate.wait, priority="low")
+    q.submit("low-2", lambda: done.append("low-2"), priority="low")
+    _wait(lambda: q.stats()["low"]["running"] == 1)
+    q.submit("normal", lambda: done.append("normal"))
+
+    _wait(lambda: done == ["normal"])
+    assert q.stats()["low"] == {"queued": 1, "running": 1, "limit": 1}
+    gate.set()
+    _wait(lambda: "low-2" in done)
+    q.stop()
+
+
+def test_failing_job_does_not_kill_worker():
+    q = JobQueue(workers=1)
+    done = []
+    q.submit("bad", lambda: 1 / 0)
+    q.submit("good", lambda: done.append(True))
+    _wait(lambda: done)
+    q.stop()
+
+
+def test_backlog_beyond_max_queued_is_refused():
+    q = JobQueue(workers=1, max_queued=1)
+    gate = threading.Event()
+    q.submit("running", gate.wait)
+    _wait(lambda: q.stats()["normal"]["running"] == 1)
+    q.submit("waiting", lambda: None)
+
+    with pytest.raises(QueueFull) as e:
+        q.submit("refused", lambda: None, priority="high")
+    assert e.value.retry_after >= 1
+
+    gate.set()
+    _wait(lambda: q.stats()["normal"]["queued"] == 0)
+    q.submit("accepted", lambda: None)
+    q.stop()
+
+
+def test_stop_returns_the_dropped_jobs():
+    q = JobQueue(workers=1)
+    gate = threading.Event()
+    ran = []
+    q.submit("running", gate.wait)
+    _wait(lambda: q.stats()["normal"]["running"] == 1)
+    q.submit("low", lambda: ran.append("low"), priority="low")
+    q.submit("high", lambda: ran.append("high"), priority="high")
+
+    gate.set()
+    dropped = q.stop()
+
+    assert dropped == ["high", "low"] and not ran
+    assert all(s["queued"] == 0 for s in q.stats().values())
@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+from gateway.job_store import JobStore
+from gateway.retention import prune_jobs
+
+
+def test_wal_mode_and_per_thread_connections(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.create("a", {"dicom": "x"})
+    seen = []
+
+    def worker():
+        seen.append((store.get("a")["state"], id(store._conn)))
+
+    t = threading.Thread(target=worker)
+    t.start()
+    t.join()
+
+    assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert seen[0][0] == "uploaded"
+    assert seen[0][1] != id(store._conn)
+
+
+def test_stage_and_timestamps(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.create("a", {})
+    created = store.get("a")["created_at"]
+
+    store.update_state("a", "running", stage="agent")
+    job = store.get("a")
+    assert (job["state"], job["stage"]) == ("running", "agent")
+    assert job["updated_at"] >= created
+
+    store.set_result("a", {"ok": True})
+    assert store.get("a")["stage"] is None
+
+
+def test_list_pages_newest_first(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    for i in range(5):
+        store.create(f"job{i}", {}, state="done" if i % 2 else "uploaded")
+
+    first = store.list(limit=2)
+    second = store.list(limit=2, offset=2)
+
+    assert [j["job_id"] for j in first + second] == ["job4", "job3", "job2", "job1"]
+    assert [j["job_id"] for j in store.list(state="done")] == ["job3", "job1"]
+
+
+def test_existing_database_is_migrated(tmp_path):
+    db = tmp_path / "jobs.db"
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, state TEXT, paths TEXT, result TEXT)")
+    conn.execute("INSERT INTO jobs VALUES ('old', 'done', '{}', NULL)")
+    conn.commit()
+    conn.close()
+
+    job = JobStore(db).get("old")
+
+    assert job["state"] == "done"
+    assert job["created_at"] is not None
+
+
+def test_prune_removes_stale_jobs_and_files(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    for job_id, state in (("done", "done"), ("never-analysed", "uploaded"), ("stuck", "running"), ("busy", "running")):
+        job = tmp_path / job_id
+        paths = {k: str(job / k) for k in ("dicom", "work", "out")}
+        for p in paths.values():
+            Path(p).mkdir(parents=True)
+        store.create(job_id, paths, state=state)
+    now = store.get("busy")["updated_at"] + 3600
+    # still making progress
+    store._conn.execute("UPDATE jobs SET updated_at=? WHERE id='busy'", (now - 1,))
+    store._conn.commit()
+
+    pruned = prune_jobs(store, max_age_s=60, now=now)
+
+    assert sorted(pruned) == ["done", "never-analysed", "stuck"]
+    for job_id in pruned:
+        assert store.get(job_id) is None and not (tmp_path / job_id).exists()
+    assert store.get("busy") is not None and (tmp_path / "busy").exists()
+
+
+def test_instances_are_grouped_by_series(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.create("j", {})
+    records = [
+        {"path": f"{s}/IM{i}", "series_uid": s, "modality": "MR", "series_description": s.upper(), "rows": 4}
+        for s, n in (("t1", 3), ("flair", 2))
+        for i in range(n)
+    ]
+    store.add_instances("j", records)
+
+    assert store.series("j") == [
+        {"series_uid": "t1", "modality": "MR", "description": "T1", "instances": 3},
+        {"series_uid": "flair", "modality": "MR", "description": "FLAIR", "instances": 2},
+    ]
+    assert [r["path"] for r in store.instances("j", series_uid="flair")] == ["flair/IM0", "flair/IM1"]
+    assert len(store.instances("j")) == 5
+
+
+def test_create_dedupes_by_content_hash(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+
+    assert store.create("a", {}, content_hash="h") == "a"
+    assert store.create("b", {}, content_hash="h") == "a"
+    assert store.get("b") is None
+    store.update_state("a", "extract_failed")
+    assert store.create("c", {}, content_hash="h") == "c"
+    assert store.find_by_hash("h") == "c"
+
+
+def test_transition_only_from_expected_states(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.create("a", {})
+
+    assert store.transition("a", "queued", from_states=("uploaded",))
+    assert not store.transition("a", "queued", from_states=("uploaded",))
+    assert store.get("a")["state"] == "queued"
@@ -0,0 +1,33 @@
+import numpy as np
+from scipy.ndimage import label
+
+from experts.lesion_stats import lesion_stats
+
+
+def test_per_lesion_table_matches_brute_force():
+    mask = np.zeros((20, 30, 40), dtype=np.uint8)
+    mask[2:6, 3:7, 4:8] = 2          # 64 voxels edema...
+    mask[3:5, 4:6, 5:7] = 3          # ...with an 8 voxel enhancing core
+    mask[10:12, 20:23, 30:31] = 1    # 6 voxel necrosis
+    spacing = (1.0, 1.0, 2.0)
+
+    stats = lesion_stats(mask, spacing)
+
+    labeled, n = label(mask > 0)
+    assert stats["num_lesions"] == n == 2
+    assert np.isclose(stats["lesion_volume_cc"], (mask > 0).sum() * 0.002)
+    assert stats["class_volumes_cc"] == {"necrosis": 0.012, "edema": 0.112, "enhancing": 0.016}
+    big, small = stats["lesions"]
+    assert big["voxels"] == 64 and small["voxels"] == 6
+    assert big["bbox"] == [[2, 6], [3, 7], [4, 8]]
+    assert big["centroid"] == [3.5, 4.5, 5.5]
+    assert big["class_volumes_cc"] == {"edema": 0.112, "enhancing": 0.016}
+    assert small["bbox"] == [[10, 12], [20, 23], [30, 31]]
+    assert small["centroid"] == [10.5, 21.0, 30.0]
+
+
+def test_empty_mask():
+    stats = lesion_stats(np.zeros((4, 4, 4), dtype=np.uint8), (1, 1, 1))
+    assert stats["num_lesions"] == 0
+    assert stats["lesion_volume_cc"] == 0.0
+    assert stats["lesions"] == []
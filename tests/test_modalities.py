@@ -0,0 +1,76 @@
+import numpy as np
+import pydicom
+import pytest
+
+from common.study_index import build_index, index_path
+from experts.inference import run_sliding_window
+from experts.modalities import assemble, classify
+
+
+@pytest.mark.parametrize(
+    "description, channel",
+    [
+        ("AX T2 FLAIR", "flair"),
+        ("T1 MPRAGE POST GD", "t1c"),
+        ("ax t1 +c", "t1c"),
+        ("Sag T1 MPRAGE", "t1"),
+        ("AX T2 TSE", "t2"),
+        ("localizer", None),
+    ],
+)
+def test_series_classified_by_description(description, channel):
+    assert classify({"modality": "MR", "series_description": description}) == channel
+
+
+def test_single_series_is_expanded_without_copies(tmp_path, dicom_series):
+    pixels = np.arange(4 * 3 * 3, dtype=np.uint16).reshape(4, 3, 3)
+    dicom_series(tmp_path, pixels)
+
+    inputs = assemble(str(tmp_path), channels=("t1c", "t1", "t2", "flair"))
+    data = inputs.tensor()
+
+    assert data.shape == (1, 4, 4, 3, 3) and data.stride(1) == 0
+    assert inputs.substituted == ("t1c", "t1", "t2", "flair")
+    assert inputs.memory() == {"input_bytes": pixels.size * 4, "replicated_bytes": pixels.size * 16}
+    np.testing.assert_array_equal(data[0, 3].numpy(), pixels)
+
+
+def test_series_mapped_to_channels_and_resampled(tmp_path, dicom_series):
+    dcm = tmp_path / "job" / "dicom"
+    t1 = np.full((4, 4, 4), 1, dtype=np.uint16)
+    flair = np.full((2, 4, 4), 7, dtype=np.uint16)
+    dicom_series(dcm / "t1", t1, SeriesDescription="Sag T1 MPRAGE")
+    dicom_series(dcm / "flair", flair, spacing=(1.0, 1.0, 4.0), SeriesDescription="AX T2 FLAIR")
+    build_index(dcm).save(index_path(dcm))
+
+    inputs = assemble(str(dcm), channels=("t1c", "t1", "t2", "flair"))
+
+    assert inputs.volumes.shape == (2, 4, 4, 4)
+    assert inputs.index == (0, 0, 1, 1) and inputs.substituted == ("t1c", "t2")
+    np.testing.assert_allclose(inputs.spacing, [1.0, 1.0, 2.0])
+    # windows are gathered to the four channels the network expects
+    out = run_sliding_window(inputs.wrap(lambda w: w), inputs.tensor(), (2, 2, 2))
+    assert out.shape == (1, 4, 4, 4, 4)
+    assert out[0, :, 0, 0, 0].tolist() == [1.0, 1.0, 7.0, 7.0]
+
+
+def test_missing_study_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        assemble(str(tmp_path))
+
+
+def test_input_key_differs_between_studies_with_the_same_file_names(tmp_path, dicom_series):
+    pixels = np.zeros((3, 4, 4), dtype=np.uint16)
+    # identical relative paths and instance UIDs in two studies
+    uids = [f"1.2.3.{i}" for i in range(3)]
+    for study in ("a", "b"):
+        for i, path in enumerate(dicom_series(tmp_path / study, pixels)):
+            ds = pydicom.dcmread(path)
+            ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID = uids[i]
+            ds.save_as(path)
+
+    a = assemble(str(tmp_path / "a"))
+    b = assemble(str(tmp_path / "b"))
+
+    assert a.key and b.key and a.key != b.key
+    assert assemble(str(tmp_path / "a")).key == a.key
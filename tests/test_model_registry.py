@@ -0,0 +1,55 @@
+import torch
+
+from experts.model_registry import ModelRegistry, model_nbytes
+
+
+def _loader(calls, size=4):
+    def load():
+        calls.append(size)
+        return torch.nn.Linear(size, size), {"roi_size": (8, 8, 8)}
+    return load
+
+
+def test_get_loads_once_and_counts_hits():
+    calls = []
+    reg = ModelRegistry(max_bytes=10**6, device=torch.device("cpu"))
+    reg.register("brats", _loader(calls))
+
+    first = reg.get("brats")
+    second = reg.get("brats")
+
+    assert first is second
+    assert calls == [4]
+    assert not first.network.training
+    assert first.config["roi_size"] == (8, 8, 8)
+    stats = reg.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["models"]["brats"]["load_time_s"] >= 0
+
+
+def test_lru_eviction_under_memory_cap():
+    one = model_nbytes(torch.nn.Linear(4, 4))
+    reg = ModelRegistry(max_bytes=2 * one, device=torch.device("cpu"))
+    calls = []
+    for name in ("a", "b", "c"):
+        reg.register(name, _loader(calls))
+
+    reg.get("a")
+    reg.get("b")
+    reg.get("a")  # "b" is now least recently used
+    reg.get("c")
+
+    assert set(reg.stats()["models"]) == {"a", "c"}
+    assert reg.stats()["evictions"] == 1
+
+
+def test_torchscript_models_are_frozen():
+    def load():
+        return torch.jit.script(torch.nn.Sequential(torch.nn.Linear(2, 2), torch.nn.ReLU())), {}
+
+    reg = ModelRegistry(max_bytes=10**6, device=torch.device("cpu"))
+    reg.register("ts", load)
+    net = reg.get("ts").network
+
+    assert isinstance(net, torch.jit.ScriptModule)
+    assert net(torch.ones(1, 2)).shape == (1, 2)
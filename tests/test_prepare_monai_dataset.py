@@ -1,5 +1,6 @@
 from pathlib import Path
 import importlib
+import json
 import sys
 
 
@@ -12,13 +13,24 @@ def test_main_creates_nifti_and_counts(tmp_path, monkeypatch, capsys):
 
         def __iter__(self):
             for item in self.data:
-                self.transform(item)
-                yield item
+                yield self.transform(item)
+
+    class Image(str):
+        meta = {}
+
+    def save_imaged(keys, output_dir, output_ext, resample, savepath_in_metadict):
+        def save(item):
+            out = Path(output_dir) / (Path(item["image"]).name + output_ext)
+            out.write_text("volume")
+            image = Image(item["image"])
+            image.meta = {"saved_to": str(out)}
+            return {"image": image}
+        return save
 
     transforms_module = type("T", (), {
-        "Compose": lambda transforms: lambda x: x,
+        "Compose": lambda transforms: transforms[-1],
         "LoadImaged": lambda keys: lambda x: x,
-        "SaveImaged": lambda keys, output_dir, output_ext, resample: lambda x: x,
+        "SaveImaged": save_imaged,
     })
     data_module = type("D", (), {"Dataset": DummyDataset})
 
@@ -42,3 +54,58 @@ def test_main_creates_nifti_and_counts(tmp_path, monkeypatch, capsys):
     out = capsys.readouterr().out
     assert "Converted 2 files" in out
     assert Path("data/nifti").exists()
+
+    # unchanged sources are skipped on the next run
+    pmd.main()
+    assert "Converted 0 files in 0 series" in capsys.readouterr().out
+    (raw_dir / "case2" / "case2").write_text("changed")
+    pmd.main()
+    assert "Converted 1 files in 1 series" in capsys.readouterr().out
+    # deleted outputs are converted again
+    Path("data/nifti/case1.nii.gz").unlink()
+    pmd.main()
+    assert "Converted 1 files in 1 series" in capsys.readouterr().out
+
+
+def test_manifest_keeps_progress_of_an_interrupted_run(tmp_path, monkeypatch):
+    import prepare_monai_dataset as pmd
+
+    raw, nifti = tmp_path / "raw", tmp_path / "nifti"
+    raw.mkdir()
+    for name in ("a", "b", "c"):
+        (raw / name).write_text(name)
+    monkeypatch.setattr(pmd, "MANIFEST_EVERY", 1)
+    converted = []
+
+    def convert(image, nifti_dir):
+        if len(converted) == 2:
+            raise KeyboardInterrupt
+        out = Path(nifti_dir) / f"{Path(image).name}.nii.gz"
+        out.write_text("volume")
+        converted.append(image)
+        return [str(out)]
+
+    monkeypatch.setattr(pmd, "_convert", convert)
+    try:
+        pmd.main(str(raw), str(nifti))
+    except KeyboardInterrupt:
+        pass
+
+    manifest = json.loads((nifti / pmd.MANIFEST_NAME).read_text())
+    assert len(manifest) == 2
+    assert all((nifti / entry["outputs"][0]).exists() for entry in manifest.values())
+
+
+def test_group_series_groups_instances_by_series_uid(tmp_path, dicom_series):
+    import numpy as np
+    import prepare_monai_dataset as pmd
+
+    pixels = np.zeros((3, 2, 2), dtype=np.uint16)
+    dicom_series(tmp_path / "raw", pixels, SeriesInstanceUID="1.2.3")
+    dicom_series(tmp_path / "raw" / "other", pixels[:2], SeriesInstanceUID="1.2.4")
+    (tmp_path / "raw" / "junk").write_text("not dicom")
+
+    series = pmd.group_series(pmd._instance_files(tmp_path / "raw"))
+
+    assert sorted(len(v) for v in series.values()) == [1, 2, 3]
+    assert set(series) == {"1.2.3", "1.2.4", f"file:{tmp_path / 'raw' / 'junk'}"}
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from experts import volume_cache as vc
+from experts.modalities import AssembledInput
+from experts.preprocess import preprocess
+
+
+def _inputs(volumes, spacing=(1.0, 1.0, 2.0), key="study"):
+    return AssembledInput(
+        volumes=volumes,
+        index=(0,) * 4,
+        affine=np.diag([*spacing, 1.0]),
+        spacing=np.asarray(spacing, dtype=np.float32),
+        sources={},
+        substituted=(),
+        key=key,
+    )
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = vc.VolumeCache(tmp_path / "cache", max_bytes=1 << 30)
+    monkeypatch.setattr(vc, "volume_cache", cache)
+    return cache
+
+
+def test_crop_resample_normalize_and_restore(cache):
+    volume = np.zeros((1, 20, 32, 32), dtype=np.float32)
+    volume[0, 5:10, 8:16, 10:22] = np.linspace(100, 300, 12, dtype=np.float32)
+
+    prepped, info = preprocess(_inputs(volume), roi_size=(8, 8, 8), overlap=0.25, spacing=(1.0, 1.0, 1.0))
+
+    # 4 voxels of margin; slices are 2 mm apart and resampled to 1 mm
+    assert info.bbox == ((1, 14), (4, 20), (6, 26))
+    assert prepped.volumes.shape == (1, 26, 16, 20)
+    assert info.windows_after < info.windows_before
+    foreground = prepped.volumes[prepped.volumes != 0]
+    assert abs(foreground.mean()) < 1e-4 and abs(foreground.std() - 1) < 1e-2
+    np.testing.assert_array_equal(prepped.affine, np.diag([1.0, 1.0, 2.0, 1.0]))
+
+    restored = info.restore((prepped.volumes[0] != 0).astype(np.uint8))
+    assert restored.shape == (20, 32, 32)
+    # back on the original grid, up to the voxel blurred by interpolation
+    assert restored[5:10, 8:16, 10:22].all()
+    assert not restored[:4].any() and not restored[11:].any()
+
+
+def test_output_cached_per_input(cache):
+    volume = np.zeros((1, 12, 16, 16), dtype=np.float32)
+    volume[0, 4:8, 4:12, 4:12] = 50
+
+    first, info = preprocess(_inputs(volume), roi_size=(8, 8, 8), overlap=0.25)
+    again, again_info = preprocess(_inputs(volume), roi_size=(8, 8, 8), overlap=0.25)
+    other, other_info = preprocess(_inputs(volume, key="other"), roi_size=(8, 8, 8), overlap=0.25)
+
+    assert not info.cached and again_info.cached and not other_info.cached
+    assert again_info.bbox == info.bbox
+    np.testing.assert_array_equal(again.volumes, first.volumes)
+    assert cache.stats()["entries"] == 2
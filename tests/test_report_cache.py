@@ -0,0 +1,43 @@
+from agent import server
+from agent.report_cache import ReportCache, report_key
+
+
+def test_report_key_normalizes_evidence():
+    a = report_key("brain", {"lesion_volume_cc": 0.01, "num_lesions": 0}, {}, "v1")
+    b = report_key("brain", {"num_lesions": 0, "lesion_volume_cc": -0.02}, {}, "v1")
+    assert a == b
+    assert a != report_key("brain", {"lesion_volume_cc": 2.0, "num_lesions": 1}, {}, "v1")
+    assert a != report_key("brain", {"lesion_volume_cc": 0.01, "num_lesions": 0}, {}, "v2")
+    assert a != report_key("spine", {"lesion_volume_cc": 0.01, "num_lesions": 0}, {}, "v1")
+
+
+def test_report_cache_lru():
+    cache = ReportCache(2)
+    cache.put("a", ("A", 0.7))
+    cache.put("b", ("B", 0.7))
+    assert cache.get("a") == ("A", 0.7)
+    cache.put("c", ("C", 0.7))
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.stats()["entries"] == 2
+
+
+def test_generate_report_skips_cached_evidence(monkeypatch):
+    prompts = []
+
+    class Model:
+        def generate(self, prompt):
+            prompts.append(prompt)
+            return "- finding"
+
+    monkeypatch.setattr(server, "report_cache", ReportCache(8))
+    normal = ("brain", {"lesion_volume_cc": 0.0, "num_lesions": 0}, {})
+    lesion = ("brain", {"lesion_volume_cc": 3.2, "num_lesions": 1}, {})
+
+    assert server.generate_report(Model(), *normal) == ("- finding", 0.75, False)
+    assert server.generate_report(Model(), *lesion)[2] is False
+    assert len(prompts) == 2
+
+    again = server.generate_report(Model(), "brain", {"lesion_volume_cc": 0.01, "num_lesions": 0}, {})
+    assert again == ("- finding", 0.75, True)
+    assert len(prompts) == 2
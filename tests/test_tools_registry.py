@@ -0,0 +1,49 @@
+import time
+
+import pytest
+import requests
+
+from agent import tools_registry
+
+
+class _Resp:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+def test_run_tools_overlaps_calls(monkeypatch):
+    def post(url, json, timeout, headers=None):
+        time.sleep(0.2)
+        return _Resp({"url": url})
+
+    monkeypatch.setattr(tools_registry.client.session, "post", post)
+
+    start = time.perf_counter()
+    outputs, latencies = tools_registry.run_tools(["brats", "wmh"], {"study_dir": "x"})
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.35
+    assert outputs["brats"]["url"].endswith("/infer/brats")
+    assert outputs["wmh"]["url"].endswith("/infer/wmh")
+    assert all(lat >= 0.2 for lat in latencies.values())
+
+
+def test_run_tools_raises_first_failure(monkeypatch):
+    def post(url, json, timeout, headers=None):
+        if url.endswith("/infer/wmh"):
+            raise requests.ConnectionError("down")
+        time.sleep(0.05)
+        return _Resp({})
+
+    monkeypatch.setattr(tools_registry.client.session, "post", post)
+
+    with pytest.raises(requests.ConnectionError):
+        tools_registry.run_tools(["brats", "wmh"], {"study_dir": "x"})
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from common import tracing
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = tracing.Histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    h.observe(0.05, stage="a")
+    h.observe(0.5, stage="a")
+    h.observe(5.0, stage="a")
+
+    lines = h.render()
+    assert 't_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 't_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 't_seconds_count{stage="a"} 3' in lines
+
+
+def test_spans_follow_work_submitted_to_pools():
+    def work():
+        with tracing.span("inner"):
+            return tracing.get_request_id()
+
+    with tracing.bind_request_id("req-1"), tracing.record_spans() as timings:
+        with tracing.span("outer"), ThreadPoolExecutor(2) as pool:
+            ids = [tracing.submit_with_context(pool, work).result() for _ in range(2)]
+
+    assert ids == ["req-1", "req-1"]
+    assert set(timings) == {"outer", "inner"}
+    assert timings["outer"] >= timings["inner"] > 0
+
+
+def test_instrument_propagates_request_id_and_serves_metrics():
+    app = FastAPI()
+    tracing.instrument(app)
+
+    @app.get("/items/{item_id}")
+    def item(item_id: str):
+        return {"request_id": tracing.get_request_id(), "headers": tracing.propagation_headers()}
+
+    client = TestClient(app)
+    r = client.get("/items/1", headers={"X-Request-ID": "abc"})
+    assert r.headers["X-Request-ID"] == "abc"
+    assert r.json() == {"request_id": "abc", "headers": {"X-Request-ID": "abc"}}
+    assert len(client.get("/items/2").headers["X-Request-ID"]) == 32
+
+    body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}",status="200"} 2' in body
+    assert "# TYPE http_requests_in_flight gauge" in body
@@ -15,3 +15,4 @@ def test_run_vlm_generate(monkeypatch):
     text, prob = vila_loader.run_vlm(Dummy(), "hi")
     assert text == "gen:hi"
     assert prob == 0.75
+
@@ -0,0 +1,59 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from experts.volume_cache import VolumeCache, series_key
+
+
+def test_second_load_is_a_memory_mapped_hit(tmp_path, dicom_series):
+    pixels = np.arange(3 * 4 * 4, dtype=np.uint16).reshape(3, 4, 4)
+    dicom_series(tmp_path / "study", pixels)
+    cache = VolumeCache(tmp_path / "cache", max_bytes=10**6)
+
+    first, _, spacing = cache.load(str(tmp_path / "study"))
+    second, affine, _ = cache.load(str(tmp_path / "study"))
+
+    assert isinstance(second, np.memmap)
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_array_equal(second, pixels.astype(np.float32))
+    assert affine.shape == (4, 4) and spacing.shape == (3,)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    volume = np.zeros((4, 16, 16), dtype=np.float32)
+    cache = VolumeCache(tmp_path, max_bytes=int(volume.nbytes * 2.5))
+
+    cache.put("a", volume, np.eye(4), np.ones(3))
+    cache.put("b", volume, np.eye(4), np.ones(3))
+    # make "a" the oldest entry regardless of filesystem timestamp resolution
+    os.utime(tmp_path / "a", (0, 0))
+    cache.put("c", volume, np.eye(4), np.ones(3))
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_calls_loader(tmp_path):
+    calls = []
+    cache = VolumeCache(tmp_path, max_bytes=0)
+    cache.load("study", lambda d: calls.append(d) or (np.zeros(1), np.eye(4), np.ones(3)))
+    assert calls == ["study"]
+
+
+def test_key_changes_with_the_files_not_their_names(tmp_path, dicom_series):
+    pixels = np.arange(3 * 4 * 4, dtype=np.uint16).reshape(3, 4, 4)
+    files_a = sorted(map(Path, dicom_series(tmp_path / "a", pixels)))
+    files_b = sorted(map(Path, dicom_series(tmp_path / "b", pixels)))
+    key = series_key(files_a)
+
+    assert series_key(files_a) == key
+    # the same file names in another study
+    assert series_key(files_b) != key
+    # a file rewritten in place
+    st = files_a[0].stat()
+    os.utime(files_a[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert series_key(files_a) != key